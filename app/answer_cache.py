@@ -0,0 +1,143 @@
+# ======================================================
+#                   answer_cache.py
+#        SEMANTIC ANSWER CACHE (EMBEDDING + CHUNK IDS)
+# ======================================================
+#
+# A cached answer is reused when:
+#   - the new query retrieved exactly the same top-k chunk IDs,
+#   - its prompt had the same extra context (the conversation memory
+#     block, see fingerprint()), so one chat's history never shapes
+#     another chat's answer, and
+#   - its embedding is within `threshold` cosine of the cached query.
+#
+# Entries expire after `ttl` seconds, the least recently used are
+# evicted past `max_entries`, and the whole cache is dropped when
+# version_fn() changes (i.e. the index was re-ingested).
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def file_version(path):
+    """Cheap fingerprint of a file that changes whenever it is rewritten."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def fingerprint(text):
+    """Short stable key for prompt context; "" for none (first turns share answers)."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest() if text else ""
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold=0.95, ttl=3600, max_entries=1000, version_fn=None):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version_fn = version_fn
+
+        # entry_id -> (key, unit vector, answer, created_at); LRU order
+        self._entries = OrderedDict()
+        # (chunk ids, context) -> set of entry_ids sharing that key
+        self._buckets = {}
+        self._next_id = 0
+        self._version = version_fn() if version_fn else None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    # ------------------------------
+    # Public API
+    # ------------------------------
+    def lookup(self, embedding, chunk_ids, context=""):
+        """context: fingerprint() of whatever else went into the prompt."""
+        if embedding is None:
+            return None  # lexical-only retrieval: nothing to compare against
+        key = (tuple(chunk_ids), context)
+        now = time.time()
+
+        with self._lock:
+            self._check_version()
+
+            ids = list(self._buckets.get(key, ()))
+            for entry_id in ids:
+                if now - self._entries[entry_id][3] > self.ttl:
+                    self._remove(entry_id)
+            ids = list(self._buckets.get(key, ()))
+
+            if ids:
+                q = _unit(embedding)
+                sims = np.stack([self._entries[i][1] for i in ids]) @ q
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    entry_id = ids[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return self._entries[entry_id][2]
+
+            self.misses += 1
+            return None
+
+    def store(self, embedding, chunk_ids, answer, context=""):
+        if embedding is None:
+            return
+        key = (tuple(chunk_ids), context)
+
+        with self._lock:
+            self._check_version()
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (key, _unit(embedding), answer, time.time())
+            self._buckets.setdefault(key, set()).add(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
+
+    # ------------------------------
+    # Internals (caller holds the lock)
+    # ------------------------------
+    def _check_version(self):
+        if self.version_fn is None:
+            return
+        version = self.version_fn()
+        if version != self._version:
+            self._version = version
+            self._entries.clear()
+            self._buckets.clear()
+
+    def _remove(self, entry_id):
+        key = self._entries.pop(entry_id)[0]
+        bucket = self._buckets[key]
+        bucket.discard(entry_id)
+        if not bucket:
+            del self._buckets[key]
+
+
+def _unit(vector):
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
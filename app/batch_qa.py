@@ -0,0 +1,246 @@
+# ======================================================
+#                     batch_qa.py
+#      OFFLINE BATCH QUESTION ANSWERING (JSONL -> JSONL)
+# ======================================================
+#
+# Answers many questions with the same router, prompts, caches and
+# models as the chat apps, each question as the first turn of a new
+# chat (no conversation memory):
+#   1) questions are read from JSONL and de-duplicated (case/whitespace)
+#   2) their embeddings are fetched in large batched requests and put in
+#      the embedding cache, so retrieval below never embeds one by one
+#   3) retrieval runs in a thread pool (--retrieval-workers)
+#   4) completions (and the search agent, unless --no-search) run in a
+#      bounded pool (--concurrency) under requests/min and tokens/min
+#      limits, one pair per model as OpenAI limits each model separately:
+#      --rpm/--tpm for embeddings, --rag-rpm/--rag-tpm for gpt-3.5-turbo
+#      and --agent-rpm/--agent-tpm for the gpt-4o-mini search agent
+#   5) each answer is appended to the output JSONL as soon as it is
+#      ready, once per input line, with per-item timings
+#
+# Input lines need a "question" (or "query") field; every other field
+# (e.g. "id") is copied to the output line.
+#
+# Usage:
+#   python app/batch_qa.py questions.jsonl answers.jsonl
+#   python app/batch_qa.py questions.jsonl answers.jsonl --concurrency 16 --rag-rpm 3000 --no-search
+
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import rag_agent
+from rag_agent import (
+    EMBEDDING_MODEL, EMBEDDING_TIMEOUT, REQUEST_BUDGET, NO_ANSWER, breakers,
+    get_embedding_cache, router, get_client, retrieve_matches, answer_from_matches,
+    agent_with_search, search_agent, is_degraded, upstream_errors,
+)
+from router import SEARCH
+from telemetry import trace, record_usage
+from resilience import call, request_budget
+from embedding_cache import normalize_query
+from ingest import RateLimiter, estimate_tokens
+
+BATCH_SESSION = "batch-qa"   # never written to, so every question starts a fresh chat
+ANSWER_TOKENS = 300          # completion allowance charged to the token bucket
+
+
+# ======================================================
+# INPUT
+# ======================================================
+def read_questions(path):
+    """Input records, and the unique questions in first-seen order."""
+    records, unique = [], {}
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            question = (record.get("question") or record.get("query") or "").strip()
+            if not question:
+                raise ValueError(f"{path}:{n}: no 'question' field")
+            record["question"] = question
+            records.append(record)
+            unique.setdefault(normalize_query(question), question)
+    return records, list(unique.values())
+
+
+# ======================================================
+# BATCHED EMBEDDINGS
+# ======================================================
+def embed_batched(questions, limiter, batch_size=100):
+    """Fill the embedding cache for all questions; returns the number of API calls."""
+    cache = get_embedding_cache()
+    missing = [q for q in questions if cache.get(q, EMBEDDING_MODEL) is None]
+    calls = 0
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        limiter.acquire(sum(estimate_tokens(q) for q in batch))
+        try:
+            response = call(
+                lambda timeout: get_client().embeddings.create(
+                    model=EMBEDDING_MODEL, input=batch, timeout=timeout
+                ),
+                EMBEDDING_TIMEOUT * 4, breakers["embedding"]
+            )
+        except upstream_errors():
+            continue  # these questions embed one by one (or go lexical) during retrieval
+        calls += 1
+        record_usage(EMBEDDING_MODEL, response.usage)
+        for question, item in zip(batch, response.data):
+            cache.put(question, EMBEDDING_MODEL, item.embedding)
+    return calls
+
+
+# ======================================================
+# ONE QUESTION
+# ======================================================
+def retrieve(question):
+    start = time.perf_counter()
+    with request_budget(REQUEST_BUDGET):
+        try:
+            query_embedding, matches = retrieve_matches(question)
+        except upstream_errors():
+            query_embedding, matches = None, None
+    return query_embedding, matches, time.perf_counter() - start
+
+
+def answer(question, query_embedding, matches, rag_limiter, agent_limiter, use_search):
+    """(answer, source) exactly as chat_turn would give on a first turn.
+
+    rag_limiter paces gpt-3.5-turbo, agent_limiter the search agent.
+    """
+    def agent_tokens():
+        return 2 * (estimate_tokens(question) + ANSWER_TOKENS)
+
+    def rag():
+        if matches is None:
+            return NO_ANSWER
+        context = " ".join(m.metadata["text_chunk"] for m in matches)
+        prompt_tokens = min(estimate_tokens(question + context), rag_agent.prompt_builder.total_budget)
+        rag_limiter.acquire(prompt_tokens + ANSWER_TOKENS)
+        return answer_from_matches(question, query_embedding, matches, BATCH_SESSION)
+
+    with trace() as t, request_budget(REQUEST_BUDGET):
+        if use_search and router.route(question, []) == SEARCH:
+            agent_limiter.acquire(agent_tokens())
+            final, source = search_agent(question, BATCH_SESSION), "SEARCH"
+            if final is None:
+                final = rag()
+                source = "RAG" if final.strip() != NO_ANSWER and not is_degraded(final) else "FALLBACK"
+        elif use_search:
+            rag_answer = rag()
+            if rag_answer.strip() == NO_ANSWER:  # only then does agent_with_search call the agent
+                agent_limiter.acquire(agent_tokens())
+            final, source = agent_with_search(question, rag_answer, BATCH_SESSION)
+        else:
+            final = rag()
+            source = "RAG" if final.strip() != NO_ANSWER and not is_degraded(final) else "FALLBACK"
+        t.route = source
+    return final, source
+
+
+# ======================================================
+# BATCH
+# ======================================================
+def run_batch(in_path, out_path, concurrency=8, retrieval_workers=16, rpm=3500, tpm=90000,
+              batch_size=100, use_search=True, rag_rpm=3500, rag_tpm=90000,
+              agent_rpm=3500, agent_tpm=90000):
+    """rpm/tpm limit the embedding model, rag_* gpt-3.5-turbo and agent_*
+    the search agent's model."""
+    records, questions = read_questions(in_path)
+    by_question = {}
+    for record in records:
+        by_question.setdefault(normalize_query(record["question"]), []).append(record)
+
+    limiter = RateLimiter(rpm, tpm)
+    rag_limiter = RateLimiter(rag_rpm, rag_tpm)
+    agent_limiter = RateLimiter(agent_rpm, agent_tpm)
+    started = time.perf_counter()
+
+    embed_start = time.perf_counter()
+    embedding_calls = embed_batched(questions, limiter, batch_size)
+    embed_seconds = time.perf_counter() - embed_start
+
+    write_lock = threading.Lock()
+    routes = {}
+
+    with open(out_path, "w", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=retrieval_workers) as retrieval_pool, \
+            ThreadPoolExecutor(max_workers=concurrency) as completion_pool:
+
+        def complete(question, retrieved):
+            query_embedding, matches, retrieval_seconds = retrieved
+            start = time.perf_counter()
+            final, source = answer(question, query_embedding, matches, rag_limiter, agent_limiter, use_search)
+            answer_seconds = time.perf_counter() - start
+
+            result = {
+                "answer": final,
+                "source": source,
+                "chunks": [
+                    {k: m.metadata.get(k) for k in ("video_title", "url", "start_time", "end_time")}
+                    for m in matches or []
+                ],
+                "timings_ms": {
+                    "retrieval": round(retrieval_seconds * 1000, 1),
+                    "answer": round(answer_seconds * 1000, 1),
+                    "since_start": round((time.perf_counter() - started) * 1000, 1),
+                },
+            }
+            with write_lock:
+                routes[source] = routes.get(source, 0) + 1
+                for record in by_question[normalize_query(question)]:
+                    out.write(json.dumps({**record, **result}, ensure_ascii=False) + "\n")
+                out.flush()
+
+        retrievals = {retrieval_pool.submit(retrieve, q): q for q in questions}
+        completions = [
+            completion_pool.submit(complete, retrievals[f], f.result()) for f in as_completed(retrievals)
+        ]
+        for f in completions:
+            f.result()
+
+    return {
+        "lines": len(records),
+        "unique_questions": len(questions),
+        "embedding_calls": embedding_calls,
+        "embedding_seconds": embed_seconds,
+        "seconds": time.perf_counter() - started,
+        "routes": routes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions with the RAG + agent pipeline.")
+    parser.add_argument("questions", help="input JSONL, one {\"question\": ...} per line")
+    parser.add_argument("answers", help="output JSONL (overwritten)")
+    parser.add_argument("--concurrency", type=int, default=8, help="completions in flight")
+    parser.add_argument("--retrieval-workers", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=100, help="questions per embeddings request")
+    parser.add_argument("--rpm", type=int, default=3500, help="embedding model requests per minute")
+    parser.add_argument("--tpm", type=int, default=90000, help="embedding model tokens per minute")
+    parser.add_argument("--rag-rpm", type=int, default=3500, help="RAG model requests per minute")
+    parser.add_argument("--rag-tpm", type=int, default=90000, help="RAG model tokens per minute")
+    parser.add_argument("--agent-rpm", type=int, default=3500, help="search agent model requests per minute")
+    parser.add_argument("--agent-tpm", type=int, default=90000, help="search agent model tokens per minute")
+    parser.add_argument("--no-search", action="store_true", help="RAG only, never call SerpAPI")
+    args = parser.parse_args()
+
+    rag_agent.warm_up()
+    stats = run_batch(
+        args.questions, args.answers, concurrency=args.concurrency,
+        retrieval_workers=args.retrieval_workers, rpm=args.rpm, tpm=args.tpm,
+        batch_size=args.batch_size, use_search=not args.no_search,
+        rag_rpm=args.rag_rpm, rag_tpm=args.rag_tpm, agent_rpm=args.agent_rpm, agent_tpm=args.agent_tpm,
+    )
+    print(f"{stats['lines']} lines, {stats['unique_questions']} unique questions, "
+          f"{stats['embedding_calls']} embedding calls ({stats['embedding_seconds']:.1f}s), "
+          f"{stats['seconds']:.1f}s total")
+    print("routes:", ", ".join(f"{k}={v}" for k, v in sorted(stats["routes"].items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# ======================================================
+#                     chunking.py
+#     SENTENCE-AWARE, OVERLAPPING TRANSCRIPT CHUNKING
+# ======================================================
+#
+# Alternative to transcripts.chunk_subtitles (fixed 300-word packing):
+#   1) subtitle entries -> sentences carrying start/end timestamps
+#      (nltk punkt when installed, a punctuation regex otherwise);
+#      unpunctuated auto-captions are cut at the longest pause
+#      between subtitle entries instead
+#   2) sentences -> windows of ~window_words, consecutive windows
+#      sharing ~overlap_words of whole sentences
+#   3) several granularities can be emitted for the same transcript
+#
+# Chunk records have the same keys (and content-hash IDs) as
+# chunk_subtitles, plus "granularity".
+
+import re
+
+from transcripts import chunk_id
+
+# name -> (window_words, overlap_words)
+GRANULARITIES = {
+    "fine": (120, 30),
+    "standard": (300, 60),
+    "coarse": (600, 100),
+}
+MAX_SENTENCE_WORDS = 40   # longer "sentences" are split at subtitle boundaries
+
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def _sentence_splitter():
+    try:
+        from nltk.tokenize import sent_tokenize
+        sent_tokenize("Punkt check. Done.")
+        return sent_tokenize
+    except (ImportError, LookupError):
+        return SENTENCE_END_RE.split
+
+
+def timestamp_seconds(ts):
+    if not ts:
+        return 0.0
+    h, m, s = ts.split(":")
+    return int(h) * 3600 + int(m) * 60 + float(s)
+
+
+# ======================================================
+# ENTRIES -> SENTENCES
+# ======================================================
+def _split_long(words, max_words):
+    """Cut a run of (word, start, end, entry) at the longest pauses between entries."""
+    parts = []
+    while len(words) > max_words:
+        best, best_gap = max_words, -1.0
+        for i in range(max_words // 2, max_words + 1):
+            prev, cur = words[i - 1], words[i]
+            if prev[3] != cur[3]:
+                gap = timestamp_seconds(cur[1]) - timestamp_seconds(prev[2])
+                if gap > best_gap:
+                    best, best_gap = i, gap
+        parts.append(words[:best])
+        words = words[best:]
+    parts.append(words)
+    return parts
+
+
+def iter_sentences(subtitles, max_sentence_words=MAX_SENTENCE_WORDS):
+    """Yield {"text", "start_time", "end_time", "words"} per sentence."""
+    words = []  # (word, start, end, entry number)
+    for n, entry in enumerate(subtitles):
+        for w in entry["text"].split():
+            words.append((w, entry["start_time"], entry["end_time"], n))
+    if not words:
+        return
+
+    split = _sentence_splitter()
+    offset = 0
+    for sentence in split(" ".join(w[0] for w in words)):
+        count = len(sentence.split())
+        if not count:
+            continue
+        for part in _split_long(words[offset:offset + count], max_sentence_words):
+            yield {
+                "text": " ".join(w[0] for w in part),
+                "start_time": part[0][1],
+                "end_time": part[-1][2],
+                "words": len(part),
+            }
+        offset += count
+
+
+# ======================================================
+# SENTENCES -> OVERLAPPING WINDOWS
+# ======================================================
+def window_chunks(sentences, video_title, url, window_words, overlap_words, granularity=None):
+    sentences = list(sentences)
+    chunks = []
+    start = 0
+
+    while start < len(sentences):
+        end, size = start, 0
+        while end < len(sentences) and (size == 0 or size + sentences[end]["words"] <= window_words):
+            size += sentences[end]["words"]
+            end += 1
+
+        window = sentences[start:end]
+        chunk = {
+            "video_title": video_title,
+            "url": url,
+            "text_chunk": " ".join(s["text"] for s in window),
+            "start_time": window[0]["start_time"],
+            "end_time": window[-1]["end_time"],
+        }
+        chunk["id"] = chunk_id(chunk)
+        if granularity:
+            chunk["granularity"] = granularity
+        chunks.append(chunk)
+
+        if end >= len(sentences):
+            break
+
+        # Next window repeats the trailing sentences covering overlap_words
+        back, carried = end, 0
+        while back > start + 1 and carried + sentences[back - 1]["words"] <= overlap_words:
+            back -= 1
+            carried += sentences[back]["words"]
+        start = back
+
+    return chunks
+
+
+def resolve_granularity(spec):
+    """"standard" / "200:40" / (200, 40) -> (name, window_words, overlap_words)."""
+    if isinstance(spec, str):
+        if spec in GRANULARITIES:
+            return (spec,) + GRANULARITIES[spec]
+        match = re.fullmatch(r"(\d+):(\d+)", spec)
+        if not match:
+            raise ValueError(f"Unknown granularity {spec!r} (use {', '.join(GRANULARITIES)} or WINDOW:OVERLAP)")
+        window_words, overlap_words = int(match.group(1)), int(match.group(2))
+    else:
+        window_words, overlap_words = spec
+    if overlap_words >= window_words:
+        raise ValueError("overlap must be smaller than the window")
+    return f"{window_words}:{overlap_words}", window_words, overlap_words
+
+
+def chunk_transcript(subtitles, video_title, url, granularities=("standard",),
+                     max_sentence_words=MAX_SENTENCE_WORDS):
+    """Chunks of every requested granularity; identical chunks are kept once."""
+    sentences = list(iter_sentences(subtitles, max_sentence_words))
+    chunks, seen = [], set()
+
+    for spec in granularities:
+        name, window_words, overlap_words = resolve_granularity(spec)
+        for chunk in window_chunks(sentences, video_title, url, window_words, overlap_words, name):
+            if chunk["id"] not in seen:
+                seen.add(chunk["id"])
+                chunks.append(chunk)
+
+    return chunks
@@ -0,0 +1,54 @@
+# ======================================================
+#                      clients.py
+#         LAZY, SHARED CLIENTS (FAST COLD START)
+# ======================================================
+#
+# @lazy turns a factory into a getter that builds its object on first
+# use and returns the same one afterwards:
+#
+#     @lazy
+#     def get_client():
+#         from openai import OpenAI
+#         return OpenAI(...)
+#
+# Heavy imports go inside the factory, so importing a module that
+# defines getters costs nothing until a request (or warm_up) needs them.
+
+import time
+import functools
+import threading
+
+
+def lazy(factory):
+    lock = threading.Lock()
+    box = []
+
+    @functools.wraps(factory)
+    def get():
+        if not box:
+            with lock:
+                if not box:
+                    box.append(factory())
+        return box[0]
+
+    get.loaded = lambda: bool(box)
+    get.reset = box.clear
+    return get
+
+
+def timed_steps(steps, on_error=()):
+    """Run (name, fn) steps in order; returns {name: seconds}.
+
+    Steps raising one of `on_error` are recorded as None instead of
+    stopping the rest (a warm-up must never keep the app from starting).
+    """
+    timings = {}
+    for name, fn in steps:
+        start = time.perf_counter()
+        try:
+            fn()
+        except on_error:
+            timings[name] = None
+            continue
+        timings[name] = time.perf_counter() - start
+    return timings
@@ -0,0 +1,128 @@
+# ======================================================
+#                 embedding_cache.py
+#      TWO-TIER QUERY EMBEDDING CACHE (MEMORY + SQLITE)
+# ======================================================
+#
+# Tier 1: in-process LRU, evicted by total vector bytes.
+# Tier 2: SQLite file holding float32 blobs, survives restarts.
+#
+# Keys are (model, normalised query text), so "What is Base?"
+# and "  what is   base? " share one entry.
+
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # ~10k embeddings of 1536 dims
+
+
+def normalize_query(text):
+    return " ".join(text.lower().split())
+
+
+class EmbeddingCache:
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL,"
+                " query TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, query))"
+            )
+            self._db.commit()
+
+    # ------------------------------
+    # Lookup / store
+    # ------------------------------
+    def get(self, text, model):
+        key = (model, normalize_query(text))
+
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector FROM embeddings WHERE model = ? AND query = ?", key
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, text, model, vector):
+        key = (model, normalize_query(text))
+        vector = np.asarray(vector, dtype=np.float32)
+
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (model, query, vector) VALUES (?, ?, ?)",
+                    (key[0], key[1], vector.tobytes()),
+                )
+                self._db.commit()
+
+    def get_or_create(self, text, model, embed_fn):
+        """Return the cached vector or call embed_fn(text) and cache it."""
+        vector = self.get(text, model)
+        if vector is None:
+            vector = np.asarray(embed_fn(text), dtype=np.float32)
+            self.put(text, model, vector)
+        return vector
+
+    def _remember(self, key, vector):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old.nbytes
+
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes
+
+        while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+
+    # ------------------------------
+    # Counters
+    # ------------------------------
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
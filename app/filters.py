@@ -0,0 +1,141 @@
+# ======================================================
+#                      filters.py
+#      METADATA FILTERS (VIDEO / URL / TIME RANGE SCOPES)
+# ======================================================
+#
+# The app describes a retrieval scope as a plain dict:
+#     {"video_title": "How to build a Web3 game on the Base blockchain",
+#      "url": "...", "start": 120, "end": 300}      # any subset; seconds
+#
+# and turns it into Pinecone's filter syntax, which every index here
+# understands:
+#   - Pinecone: video_title / url are pushed down as $eq / $in; the
+#     stored timestamps are strings, so a time range is applied to the
+#     returned matches instead (in_scope)
+#   - local, segment and BM25 indexes: video_title / url select
+#     per-video partitions (precomputed row lists), and the virtual
+#     numeric fields start_seconds / end_seconds filter those rows, so
+#     a scoped query only scores that video's vectors
+
+import operator
+
+import numpy as np
+
+from chunking import timestamp_seconds
+
+PARTITION_FIELDS = ("video_title", "url")
+TIME_FIELDS = ("start_seconds", "end_seconds")
+COMPARISONS = {"$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le}
+
+
+def build_filter(filters, time_fields=True):
+    """Pinecone-syntax filter for a scope dict, or None for no scope."""
+    clauses = []
+    for field in PARTITION_FIELDS:
+        value = (filters or {}).get(field)
+        if isinstance(value, (list, tuple, set)):
+            clauses.append({field: {"$in": sorted(value)}})
+        elif value:
+            clauses.append({field: {"$eq": value}})
+    if time_fields and filters:
+        if filters.get("start") is not None:
+            clauses.append({"end_seconds": {"$gte": float(filters["start"])}})
+        if filters.get("end") is not None:
+            clauses.append({"start_seconds": {"$lte": float(filters["end"])}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def has_time_range(filters):
+    return bool(filters) and (filters.get("start") is not None or filters.get("end") is not None)
+
+
+def in_scope(metadata, filters):
+    """Does one match's metadata fall inside the scope?"""
+    if not filters:
+        return True
+    for field in PARTITION_FIELDS:
+        value = filters.get(field)
+        if isinstance(value, (list, tuple, set)):
+            if metadata.get(field) not in value:
+                return False
+        elif value and metadata.get(field) != value:
+            return False
+    if filters.get("start") is not None and timestamp_seconds(metadata.get("end_time")) < filters["start"]:
+        return False
+    if filters.get("end") is not None and timestamp_seconds(metadata.get("start_time")) > filters["end"]:
+        return False
+    return True
+
+
+def conditions(filter):
+    """Flatten a Pinecone-syntax filter into (field, op, value) ($and only)."""
+    if not filter:
+        return []
+    out = []
+    for field, condition in filter.items():
+        if field == "$and":
+            for clause in condition:
+                out.extend(conditions(clause))
+        elif isinstance(condition, dict):
+            for op, value in condition.items():
+                out.append((field, op, value))
+        else:
+            out.append((field, "$eq", condition))
+    return out
+
+
+# ======================================================
+# PARTITIONS (LOCAL INDEXES)
+# ======================================================
+class Partitions:
+    """Row lists per video_title / url, and numeric time columns,
+    over an index's metadata; built on first use."""
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.count = len(metadata)
+        self._partitions = {}
+        self._numeric = {}
+
+    def partition(self, field, value):
+        if field not in self._partitions:
+            groups = {}
+            for row, meta in enumerate(self.metadata):
+                groups.setdefault(meta.get(field), []).append(row)
+            self._partitions[field] = {k: np.array(v, dtype=np.int64) for k, v in groups.items()}
+        return self._partitions[field].get(value, np.empty(0, dtype=np.int64))
+
+    def numeric(self, field):
+        if field not in self._numeric:
+            key = "start_time" if field == "start_seconds" else "end_time"
+            self._numeric[field] = np.array(
+                [timestamp_seconds(meta.get(key)) for meta in self.metadata], dtype=np.float64
+            )
+        return self._numeric[field]
+
+    def rows(self, filter):
+        """Sorted rows matching the filter, or None when it is empty."""
+        conds = conditions(filter)
+        if not conds:
+            return None
+
+        rows = None
+        for field, op, value in conds:
+            if field not in PARTITION_FIELDS:
+                continue
+            if op not in ("$eq", "$in"):
+                raise ValueError(f"Unsupported filter on {field}: {op}")
+            values = value if op == "$in" else [value]
+            part = np.unique(np.concatenate([self.partition(field, v) for v in values] or [np.empty(0, np.int64)]))
+            rows = part if rows is None else np.intersect1d(rows, part)
+
+        for field, op, value in conds:
+            if field in PARTITION_FIELDS:
+                continue
+            if field not in TIME_FIELDS or op not in COMPARISONS:
+                raise ValueError(f"Unsupported filter on {field}: {op}")
+            base = np.arange(self.count) if rows is None else rows
+            rows = base[COMPARISONS[op](self.numeric(field)[base], value)]
+        return rows
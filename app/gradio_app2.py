@@ -1,19 +1,31 @@
+import os
 import gradio as gr
-from rag_agent import answer_question, agent_with_search, conversation_history
+from rag_agent import memory, warm_up, video_titles, video_scope, ALL_VIDEOS
+from rag_agent_async import chat_turn_stream, warm_up as warm_up_async
+from telemetry import start_metrics_server
 
 
 # ---------------------------------------------------------
-# CHAT FUNCTION
+# CHAT FUNCTION (async: the event loop serves other chats
+# while this one waits on OpenAI / Pinecone / SerpAPI)
 # ---------------------------------------------------------
-def chat_fn(user_input, history):
-    rag = answer_question(user_input)
-    final, source = agent_with_search(user_input, rag)
-
+async def chat_fn(user_input, history, video, request: gr.Request):
+    # Generator: Gradio re-renders the chat on every yield, so the
+    # source tag shows as soon as the route is known and tokens
+    # appear as they stream in.
     history.append({"role": "user", "content": user_input})
-    history.append({"role": "assistant",
-                    "content": f"<div class='tag'>[{source}]</div><br>{final}"})
+    history.append({"role": "assistant", "content": ""})
+
+    # Each browser session has its own memory (see memory.py)
+    # The video selector scopes retrieval to one video's chunks
+    async for source, text in chat_turn_stream(user_input, request.session_hash, video_scope(video)):
+        history[-1]["content"] = f"<div class='tag'>[{source}]</div><br>{text}"
+        yield history, ""
+
 
-    return history, ""
+def clear_fn(request: gr.Request):
+    memory.clear(request.session_hash)
+    return [], ""
 
 
 # ---------------------------------------------------------
@@ -153,6 +165,13 @@ with gr.Blocks(title="ChainMind Chatbot") as demo:
     gr.HTML("<div id='title'><h1>ChainMind</h1></div>")
     gr.HTML("<div id='subtitle'><p>SYSTEM ONLINE</p></div>")
 
+    video = gr.Dropdown(
+        [ALL_VIDEOS] + video_titles(),
+        value=ALL_VIDEOS,
+        label="Video",
+        elem_id="video-select"
+    )
+
     chat = gr.Chatbot(height=450)
 
     msg = gr.Textbox(
@@ -165,12 +184,18 @@ with gr.Blocks(title="ChainMind Chatbot") as demo:
         send_btn = gr.Button("Send")
         clear_btn = gr.Button("Clear")
 
-    msg.submit(chat_fn, inputs=[msg, chat], outputs=[chat, msg])
-    send_btn.click(chat_fn, inputs=[msg, chat], outputs=[chat, msg])
-    clear_btn.click(lambda: ([], ""), None, [chat, msg])
+    msg.submit(chat_fn, inputs=[msg, chat, video], outputs=[chat, msg])
+    send_btn.click(chat_fn, inputs=[msg, chat, video], outputs=[chat, msg])
+    clear_btn.click(clear_fn, None, [chat, msg])
+    demo.load(warm_up_async)  # loop-bound clients, once per process
 
 
 # ---------------------------------------------------------
 # LAUNCH (IMPORTANT: CSS/JS GO HERE)
 # ---------------------------------------------------------
-demo.launch(css=custom_css, head=custom_js, share=True)
+# Async handlers don't hold a thread, so allow many chats per event
+if __name__ == "__main__":
+    warm_up()  # indexes, caches and connections before the first user
+    demo.queue(default_concurrency_limit=int(os.getenv("CHAT_CONCURRENCY", "64")))
+    start_metrics_server()  # Prometheus /metrics when METRICS_PORT is set
+    demo.launch(css=custom_css, head=custom_js, share=True)
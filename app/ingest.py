@@ -0,0 +1,496 @@
+# ======================================================
+#                     ingest.py
+#   BATCHED, CONCURRENT, RESUMABLE PINECONE INGESTION
+# ======================================================
+#
+# Replaces the one-chunk-at-a-time loop of notebooks/main_phase_2_rag:
+#   - one embeddings request per batch of chunk texts
+#   - summaries generated concurrently under a token bucket that
+#     respects the account's requests/min and tokens/min limits
+#   - one Pinecone upsert per batch
+#   - a checkpoint after every batch, so a crash resumes where it stopped
+#
+# Ingestion is incremental. Chunk IDs are content hashes, and
+# output/manifest.json records the hash of every .vtt file and the
+# chunk IDs it produced, so a run only:
+#   - re-parses .vtt files whose bytes changed (in parallel processes),
+#   - embeds/summarizes/upserts chunks whose ID is new,
+#   - deletes vectors whose chunk no longer exists.
+#
+# Usage:
+#   python app/ingest.py                 # incremental (resumes a crashed run)
+#   python app/ingest.py --full          # ignore the manifest, re-embed everything
+#   python app/ingest.py --reset         # ignore any checkpoint
+#   python app/ingest.py --local-index   # also update output/vector_index
+#   python app/ingest.py --segment       # ... and the compact output/corpus.seg (segment_store.py)
+#   python app/ingest.py --segment --segment-full   # ... with float32 rows for SEGMENT_RESCORE=1
+#   python app/ingest.py --chunking standard fine   # sentence-aware windows (chunking.py)
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+PROCESSED_DIR = os.path.join(BASE_DIR, "data", "processed")
+METADATA_FILE = os.path.join(BASE_DIR, "data", "metadata", "subtitle_metadata.json")
+DATASET_PATH = os.path.join(BASE_DIR, "output", "rag_dataset.json")
+MANIFEST_PATH = os.path.join(BASE_DIR, "output", "manifest.json")
+CHECKPOINT_DIR = os.path.join(BASE_DIR, "output", "ingest_checkpoint")
+LOCAL_INDEX_DIR = os.path.join(BASE_DIR, "output", "vector_index")
+SEGMENT_PATH = os.path.join(BASE_DIR, "output", "corpus.seg")
+SEGMENT_QUANTIZATION = "int8"
+
+INDEX_NAME = "youtube-chunks"
+EMBEDDING_MODEL = "text-embedding-3-small"
+SUMMARY_MODEL = "gpt-3.5-turbo"
+EMBEDDING_DIM = 1536
+
+SUMMARY_MAX_TOKENS = 120  # completion allowance charged to the token bucket
+
+
+# ======================================================
+# RATE LIMITING
+# ======================================================
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate` per second.
+
+    A request larger than the capacity waits for a full bucket and then
+    leaves it in debt, so the requests after it wait until the whole
+    amount has been refilled and the long-run rate still holds.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        needed = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= needed:
+                    self._tokens -= amount
+                    return
+                wait = (needed - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self):
+        """Empty the bucket, e.g. after the API answered 429."""
+        with self._lock:
+            self._tokens = 0
+            self._updated = time.monotonic()
+
+
+class RateLimiter:
+    """Requests/min and tokens/min limits applied together (one per model:
+    OpenAI limits each model separately)."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute / 60.0, capacity=max(1, requests_per_minute // 10))
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, capacity=max(1, tokens_per_minute // 10))
+
+    def acquire(self, tokens):
+        self.requests.acquire(1)
+        self.tokens.acquire(tokens)
+
+    def backoff(self):
+        self.requests.drain()
+        self.tokens.drain()
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def with_retries(fn, limiter=None, attempts=5, base_delay=1.0):
+    """Retry fn() on rate-limit / transient API errors with exponential backoff."""
+    import openai
+
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except (openai.RateLimitError, openai.APIConnectionError,
+                openai.APITimeoutError, openai.InternalServerError):
+            if attempt == attempts - 1:
+                raise
+            if limiter is not None:
+                limiter.backoff()
+            time.sleep(base_delay * (2 ** attempt))
+
+
+# ======================================================
+# CHECKPOINT
+# ======================================================
+class Checkpoint:
+    """Which chunk IDs are already upserted, plus their summaries/vectors.
+
+    `run_key` identifies the work being done; a checkpoint left by a
+    different run (other pending chunks) is ignored.
+    """
+
+    def __init__(self, directory, run_key):
+        self.directory = directory
+        self.state_path = os.path.join(directory, "state.json")
+        self.run_key = run_key
+        self.done = {}      # chunk id -> summary
+        self.batches = []   # file names of saved embedding batches
+
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("run_key") == run_key:
+                self.done = state["done"]
+                self.batches = state["batches"]
+            else:
+                print("[INFO] Pending chunks changed since last checkpoint, starting over")
+
+    def record_batch(self, ids, vectors, summaries):
+        os.makedirs(self.directory, exist_ok=True)
+
+        name = f"batch_{len(self.batches):05d}.npz"
+        np.savez(os.path.join(self.directory, name),
+                 ids=np.array(ids), vectors=np.asarray(vectors, dtype=np.float32))
+        self.batches.append(name)
+        self.done.update(zip(ids, summaries))
+
+        # Write-then-rename so a crash never leaves a torn state file
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"run_key": self.run_key, "done": self.done,
+                       "batches": self.batches}, f)
+        os.replace(tmp, self.state_path)
+
+    def load_vectors(self):
+        ids, vectors = [], []
+        for name in self.batches:
+            data = np.load(os.path.join(self.directory, name))
+            ids.extend(data["ids"].tolist())
+            vectors.append(data["vectors"])
+        if not vectors:
+            return ids, np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        return ids, np.concatenate(vectors)
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                os.remove(os.path.join(self.directory, name))
+        self.done = {}
+        self.batches = []
+
+
+# ======================================================
+# PIPELINE STEPS
+# ======================================================
+def embed_batch(client, texts, limiter):
+    limiter.acquire(sum(estimate_tokens(t) for t in texts))
+    response = with_retries(
+        lambda: client.embeddings.create(model=EMBEDDING_MODEL, input=texts),
+        limiter,
+    )
+    # The API may return items out of order; sort by their input index
+    return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+
+def summarize_chunk(client, text, limiter):
+    prompt = f"Summarize the following text in 1-2 sentences, keeping key details:\n\n{text}"
+    limiter.acquire(estimate_tokens(prompt) + SUMMARY_MAX_TOKENS)
+    response = with_retries(
+        lambda: client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.1,
+            max_tokens=SUMMARY_MAX_TOKENS,
+        ),
+        limiter,
+    )
+    return response.choices[0].message.content.strip()
+
+
+def build_vectors(items, embeddings, summaries):
+    vectors = []
+    for item, emb, summary in zip(items, embeddings, summaries):
+        metadata = {
+            "video_title": item["video_title"],
+            "url": item["url"],
+            "start_time": item["start_time"],
+            "end_time": item["end_time"],
+            "text_chunk": item["text_chunk"],
+        }
+        if summary is not None:
+            metadata["summary"] = summary
+        vectors.append({"id": item["id"], "values": emb, "metadata": metadata})
+    return vectors
+
+
+def run_ingestion(client, index, items, checkpoint, batch_size=100,
+                  workers=8, limiter=None, summaries=True, summary_limiter=None):
+    """Embed, summarize and upsert every chunk not yet in the checkpoint.
+
+    limiter paces the embedding model, summary_limiter the summary model.
+    """
+    limiter = limiter or RateLimiter(3500, 90000)
+    summary_limiter = summary_limiter or RateLimiter(3500, 90000)
+
+    pending = [item for item in items if item["id"] not in checkpoint.done]
+    total = len(items)
+    print(f"{total - len(pending)}/{total} chunks already ingested, {len(pending)} to go")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            texts = [item["text_chunk"] for item in batch]
+
+            # Summaries run on the pool while this thread embeds the batch
+            if summaries:
+                futures = [pool.submit(summarize_chunk, client, t, summary_limiter) for t in texts]
+            embeddings = embed_batch(client, texts, limiter)
+            batch_summaries = [f.result() for f in futures] if summaries else [None] * len(texts)
+
+            index.upsert(vectors=build_vectors(batch, embeddings, batch_summaries))
+            checkpoint.record_batch([item["id"] for item in batch], embeddings, batch_summaries)
+
+            print(f"Upserted {total - len(pending) + start + len(batch)}/{total} chunks...")
+
+
+def delete_vectors(index, ids, batch_size=1000):
+    ids = list(ids)
+    for start in range(0, len(ids), batch_size):
+        index.delete(ids=ids[start:start + batch_size])
+
+
+# ======================================================
+# MANIFEST / PLANNING
+# ======================================================
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_json(path, data, indent=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def plan_ingestion(manifest, old_dataset, raw_dir=RAW_DIR, processed_dir=PROCESSED_DIR,
+                   metadata_file=METADATA_FILE, workers=None, granularities=None):
+    """Work out the new dataset and which chunk IDs to upsert / delete.
+
+    granularities: None for the fixed-size chunker, or chunking specs
+    (see chunking.py); changing it re-chunks every file.
+
+    Returns (dataset, new_manifest, pending_items, removed_ids).
+    """
+    from transcripts import PARSER_VERSION, MAX_TOKENS, process_transcripts, load_url_map, file_hash
+
+    chunking = list(granularities) if granularities else None
+    url_map = load_url_map(metadata_file)
+    old_by_id = {item["id"]: item for item in old_dataset if "id" in item}
+    old_files = manifest.get("files", {})
+    same_parser = (manifest.get("parser_version") == PARSER_VERSION
+                   and manifest.get("chunking") == chunking)
+
+    chunks_by_file = {}
+    new_files = {}
+    jobs = []
+    os.makedirs(processed_dir, exist_ok=True)
+
+    for file_name in sorted(os.listdir(raw_dir)):
+        if not file_name.endswith(".vtt"):
+            continue
+        path = os.path.join(raw_dir, file_name)
+        digest = file_hash(path)
+        video_title = file_name[:-len(".vtt")]
+        url = url_map.get(video_title, "URL_NOT_FOUND")
+        new_files[file_name] = {"hash": digest, "url": url}
+
+        previous = old_files.get(file_name)
+        if (same_parser and previous and previous["hash"] == digest and previous.get("url") == url
+                and all(cid in old_by_id for cid in previous["chunks"])):
+            chunks_by_file[file_name] = [old_by_id[cid] for cid in previous["chunks"]]
+        else:
+            jobs.append((path, os.path.join(processed_dir, video_title + ".json"), video_title, url,
+                         MAX_TOKENS, chunking))
+
+    # Changed files are parsed in parallel, one process per file
+    for job, chunks in zip(jobs, process_transcripts(jobs, workers=workers)):
+        # Keep summaries of chunks whose content did not change
+        for chunk in chunks:
+            if "summary" in old_by_id.get(chunk["id"], {}):
+                chunk["summary"] = old_by_id[chunk["id"]]["summary"]
+        chunks_by_file[os.path.basename(job[0])] = chunks
+
+    dataset = []
+    for file_name, entry in new_files.items():
+        entry["chunks"] = [c["id"] for c in chunks_by_file[file_name]]
+        dataset.extend(chunks_by_file[file_name])
+
+    if manifest:
+        indexed = set(manifest.get("chunks", []))
+    else:
+        # Legacy index: vectors were upserted with their dataset position as ID
+        indexed = {str(i) for i in range(len(old_dataset))}
+
+    new_ids = {item["id"] for item in dataset}
+    pending = [item for item in dataset if item["id"] not in indexed]
+    removed = sorted(indexed - new_ids)
+
+    new_manifest = {"parser_version": PARSER_VERSION, "chunking": chunking,
+                    "files": new_files, "chunks": sorted(new_ids)}
+    return dataset, new_manifest, pending, removed
+
+
+def update_local_index(checkpoint, dataset, directory=LOCAL_INDEX_DIR, segment_path=None, segment_full=False):
+    """Merge checkpointed vectors into the local index, dropping removed chunks.
+
+    With segment_path, also rewrite the compact segment file from it
+    (segment_full: with float32 rows, for SEGMENT_RESCORE=1).
+    """
+    from vector_index import LocalVectorIndex, VECTORS_FILE, BRUTE_FORCE_LIMIT, build_graph_files
+
+    vectors_by_id = {}
+    if os.path.exists(os.path.join(directory, VECTORS_FILE)):
+        existing = LocalVectorIndex.load(directory, mode="brute")
+        for i, vid in enumerate(existing.ids):
+            vectors_by_id[vid] = np.array(existing.vectors[i])
+        del existing  # release the memory map before overwriting the file
+
+    new_ids, new_vectors = checkpoint.load_vectors()
+    vectors_by_id.update(zip(new_ids, new_vectors))
+
+    ids, vectors, metadata = [], [], []
+    for item in dataset:
+        if item["id"] not in vectors_by_id:
+            continue  # not embedded yet (e.g. local index built before this run)
+        ids.append(item["id"])
+        vectors.append(vectors_by_id[item["id"]])
+        metadata.append({k: v for k, v in item.items() if k != "id"})
+
+    matrix = np.array(vectors, dtype=np.float32).reshape(len(vectors), EMBEDDING_DIM)
+    LocalVectorIndex.save(directory, ids, matrix, metadata)
+    if len(ids) > BRUTE_FORCE_LIMIT:
+        # Built here, not on the first query of the app
+        recall = build_graph_files(directory)
+        print(f"[INFO] ANN graph built, recall@10 {recall:.3f} vs brute force")
+    if segment_path:
+        from segment_store import write_segment
+        write_segment(segment_path, ids, matrix, metadata, SEGMENT_QUANTIZATION, keep_full=segment_full)
+    return len(ids)
+
+
+# ======================================================
+# CLI
+# ======================================================
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally parse, embed, summarize and upsert data/raw into Pinecone.")
+    parser.add_argument("--raw-dir", default=RAW_DIR)
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--manifest", default=MANIFEST_PATH)
+    parser.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR)
+    parser.add_argument("--index-name", default=INDEX_NAME)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=8, help="summary threads")
+    parser.add_argument("--parse-workers", type=int, default=None, help="VTT parsing processes")
+    parser.add_argument("--rpm", type=int, default=3500, help="embedding model requests per minute")
+    parser.add_argument("--tpm", type=int, default=90000, help="embedding model tokens per minute")
+    parser.add_argument("--summary-rpm", type=int, default=3500, help="summary model requests per minute")
+    parser.add_argument("--summary-tpm", type=int, default=90000, help="summary model tokens per minute")
+    parser.add_argument("--chunking", nargs="+", default=None, metavar="GRANULARITY",
+                        help="sentence-aware chunks: fine/standard/coarse or WINDOW:OVERLAP "
+                             "(default: fixed 300-word chunks)")
+    parser.add_argument("--no-summaries", action="store_true")
+    parser.add_argument("--local-index", action="store_true", help="also update output/vector_index")
+    parser.add_argument("--segment", action="store_true",
+                        help="also update output/vector_index and the compact output/corpus.seg")
+    parser.add_argument("--segment-full", action="store_true",
+                        help="with --segment, also store float32 rows for SEGMENT_RESCORE=1")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and re-embed every chunk")
+    parser.add_argument("--reset", action="store_true", help="ignore and delete the checkpoint")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from openai import OpenAI
+    from pinecone import Pinecone, ServerlessSpec
+
+    load_dotenv()
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    if not pc.has_index(args.index_name):
+        pc.create_index(
+            name=args.index_name,
+            dimension=EMBEDDING_DIM,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region=os.getenv("PINECONE_ENV", "us-east-1")),
+        )
+    index = pc.Index(args.index_name)
+
+    manifest = load_json(args.manifest, {})
+    old_dataset = load_json(args.dataset, [])
+
+    dataset, new_manifest, pending, removed = plan_ingestion(
+        manifest, old_dataset, raw_dir=args.raw_dir, workers=args.parse_workers,
+        granularities=args.chunking
+    )
+    if args.full:
+        # Old manifest IDs that survive are simply overwritten by the upsert
+        pending = dataset
+
+    print(f"{len(dataset)} chunks: {len(pending)} new/changed, {len(removed)} removed")
+
+    run_key = hashlib.sha256("\n".join(item["id"] for item in pending).encode()).hexdigest()
+    checkpoint = Checkpoint(args.checkpoint_dir, run_key)
+    if args.reset:
+        checkpoint.clear()
+
+    started = time.perf_counter()
+    run_ingestion(
+        client, index, pending, checkpoint,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        limiter=RateLimiter(args.rpm, args.tpm),
+        summaries=not args.no_summaries,
+        summary_limiter=RateLimiter(args.summary_rpm, args.summary_tpm),
+    )
+    if removed:
+        delete_vectors(index, removed)
+
+    for item in dataset:
+        if checkpoint.done.get(item["id"]) is not None:
+            item["summary"] = checkpoint.done[item["id"]]
+
+    if args.local_index or args.segment:
+        count = update_local_index(checkpoint, dataset, segment_path=SEGMENT_PATH if args.segment else None,
+                                   segment_full=args.segment_full)
+        print(f"✅ Local vector index updated ({count} vectors)")
+
+    # Rewriting the dataset invalidates the app's answer cache, so skip it
+    # when nothing changed.
+    if pending or removed or dataset != old_dataset:
+        write_json(args.dataset, dataset, indent=2)
+    write_json(args.manifest, new_manifest, indent=2)
+    checkpoint.clear()
+
+    print(f"🎉 Upserted {len(pending)} and deleted {len(removed)} chunks "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
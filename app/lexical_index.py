@@ -0,0 +1,178 @@
+# ======================================================
+#                  lexical_index.py
+#      IN-PROCESS BM25 INDEX + HYBRID RANK FUSION
+# ======================================================
+#
+# BM25 over the `text_chunk` of every record in rag_dataset.json.
+# Exact terms ("Base", "Solidity", "ERC-721") that dense embeddings
+# blur are matched literally, and a query can be answered with
+# zero network calls.
+#
+# Hybrid retrieval fuses the BM25 and vector rankings with
+# reciprocal-rank fusion; FastPathPolicy decides when to skip the
+# embedding call altogether (keyword-style query, or the embedding
+# service is currently slow / failing).
+#
+# Result objects are the same Pinecone-shaped Match / QueryResult
+# as vector_index, and IDs follow the same rule (dataset `id`,
+# or the record position for datasets written before IDs existed).
+
+import math
+import time
+import json
+import threading
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from router import tokenize
+from vector_index import Match, QueryResult
+from filters import Partitions
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can could do does did for from how i if in into is it
+its me my of on or our so than that the their them then there these they this to
+was we were what when where which who why will with would you your about explain
+tell show give please
+""".split())
+
+
+def terms(text):
+    """Tokens plus the parts of hyphenated ones, so "ERC-721" meets "erc 721"."""
+    out = []
+    for token in tokenize(text):
+        out.append(token)
+        if "-" in token:
+            out.extend(p for p in token.split("-") if p)
+    return out
+
+
+class BM25Index:
+    def __init__(self, texts, ids, metadata, k1=BM25_K1, b=BM25_B):
+        self.ids = list(ids)
+        self.metadata = list(metadata)
+        self.partitions = Partitions(self.metadata)
+
+        doc_tokens = [terms(t) for t in texts]
+        lengths = np.array([len(t) for t in doc_tokens], dtype=np.float32)
+        avg_len = float(lengths.mean()) if len(lengths) else 0.0
+        n = len(doc_tokens)
+
+        postings = defaultdict(list)
+        for doc, tokens in enumerate(doc_tokens):
+            for term, tf in Counter(tokens).items():
+                postings[term].append((doc, tf))
+
+        # Document lengths never change, so each posting's full BM25
+        # contribution (idf * saturated tf) is computed once here and a
+        # query only adds up arrays.
+        self.postings = {}
+        for term, plist in postings.items():
+            docs = np.array([d for d, _ in plist], dtype=np.int32)
+            tf = np.array([f for _, f in plist], dtype=np.float32)
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            norm = k1 * (1 - b + b * lengths[docs] / (avg_len or 1.0))
+            self.postings[term] = (docs, idf * tf * (k1 + 1) / (tf + norm))
+
+    @classmethod
+    def from_dataset(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            dataset = json.load(f)
+        return cls(
+            [item["text_chunk"] for item in dataset],
+            [item.get("id", str(i)) for i, item in enumerate(dataset)],
+            dataset,
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, term):
+        return term in self.postings
+
+    def query(self, text, top_k=3, filter=None):
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        hit = False
+        for term in set(terms(text)):
+            if term in STOPWORDS or term not in self.postings:
+                continue
+            docs, weights = self.postings[term]
+            scores[docs] += weights
+            hit = True
+
+        if not hit:
+            return QueryResult([])
+
+        rows = self.partitions.rows(filter)
+        if rows is not None:
+            keep = np.zeros(len(self.ids), dtype=bool)
+            keep[rows] = True
+            scores[~keep] = 0.0
+
+        k = min(top_k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return QueryResult([])
+        idx = np.argpartition(-scores, k - 1)[:k]
+        idx = idx[np.argsort(-scores[idx])]
+        return QueryResult([
+            Match(self.ids[i], float(scores[i]), self.metadata[i]) for i in idx.tolist()
+        ])
+
+
+# ==============================
+# Fusion
+# ==============================
+def reciprocal_rank_fusion(rankings, top_k=3, k=RRF_K):
+    """Merge several ranked Match lists; score = sum of 1 / (k + rank)."""
+    scores, first = {}, {}
+    for matches in rankings:
+        for rank, m in enumerate(matches, start=1):
+            scores[m.id] = scores.get(m.id, 0.0) + 1.0 / (k + rank)
+            first.setdefault(m.id, m)
+
+    best = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [Match(i, scores[i], first[i].metadata) for i in best]
+
+
+# ==============================
+# Lexical-only fast path
+# ==============================
+class FastPathPolicy:
+    """Decides when retrieval should skip the embedding call.
+
+    - keyword-style queries: short, a few content words, all in the index
+    - degraded mode: the last embedding call failed or took longer than
+      `slow_seconds`; vector search is skipped for `cooldown` seconds
+    """
+
+    def __init__(self, max_keywords=3, max_words=5, slow_seconds=2.0, cooldown=30.0):
+        self.max_keywords = max_keywords
+        self.max_words = max_words
+        self.slow_seconds = slow_seconds
+        self.cooldown = cooldown
+        self._degraded_until = 0.0
+        self._lock = threading.Lock()
+
+    def is_keyword_query(self, query, lexical_index):
+        words = tokenize(query)
+        content = [w for w in words if w not in STOPWORDS]
+        return (
+            0 < len(content) <= self.max_keywords
+            and len(words) <= self.max_words
+            and all(w in lexical_index for w in content)
+        )
+
+    def embeddings_degraded(self):
+        return time.monotonic() < self._degraded_until
+
+    def lexical_only(self, query, lexical_index):
+        return self.embeddings_degraded() or self.is_keyword_query(query, lexical_index)
+
+    def record_embedding(self, seconds, ok=True):
+        if not ok or seconds > self.slow_seconds:
+            with self._lock:
+                self._degraded_until = time.monotonic() + self.cooldown
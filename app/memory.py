@@ -0,0 +1,131 @@
+# ======================================================
+#                      memory.py
+#         PER-SESSION CONVERSATION MEMORY STORE
+# ======================================================
+#
+# Each chat session gets a fixed-size ring buffer of its last turns;
+# sessions idle for longer than `ttl` seconds are evicted.
+#
+# Backends:
+#   InMemoryBackend - dict of deques inside this process (default)
+#   RedisBackend    - any Redis-protocol server (redis, valkey, ...),
+#                     so several app workers can share sessions
+#
+# MEMORY_BACKEND=redis and REDIS_URL select the shared backend.
+
+import os
+import json
+import time
+import threading
+from collections import deque
+
+DEFAULT_SESSION = "default"
+MAX_TURNS = 5          # turns kept per session (= turns used in prompts)
+SESSION_TTL = 3600     # seconds of inactivity before a session is dropped
+
+
+class InMemoryBackend:
+    def __init__(self, max_turns=MAX_TURNS, ttl=SESSION_TTL):
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self._sessions = {}    # session_id -> deque of turns
+        self._last_seen = {}   # session_id -> monotonic time
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            self._touch(session_id)
+            return list(self._sessions.get(session_id, ()))
+
+    def append(self, session_id, turn):
+        with self._lock:
+            self._touch(session_id)
+            buf = self._sessions.get(session_id)
+            if buf is None:
+                buf = self._sessions[session_id] = deque(maxlen=self.max_turns)
+            buf.append(turn)
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._last_seen.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _touch(self, session_id):
+        now = time.monotonic()
+        self._last_seen[session_id] = now
+
+        # Sweep idle sessions at most a few times per TTL
+        if now - self._last_sweep > self.ttl / 4:
+            self._last_sweep = now
+            expired = [sid for sid, seen in self._last_seen.items() if now - seen > self.ttl]
+            for sid in expired:
+                self._sessions.pop(sid, None)
+                del self._last_seen[sid]
+
+
+class RedisBackend:
+    """One Redis list per session, trimmed to max_turns, expiring after ttl."""
+
+    def __init__(self, url, max_turns=MAX_TURNS, ttl=SESSION_TTL, prefix="chainmind:session:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("MEMORY_BACKEND=redis needs the 'redis' package (pip install redis)") from e
+
+        self.client = redis.Redis.from_url(url)
+        self.max_turns = max_turns
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    def get(self, session_id):
+        key = self.prefix + session_id
+        pipe = self.client.pipeline()
+        pipe.lrange(key, 0, -1)
+        pipe.expire(key, self.ttl)
+        raw, _ = pipe.execute()
+        return [json.loads(item) for item in raw]
+
+    def append(self, session_id, turn):
+        key = self.prefix + session_id
+        pipe = self.client.pipeline()
+        pipe.rpush(key, json.dumps(turn, ensure_ascii=False))
+        pipe.ltrim(key, -self.max_turns, -1)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def clear(self, session_id):
+        self.client.delete(self.prefix + session_id)
+
+
+class SessionMemory:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def turns(self, session_id=DEFAULT_SESSION):
+        return self.backend.get(session_id)
+
+    def append(self, session_id, question, answer):
+        self.backend.append(session_id, {"question": question, "answer": answer})
+
+    def last_answer(self, session_id=DEFAULT_SESSION):
+        turns = self.turns(session_id)
+        return turns[-1]["answer"] if turns else None
+
+    def clear(self, session_id=DEFAULT_SESSION):
+        self.backend.clear(session_id)
+
+
+def create_memory():
+    """SessionMemory configured from MEMORY_BACKEND / REDIS_URL / MEMORY_* env vars."""
+    max_turns = int(os.getenv("MEMORY_MAX_TURNS", MAX_TURNS))
+    ttl = float(os.getenv("MEMORY_SESSION_TTL", SESSION_TTL))
+
+    if os.getenv("MEMORY_BACKEND", "memory") == "redis":
+        backend = RedisBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"), max_turns, ttl)
+    else:
+        backend = InMemoryBackend(max_turns, ttl)
+    return SessionMemory(backend)
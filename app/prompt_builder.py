@@ -0,0 +1,195 @@
+# ======================================================
+#                  prompt_builder.py
+#     TOKEN-BUDGETED MEMORY + CONTEXT PROMPT ASSEMBLY
+# ======================================================
+#
+# Shared by the RAG and agent stages:
+#   - counts tokens (tiktoken when installed, ~4 chars/token otherwise)
+#   - memory block: newest turns first, each answer capped, total capped;
+#     rendered once per session per turn and cached
+#   - context block: retrieved chunks in rank order, near-duplicates and
+#     overlapping boundaries removed, cut off at the remaining budget
+
+import re
+import threading
+from collections import OrderedDict
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a character estimate
+    tiktoken = None
+
+PROMPT_TOKEN_BUDGET = 3000   # whole RAG prompt (template + memory + context + question)
+MEMORY_TOKEN_BUDGET = 800    # memory block share of it
+MAX_TURN_TOKENS = 250        # one remembered answer
+SHINGLE_SIZE = 5
+DUPLICATE_RATIO = 0.6        # share of a chunk's shingles already in context
+MAX_CACHED_SESSIONS = 10000
+
+WORD_RE = re.compile(r"\S+")
+
+
+class TokenCounter:
+    def __init__(self, model="gpt-3.5-turbo"):
+        self.model = model
+        self._encoding = None
+        self._loaded = False
+
+    @property
+    def encoding(self):
+        """Loaded on first use (tiktoken may download its BPE file)."""
+        if not self._loaded:
+            if tiktoken is not None:
+                try:
+                    self._encoding = tiktoken.encoding_for_model(self.model)
+                except KeyError:
+                    self._encoding = tiktoken.get_encoding("cl100k_base")
+            self._loaded = True
+        return self._encoding
+
+    def count(self, text):
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return (len(text) + 3) // 4
+
+    def truncate(self, text, max_tokens):
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text)
+            if len(tokens) <= max_tokens:
+                return text
+            return self.encoding.decode(tokens[:max_tokens]) + " …"
+        if len(text) <= max_tokens * 4:
+            return text
+        return text[:max_tokens * 4] + " …"
+
+
+# ==============================
+# Chunk de-duplication
+# ==============================
+def _shingles(words, n=SHINGLE_SIZE):
+    if len(words) < n:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def _boundary_overlap(previous_words, words, max_words=150):
+    """Words at the start of `words` that repeat the end of `previous_words`."""
+    limit = min(len(previous_words), len(words), max_words)
+    for k in range(limit, SHINGLE_SIZE - 1, -1):
+        if previous_words[-k:] == words[:k]:
+            return k
+    return 0
+
+
+def dedupe_chunks(texts):
+    """Drop near-duplicate chunks and trim text repeated at chunk boundaries."""
+    kept, kept_words, seen = [], [], set()
+
+    for text in texts:
+        words = WORD_RE.findall(text)
+        shingles = _shingles(words)
+        if shingles and len(shingles & seen) / len(shingles) >= DUPLICATE_RATIO:
+            continue
+
+        # Overlapping windows of the same transcript repeat a few sentences
+        trim = max((_boundary_overlap(prev, words) for prev in kept_words), default=0)
+        if trim:
+            words = words[trim:]
+            if not words:
+                continue
+            text = " ".join(words)
+
+        kept.append(text)
+        kept_words.append(words)
+        seen |= shingles
+
+    return kept
+
+
+# ======================================================
+# BUILDER
+# ======================================================
+class PromptBuilder:
+    def __init__(self, total_budget=PROMPT_TOKEN_BUDGET, memory_budget=MEMORY_TOKEN_BUDGET,
+                 max_turn_tokens=MAX_TURN_TOKENS, counter=None, max_sessions=MAX_CACHED_SESSIONS):
+        self.total_budget = total_budget
+        self.memory_budget = memory_budget
+        self.max_turn_tokens = max_turn_tokens
+        self.counter = counter or TokenCounter()
+        self.max_sessions = max_sessions
+
+        # session_id -> (fingerprint of turns, rendered block), LRU order
+        self._memory_cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ------------------------------
+    # Memory
+    # ------------------------------
+    def memory_block(self, session_id, turns):
+        """Rendered memory for these turns; cached until the session changes."""
+        key = (len(turns), turns[-1]["question"], turns[-1]["answer"]) if turns else (0,)
+
+        with self._lock:
+            cached = self._memory_cache.get(session_id)
+            if cached is not None and cached[0] == key:
+                self._memory_cache.move_to_end(session_id)
+                return cached[1]
+
+        block = self._render_memory(turns)
+        with self._lock:
+            self._memory_cache[session_id] = (key, block)
+            self._memory_cache.move_to_end(session_id)
+            while len(self._memory_cache) > self.max_sessions:
+                self._memory_cache.popitem(last=False)
+        return block
+
+    def _render_memory(self, turns):
+        parts, used = [], 0
+
+        # Newest turns are the most useful for follow-ups, so fill from the end
+        for turn in reversed(turns):
+            answer = self.counter.truncate(turn["answer"], self.max_turn_tokens)
+            part = f"USER: {turn['question']}\nASSISTANT: {answer}\n\n"
+            cost = self.counter.count(part)
+            if used + cost > self.memory_budget:
+                if not parts:
+                    # Always keep the latest turn, with its answer cut to fit
+                    head = f"USER: {turn['question']}\nASSISTANT: "
+                    room = self.memory_budget - self.counter.count(head) - 2
+                    if room > 0:
+                        parts.append(head + self.counter.truncate(answer, room) + "\n\n")
+                break
+            parts.append(part)
+            used += cost
+
+        return "".join(reversed(parts))
+
+    def forget(self, session_id):
+        with self._lock:
+            self._memory_cache.pop(session_id, None)
+
+    # ------------------------------
+    # Context
+    # ------------------------------
+    def context_budget(self, skeleton):
+        """Tokens left for context once the rest of the prompt is rendered."""
+        return max(0, self.total_budget - self.counter.count(skeleton))
+
+    def context_block(self, texts, budget):
+        parts, used = [], 0
+        sep_cost = self.counter.count("\n\n")
+
+        for text in dedupe_chunks(texts):
+            cost = self.counter.count(text) + (sep_cost if parts else 0)
+            if used + cost > budget:
+                remaining = budget - used - (sep_cost if parts else 0)
+                # Keep a partial chunk only if it is worth reading
+                if remaining >= 50:
+                    parts.append(self.counter.truncate(text, remaining))
+                break
+            parts.append(text)
+            used += cost
+
+        return "\n\n".join(parts)
@@ -5,6 +5,10 @@
 
 import os
 import json
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # ==============================
@@ -12,54 +16,446 @@ from dotenv import load_dotenv
 # ==============================
 load_dotenv()
 
-from openai import OpenAI
-from pinecone import Pinecone
-from serpapi import GoogleSearch
-import gradio as gr
+import httpx
+import urllib3
+
+from vector_index import LocalVectorIndex, VECTORS_FILE
+from embedding_cache import EmbeddingCache
+from answer_cache import SemanticAnswerCache, file_version, fingerprint
+from search_cache import SearchCache, SEARCH_CACHE_TTL, SEARCH_CACHE_SIZE
+from router import Router, NaiveBayesClassifier, MEMORY, SEARCH
+from memory import create_memory, DEFAULT_SESSION
+from rerank import Reranker, CrossEncoderReranker
+from lexical_index import BM25Index, FastPathPolicy, reciprocal_rank_fusion
+from timeline import TimelineIndex, merge_adjacent, citations
+from filters import build_filter, has_time_range, in_scope
+from telemetry import span, trace, record_usage
+from prompt_builder import PromptBuilder, PROMPT_TOKEN_BUDGET, MEMORY_TOKEN_BUDGET
+from resilience import call, hedged, request_budget, remaining, http_limits, CircuitBreaker, CircuitOpenError
+from clients import lazy, timed_steps
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# ==============================
+# Timeouts, retries, circuit breakers (see resilience.py)
+# ==============================
+# A chat turn gets REQUEST_BUDGET seconds in total; each call is capped
+# by its stage timeout and by what is left of that budget. Retries are
+# ours (jittered, budget-aware), so the SDK's own retries are off.
+# HEDGE_AFTER > 0 sends a second embedding request when the first one
+# has not answered after that many seconds.
+REQUEST_BUDGET = float(os.getenv("REQUEST_BUDGET", "30"))
+COMPLETION_TIMEOUT = float(os.getenv("COMPLETION_TIMEOUT", "20"))
+VECTOR_TIMEOUT = float(os.getenv("VECTOR_TIMEOUT", "3"))
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "8"))
+HEDGE_AFTER = float(os.getenv("HEDGE_AFTER", "0"))
+
+breakers = {
+    name: CircuitBreaker(name, reset_timeout=float(os.getenv("BREAKER_RESET", "30")))
+    for name in ("embedding", "completion", "vector", "search")
+}
+
+
+@lazy
+def upstream_errors():
+    """What a failing upstream can raise once retries are spent
+    (resolved on the first failure, so importing openai / pinecone waits too)."""
+    from openai import OpenAIError
+    from pinecone.exceptions import PineconeException
+
+    return (
+        OpenAIError, PineconeException, httpx.HTTPError, urllib3.exceptions.HTTPError,
+        TimeoutError, ConnectionError, CircuitOpenError,
+    )
+
+
+# ==============================
+# Clients (built on first use, see clients.py)
+# ==============================
+# One keep-alive connection pool per service, shared by all chats.
+# Nothing connects at import time; warm_up() opens them ahead of traffic.
+@lazy
+def get_client():
+    from openai import OpenAI, DefaultHttpxClient
+
+    return OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        max_retries=0,
+        http_client=DefaultHttpxClient(limits=http_limits()),
+    )
+
+
+@lazy
+def get_http():
+    return httpx.Client(limits=http_limits(), timeout=httpx.Timeout(SEARCH_TIMEOUT))
+
+
+SERPAPI_URL = os.getenv("SERPAPI_URL", "https://serpapi.com/search.json")
 
 # ==============================
-# Pinecone
+# Retriever backend
 # ==============================
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index("youtube-chunks")
+# "pinecone" (default) queries the hosted index.
+# "local" answers from the in-process index built by vector_index.py,
+# which exposes the same query() call; "segment" from the compact,
+# quantized corpus file built by segment_store.py.
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "pinecone")
+LOCAL_BACKENDS = ("local", "segment")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(BASE_DIR, "output", "vector_index"))
+SEGMENT_PATH = os.getenv("SEGMENT_PATH", os.path.join(BASE_DIR, "output", "corpus.seg"))
+# Re-score quantized candidates in float32; needs a segment written with
+# full rows (segment_store.py --full, ingest.py --segment-full)
+SEGMENT_RESCORE = os.getenv("SEGMENT_RESCORE", "0") == "1"
+
+
+
+@lazy
+def get_index():
+    if RETRIEVER_BACKEND == "local":
+        return LocalVectorIndex.load(LOCAL_INDEX_DIR)
+    if RETRIEVER_BACKEND == "segment":
+        from segment_store import SegmentIndex
+        index = SegmentIndex.load(SEGMENT_PATH, rescore=SEGMENT_RESCORE)
+        if SEGMENT_RESCORE and not index.rescore:
+            # Opened by warm_up(), so a misconfigured worker fails at startup
+            raise ValueError(f"SEGMENT_RESCORE=1 but {SEGMENT_PATH} has no full-precision rows "
+                             f"(write it with --full, or unset SEGMENT_RESCORE)")
+        return index
+
+    from pinecone import Pinecone
+
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    return pc.Index("youtube-chunks")
+
+# ==============================
+# Query embedding cache
+# ==============================
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", os.path.join(BASE_DIR, "output", "cache", "embeddings.sqlite")
+)
+
+
+@lazy
+def get_embedding_cache():
+    """Opened on first use: importing this module touches no files."""
+    return EmbeddingCache(EMBEDDING_CACHE_PATH)
+
+# ==============================
+# Semantic answer cache
+# ==============================
+# Re-ingestion rewrites rag_dataset.json, which invalidates all answers.
+DATASET_PATH = os.path.join(BASE_DIR, "output", "rag_dataset.json")
+
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    version_fn=lambda: file_version(DATASET_PATH),
+)
+
+# ==============================
+# Web search cache
+# ==============================
+# Snippets per search term and refined answers per question, shared by
+# all sessions; concurrent identical searches make one SerpAPI call.
+search_cache = SearchCache(
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", SEARCH_CACHE_TTL)),
+    max_entries=int(os.getenv("SEARCH_CACHE_SIZE", SEARCH_CACHE_SIZE)),
+)
+
+# ==============================
+# Hybrid retrieval (BM25 + vectors)
+# ==============================
+# RETRIEVAL_MODE: "hybrid" (default) fuses BM25 over rag_dataset.json
+# with the vector results; "vector" or "lexical" use one side only.
+# Keyword-style queries, and every query while the embedding service
+# is slow or failing, take the lexical path with no network call.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+HYBRID_CANDIDATES = 10  # per side, before fusion
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "5"))
+
+fast_path = FastPathPolicy(slow_seconds=float(os.getenv("EMBEDDING_SLOW_SECONDS", "2")))
+
+_lexical_index = None
+_lexical_version = None
+_lexical_lock = threading.Lock()
+
+
+def get_lexical_index():
+    """BM25 index over the dataset, rebuilt after re-ingestion; None if unused."""
+    global _lexical_index, _lexical_version
+
+    if RETRIEVAL_MODE == "vector":
+        return None
+    version = file_version(DATASET_PATH)
+    if version is None:
+        return None
+
+    with _lexical_lock:
+        if version != _lexical_version:
+            _lexical_index = BM25Index.from_dataset(DATASET_PATH)
+            _lexical_version = version
+        return _lexical_index
+
+# ==============================
+# Timestamp index (see timeline.py)
+# ==============================
+# TIME_LOOKUP: "what does the Base video say around minute 12" is read
+# straight from a per-video timestamp index (no embedding, no vector
+# query). MERGE_ADJACENT joins retrieved chunks that follow each other
+# into one span, and DEEP_LINKS adds a "Sources:" line of YouTube links
+# at each span's start to RAG answers (shown only: memory stores the
+# answer without them, see without_sources).
+TIME_LOOKUP = os.getenv("TIME_LOOKUP", "1") == "1"
+MERGE_ADJACENT = os.getenv("MERGE_ADJACENT", "1") == "1"
+DEEP_LINKS = os.getenv("DEEP_LINKS", "1") == "1"
+
+_timeline = None
+_timeline_version = None
+_timeline_lock = threading.Lock()
+
+
+def get_timeline():
+    """Timestamp index over the dataset, rebuilt after re-ingestion; None if unused."""
+    global _timeline, _timeline_version
+
+    if not TIME_LOOKUP:
+        return None
+    version = file_version(DATASET_PATH)
+    if version is None:
+        return None
+
+    with _timeline_lock:
+        if version != _timeline_version:
+            _timeline = TimelineIndex.from_dataset(DATASET_PATH)
+            _timeline_version = version
+        return _timeline
+
+
+# Video selector of the Gradio apps: "All videos" or one title
+ALL_VIDEOS = "All videos"
+
+
+def video_titles():
+    """Video titles in the dataset, sorted."""
+    if file_version(DATASET_PATH) is None:
+        return []
+    with open(DATASET_PATH, "r", encoding="utf-8") as f:
+        dataset = json.load(f)
+    return sorted({item["video_title"] for item in dataset if item.get("video_title")})
+
+
+def video_scope(choice):
+    """Retrieval filters for a video selector choice (None = whole corpus)."""
+    return {"video_title": choice} if choice and choice != ALL_VIDEOS else None
+
+# ==============================
+# Summary-first context
+# ==============================
+# CONTEXT_MODE=summary puts the ingestion-time summary of each retrieved
+# chunk in the prompt instead of its full text, except for the top
+# SUMMARY_FULL_HITS hits. If the model answers NEED_DETAIL, the question
+# is asked again with every chunk in full. Summaries come from the match
+# metadata, or from rag_dataset.json for vectors upserted without one.
+CONTEXT_MODE = os.getenv("CONTEXT_MODE", "full")
+SUMMARY_FULL_HITS = int(os.getenv("SUMMARY_FULL_HITS", "1"))
+NEED_DETAIL = "NEED_MORE_DETAIL"
+
+_summaries = {}
+_summaries_version = None
+_summaries_lock = threading.Lock()
+
+
+def get_summaries():
+    """chunk id -> summary from the dataset, reloaded after re-ingestion."""
+    global _summaries, _summaries_version
+
+    version = file_version(DATASET_PATH)
+    if version is None:
+        return {}
+
+    with _summaries_lock:
+        if version != _summaries_version:
+            with open(DATASET_PATH, "r", encoding="utf-8") as f:
+                dataset = json.load(f)
+            _summaries = {
+                item.get("id", str(i)): item["summary"]
+                for i, item in enumerate(dataset) if item.get("summary")
+            }
+            _summaries_version = version
+        return _summaries
+
+# ==============================
+# Re-ranking (MMR over stored chunk vectors)
+# ==============================
+# RERANK=mmr (default) over-fetches RERANK_CANDIDATES chunks and keeps up
+# to k relevant, mutually different ones using the vectors of the local
+# index (no embedding calls); RERANK=none keeps the raw top-k. With
+# Pinecone and no exported local index there are no vectors to compare,
+# so unless a cross-encoder is set, nothing is re-ranked or over-fetched.
+# CROSS_ENCODER_MODEL (e.g. cross-encoder/ms-marco-MiniLM-L-6-v2) scores
+# relevance with a CPU cross-encoder (needs sentence-transformers).
+RERANK = os.getenv("RERANK", "mmr")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "10"))
+CROSS_ENCODER_MODEL = os.getenv("CROSS_ENCODER_MODEL")
+
+
+def _chunk_vector_store():
+    if RETRIEVER_BACKEND in LOCAL_BACKENDS:
+        return get_index()
+    if os.path.exists(os.path.join(LOCAL_INDEX_DIR, VECTORS_FILE)):
+        # Same vectors as Pinecone, exported by vector_index.py
+        return LocalVectorIndex.load(LOCAL_INDEX_DIR, mode="brute")
+    return None
+
+
+@lazy
+def get_reranker():
+    """Reranker, or None for RERANK=none or when it could only truncate
+    (no local chunk vectors for MMR and no cross-encoder), so retrieval
+    doesn't over-fetch for nothing."""
+    if RERANK != "mmr":
+        return None
+    vector_store = _chunk_vector_store()
+    cross_encoder = CrossEncoderReranker(CROSS_ENCODER_MODEL) if CROSS_ENCODER_MODEL else None
+    if vector_store is None and cross_encoder is None:
+        return None
+    return Reranker(
+        vector_store=vector_store,
+        cross_encoder=cross_encoder,
+        lambda_=float(os.getenv("MMR_LAMBDA", "0.7")),
+    )
 
 # ==============================
 # MEMORY
 # ==============================
-conversation_history = []
+# Bounded ring buffer per chat session (see memory.py). Callers that
+# don't pass a session_id share DEFAULT_SESSION, like the notebooks.
+memory = create_memory()
+
+NO_ANSWER = "The video does not explain this clearly."
+DEGRADED_NOTE = "The answer service is unavailable right now. The most relevant part of the videos says:"
+DEGRADED_WORDS = 80
+
+# ==============================
+# Prompt token budget
+# ==============================
+# Memory turns and retrieved chunks share one budget (see prompt_builder.py);
+# the rendered memory block is cached per session, so the RAG and agent
+# stages of a turn build it once.
+prompt_builder = PromptBuilder(
+    total_budget=int(os.getenv("PROMPT_TOKEN_BUDGET", PROMPT_TOKEN_BUDGET)),
+    memory_budget=int(os.getenv("MEMORY_TOKEN_BUDGET", MEMORY_TOKEN_BUDGET)),
+)
+
+# ==============================
+# Router (runs before any network call)
+# ==============================
+# ROUTER_EXAMPLES: optional JSONL of {"text", "route"} to train the
+# local classifier used when no keyword rule matches.
+ROUTER_EXAMPLES = os.getenv("ROUTER_EXAMPLES")
+
+router = Router(
+    classifier=NaiveBayesClassifier.from_jsonl(ROUTER_EXAMPLES) if ROUTER_EXAMPLES else None
+)
+
+# ==============================
+# Search agent loop
+# ==============================
+# One gpt-4o-mini conversation per search turn: every internet_search
+# the model asks for in a round runs in parallel, the results go back as
+# tool messages, and the next completion answers from them (or asks for
+# more). After a RAG miss, the question's own search runs first
+# (AGENT_PRESEARCH, reusing the speculative search when there is one)
+# and is given to the model as an earlier tool call, so the usual path
+# is search + one completion instead of decision + search + rewrite.
+# A turn routed straight to SEARCH skips the presearch: the model
+# decides, and declining sends the question to RAG. AGENT_MAX_ROUNDS caps the
+# completions (at least 2 without a presearch: the first one only decides),
+# AGENT_BUDGET the seconds; the last round (or one started with less than
+# AGENT_ANSWER_RESERVE seconds left) must answer.
+AGENT_MODEL = "gpt-4o-mini"
+AGENT_MAX_ROUNDS = int(os.getenv("AGENT_MAX_ROUNDS", "3"))
+AGENT_BUDGET = float(os.getenv("AGENT_BUDGET", "15"))
+AGENT_PRESEARCH = os.getenv("AGENT_PRESEARCH", "1") == "1"
+AGENT_MAX_TOOL_CALLS = 4
+AGENT_ANSWER_RESERVE = 3.0
+
+_tool_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="agent-tool")
+
+SEARCH_TOOLS = [{
+    "type": "function",
+    "function": {
+        "name": "internet_search",
+        "description": "Search Google and return the top result snippets.",
+        "parameters": {
+            "type": "object",
+            "properties": {"query": {"type": "string"}},
+            "required": ["query"]
+        }
+    }
+}]
 
 
 # ======================================================
-# RAG FUNCTIONS
+# PROMPTS (shared with rag_agent_async)
 # ======================================================
-def retrieve_from_pinecone(query, k=3):
-    query_embedding = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=query
-    ).data[0].embedding
-
-    results = index.query(
-        vector=query_embedding,
-        top_k=k,
-        include_metadata=True
-    )
+def build_memory_text(session_id=DEFAULT_SESSION):
+    return prompt_builder.memory_block(session_id, memory.turns(session_id))
 
-    contexts = [m.metadata["text_chunk"] for m in results.matches]
-    return "\n\n".join(contexts)
 
+def build_context(query, texts, memory_text, expandable=False):
+    """Retrieved chunks, de-duplicated and cut to what the budget leaves."""
+    budget = prompt_builder.context_budget(build_rag_prompt(query, "", memory_text, expandable))
+    return prompt_builder.context_block(texts, budget)
+
+
+def context_texts(matches):
+    """Prompt texts for the matches, and whether any of them is a summary."""
+    if CONTEXT_MODE != "summary":
+        return [m.metadata["text_chunk"] for m in matches], False
+
+    summaries = get_summaries()
+    texts, summarized = [], False
+    for rank, m in enumerate(matches):
+        summary = m.metadata.get("summary") or summaries.get(m.id)
+        if rank < SUMMARY_FULL_HITS or not summary:
+            texts.append(m.metadata["text_chunk"])
+        else:
+            texts.append(f"(summary) {summary}")
+            summarized = True
+    return texts, summarized
+
+
+def build_rag_request(query, texts, memory_text, expandable=False):
+    context = build_context(query, texts, memory_text, expandable)
+    return {
+        "model": "gpt-3.5-turbo",
+        "messages": [{"role": "user", "content": build_rag_prompt(query, context, memory_text, expandable)}],
+        "temperature": 0.2,
+    }
+
+
+def build_rag_requests(query, matches, memory_text):
+    """The RAG request, and the full-text request to send if the model
+    answers NEED_DETAIL (None when the context has no summaries)."""
+    texts, summarized = context_texts(matches)
+    request = build_rag_request(query, texts, memory_text, expandable=summarized)
+    if not summarized:
+        return request, None
+    return request, build_rag_request(query, [m.metadata["text_chunk"] for m in matches], memory_text)
 
-def answer_question(query):
-    """REAL RAG (same as notebook)"""
-    context = retrieve_from_pinecone(query)
 
-    # Build memory text
-    memory_text = ""
-    for turn in conversation_history[-5:]:
-        memory_text += f"USER: {turn['question']}\nASSISTANT: {turn['answer']}\n\n"
+def needs_detail(answer):
+    return answer.strip().startswith(NEED_DETAIL)
 
-    prompt = f"""
+
+def build_rag_prompt(query, context, memory_text, expandable=False):
+    detail = (
+        f'\nEntries marked (summary) are shortened. If they are too short to answer, reply only: "{NEED_DETAIL}"\n'
+        if expandable else ""
+    )
+    return f"""
 You are a helpful assistant answering questions about YouTube videos.
 
 You have TWO sources:
@@ -73,19 +469,322 @@ You have TWO sources:
 QUESTION: {query}
 
 If the answer is not in the context but is in the conversation memory, use the memory.
-If it is in neither, say: "The video does not explain this clearly."
-"""
+If it is in neither, say: "{NO_ANSWER}"
+{detail}"""
+
+
+def build_agent_messages(query, memory_text, presearch=None, videos_tried=True):
+    """Agent conversation; presearch (results of searching the question
+    as asked) is included as an earlier internet_search call.
+
+    videos_tried=False (routed straight to search): the model may decline
+    by replying without a tool call, and the videos answer instead.
+    """
+    if videos_tried:
+        instructions = "The videos do not answer this question. Use internet_search"
+    else:
+        instructions = ("If this question is about the content of the blockchain videos rather "
+                        "than current events, reply without calling a tool. Otherwise use internet_search")
+    messages = [
+        {"role": "system",
+         "content": f"{instructions} (several searches at once if the question has several parts) "
+                    "and write a clean answer from the results."},
+        {"role": "assistant", "content": f"MEMORY:\n{memory_text}"},
+        {"role": "user", "content": query}
+    ]
+    if presearch is not None:
+        calls = [{"id": "presearch", "query": query}]
+        messages.append(assistant_tool_message(calls))
+        messages.extend(tool_messages(calls, [presearch]))
+    return messages
+
+
+def assistant_tool_message(calls):
+    return {
+        "role": "assistant",
+        "content": None,
+        "tool_calls": [
+            {"id": c["id"], "type": "function",
+             "function": {"name": "internet_search", "arguments": json.dumps({"query": c["query"]})}}
+            for c in calls
+        ],
+    }
+
+
+def requested_searches(tool_calls, query):
+    """[{"id", "query"}] for the model's tool calls, capped at AGENT_MAX_TOOL_CALLS."""
+    calls = []
+    for tool_call in tool_calls:
+        try:
+            term = json.loads(tool_call["arguments"] or "{}").get("query") or query
+        except ValueError:
+            term = query
+        calls.append({"id": tool_call["id"], "query": term})
+    return calls[:AGENT_MAX_TOOL_CALLS]
+
+
+def tool_messages(calls, results):
+    """Tool messages for the results; raises if every search failed."""
+    if results and all(isinstance(r, BaseException) for r in results):
+        raise results[0]
+    return [
+        {"role": "tool", "tool_call_id": c["id"],
+         "content": "Search failed." if isinstance(r, BaseException) else r}
+        for c, r in zip(calls, results)
+    ]
 
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.2,
-    )
 
-    answer = response.choices[0].message.content
+def agent_request(messages, final_round):
+    """One agent completion; on the final round it must answer, not search."""
+    return {
+        "model": AGENT_MODEL,
+        "messages": messages,
+        "tools": SEARCH_TOOLS,
+        "tool_choice": "none" if final_round else "auto",
+    }
+
+
+def agent_rounds(presearch):
+    """Completions allowed this turn. Without a presearch a first reply
+    without tool calls is a decline, so one more round must be able to answer."""
+    return AGENT_MAX_ROUNDS if presearch is not None else max(2, AGENT_MAX_ROUNDS)
+
+
+def is_final_round(round_, rounds):
+    return round_ >= rounds - 1 or remaining() < AGENT_ANSWER_RESERVE
+
+
+def degraded_answer(matches):
+    """Answer without the LLM: quote the best retrieved chunk."""
+    if not matches:
+        return NO_ANSWER
+    meta = matches[0].metadata
+    excerpt = " ".join(meta["text_chunk"].split()[:DEGRADED_WORDS])
+    return f'{DEGRADED_NOTE}\n\n"{excerpt} ..."\n\n({meta.get("video_title", "")}, {meta.get("start_time", "")})'
+
+
+def is_degraded(answer):
+    return answer.startswith(DEGRADED_NOTE)
+
+
+def with_sources(answer, matches):
+    """RAG answer + deep links to the spans it was built from."""
+    if not DEEP_LINKS or answer.strip() == NO_ANSWER or is_degraded(answer) or needs_detail(answer):
+        return answer
+    sources = citations(matches)
+    return f"{answer}\n\n{sources}" if sources else answer
+
+
+def without_sources(answer):
+    """Undo with_sources: memory keeps the answer without its links."""
+    head, sep, tail = answer.rpartition("\n\nSources: ")
+    return head if sep and "\n" not in tail else answer
+
+
+def format_search_results(result):
+    if "organic_results" in result:
+        return "\n".join([r.get("snippet", "") for r in result["organic_results"][:3]])
+
+    return "No results found."
+
+
+# ======================================================
+# RAG FUNCTIONS
+# ======================================================
+def _request_embedding(text, timeout):
+    def request():
+        return get_client().embeddings.create(model=EMBEDDING_MODEL, input=text, timeout=timeout)
+
+    return hedged(request, HEDGE_AFTER) if HEDGE_AFTER > 0 else request()
+
+
+def _create_embedding(text):
+    start = time.perf_counter()
+    try:
+        with span("embedding"):
+            response = call(
+                lambda timeout: _request_embedding(text, timeout),
+                EMBEDDING_TIMEOUT, breakers["embedding"]
+            )
+    except upstream_errors():
+        fast_path.record_embedding(time.perf_counter() - start, ok=False)
+        raise
+    fast_path.record_embedding(time.perf_counter() - start)
+    record_usage(EMBEDDING_MODEL, response.usage)
+    return response.data[0].embedding
+
+
+def embed_query(query):
+    return get_embedding_cache().get_or_create(query, EMBEDDING_MODEL, _create_embedding)
+
+
+def lexical_matches(query, k, lexical, filters=None):
+    """BM25 matches when the lexical fast path applies, else None."""
+    if lexical is None:
+        return None
+    if RETRIEVAL_MODE == "lexical":
+        with span("bm25"):
+            return lexical.query(query, k, filter=build_filter(filters)).matches
+    if fast_path.lexical_only(query, lexical) or breakers["embedding"].state == "open":
+        # No keyword hit at all: let the vectors try
+        with span("bm25"):
+            return lexical.query(query, k, filter=build_filter(filters)).matches or None
+    return None
+
+
+def fuse_matches(query, vector_matches, lexical, k, filters=None):
+    if lexical is None:
+        return vector_matches[:k]
+    with span("bm25"):
+        lexical_ranked = lexical.query(query, HYBRID_CANDIDATES, filter=build_filter(filters)).matches
+    return reciprocal_rank_fusion([vector_matches, lexical_ranked], top_k=k)
+
+
+# Scoped retrieval (see filters.py): local indexes filter on the whole
+# scope; Pinecone gets video_title / url only (its timestamps are
+# strings), so a time range is over-fetched and applied to the results.
+TIME_FILTER_OVERFETCH = 4
+
+
+def index_filter(filters):
+    return build_filter(filters, time_fields=RETRIEVER_BACKEND in LOCAL_BACKENDS)
+
+
+def vector_top_k(k, filters):
+    if RETRIEVER_BACKEND not in LOCAL_BACKENDS and has_time_range(filters):
+        return k * TIME_FILTER_OVERFETCH
+    return k
+
+
+def scope_matches(matches, filters):
+    if RETRIEVER_BACKEND not in LOCAL_BACKENDS and has_time_range(filters):
+        return [m for m in matches if in_scope(m.metadata, filters)]
+    return matches
+
+
+def candidate_count(k):
+    return max(k, RERANK_CANDIDATES) if get_reranker() is not None else k
+
+
+def rerank_matches(query, query_embedding, matches, k):
+    reranker = get_reranker()
+    if reranker is None:
+        return merge_spans(matches[:k])
+    with span("rerank"):
+        return merge_spans(reranker.rerank(query, query_embedding, matches, k))
+
+
+def merge_spans(matches):
+    return merge_adjacent(matches) if MERGE_ADJACENT else matches
+
+
+def timeline_matches(query, k, filters=None):
+    """Chunks of the time range a question names ("around minute 12"), else None."""
+    timeline = get_timeline()
+    if timeline is None:
+        return None
+    with span("timeline"):
+        matches = timeline.lookup(query, limit=k, filters=filters)
+    return merge_spans(matches) if matches else None
+
+
+def retrieve_matches(query, k=3, filters=None):
+    """Query embedding (None on the lexical path) + top-k matches (id, score, metadata).
+
+    filters: optional scope, e.g. {"video_title": ..., "start": 60, "end": 300}.
+    """
+    matches = timeline_matches(query, k, filters)
+    if matches is not None:
+        return None, matches
+
+    lexical = get_lexical_index()
+    pool = candidate_count(k)
+
+    matches = lexical_matches(query, pool, lexical, filters)
+    if matches is not None:
+        return None, rerank_matches(query, None, matches, k)
+
+    try:
+        query_embedding = embed_query(query)
+        with span("vector_query"):
+            results = call(
+                lambda timeout: get_index().query(
+                    vector=query_embedding.tolist(),
+                    top_k=vector_top_k(pool if lexical is None else max(pool, HYBRID_CANDIDATES), filters),
+                    include_metadata=True,
+                    filter=index_filter(filters),
+                    _request_timeout=timeout
+                ),
+                VECTOR_TIMEOUT, breakers["vector"]
+            )
+    except upstream_errors():
+        # Embedding service or vector index down: degrade to keyword retrieval
+        if lexical is None:
+            raise
+        return None, rerank_matches(query, None, lexical.query(query, pool, filter=build_filter(filters)).matches, k)
+
+    candidates = fuse_matches(query, scope_matches(results.matches, filters), lexical, pool, filters)
+    return query_embedding, rerank_matches(query, query_embedding, candidates, k)
+
+
+def retrieve_from_pinecone(query, k=3, filters=None):
+    _, matches = retrieve_matches(query, k, filters)
+
+    contexts = [m.metadata["text_chunk"] for m in matches]
+    return "\n\n".join(contexts)
+
+
+def generate_rag_answer(query, session_id=DEFAULT_SESSION, filters=None):
+    """RAG answer without touching conversation memory.
+
+    Falls back to quoting the best chunk when the LLM is unreachable.
+    """
+    try:
+        query_embedding, matches = retrieve_matches(query, filters=filters)
+    except upstream_errors():
+        return NO_ANSWER
+    return answer_from_matches(query, query_embedding, matches, session_id)
+
+
+def _complete(request, stage):
+    with span(stage):
+        response = call(
+            lambda timeout: get_client().chat.completions.create(timeout=timeout, **request),
+            COMPLETION_TIMEOUT, breakers["completion"]
+        )
+    record_usage(request["model"], response.usage)
+    return response.choices[0].message.content
+
+
+def answer_from_matches(query, query_embedding, matches, session_id=DEFAULT_SESSION):
+    """Completion half of generate_rag_answer, for callers that retrieved already."""
+    chunk_ids = [m.id for m in matches]
+    memory_text = build_memory_text(session_id)
+    context = fingerprint(memory_text)  # answers depend on this chat's history too
+
+    answer = answer_cache.lookup(query_embedding, chunk_ids, context)
+    if answer is not None:
+        return with_sources(answer, matches)
+
+    request, detail_request = build_rag_requests(query, matches, memory_text)
+
+    try:
+        answer = _complete(request, "rag_completion")
+        if detail_request is not None and needs_detail(answer):
+            answer = _complete(detail_request, "rag_detail_completion")
+    except upstream_errors():
+        return degraded_answer(matches)
+
+    answer_cache.store(query_embedding, chunk_ids, answer, context)
+    return with_sources(answer, matches)
+
+
+def answer_question(query, session_id=DEFAULT_SESSION):
+    """REAL RAG (same as notebook)"""
+    answer = generate_rag_answer(query, session_id)
 
     # Save memory
-    conversation_history.append({"question": query, "answer": answer})
+    memory.append(session_id, query, without_sources(answer))
 
     return answer
 
@@ -93,89 +792,183 @@ If it is in neither, say: "The video does not explain this clearly."
 # ======================================================
 # INTERNET SEARCH TOOL
 # ======================================================
-def internet_search(query):
-    params = {"q": query, "api_key": os.getenv("SERPAPI_KEY")}
-    result = GoogleSearch(params).get_dict()
+def _search_request(query, timeout):
+    response = get_http().get(
+        SERPAPI_URL,
+        params={"q": query, "engine": "google", "api_key": os.getenv("SERPAPI_KEY")},
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    return response.json()
 
-    if "organic_results" in result:
-        return "\n".join([r.get("snippet", "") for r in result["organic_results"][:3]])
 
-    return "No results found."
+def _fetch_search(query):
+    with span("search"):
+        result = call(lambda timeout: _search_request(query, timeout), SEARCH_TIMEOUT, breakers["search"])
+    return format_search_results(result)
+
+
+def internet_search(query):
+    return search_cache.get_or_fetch(query, _fetch_search)
 
 
 # ======================================================
-# AGENT (same logic as notebook)
+# AGENT
 # ======================================================
-def agent_with_search(query, rag_answer):
-    global conversation_history
-
-    # Build memory text again (agent also needs it)
-    memory_text = ""
-    for turn in conversation_history[-5:]:
-        memory_text += f"USER: {turn['question']}\nASSISTANT: {turn['answer']}\n\n"
-
-    # FOLLOW-UP DETECTION
-    followups = [
-        "give me an example", "another example",
-        "previous", "what was the previous",
-        "again", "repeat", "continue",
-        "elaborate", "what did you say before"
-    ]
+def search_agent(query, session_id=DEFAULT_SESSION, videos_tried=True):
+    """gpt-4o-mini answers from web search; None if it declines
+    or a service on the way is down.
+
+    videos_tried=False: routed here before RAG, so there is no presearch
+    and the model may decline (see build_agent_messages).
+    """
+    memory_text = build_memory_text(session_id)
+    context = fingerprint(memory_text)
+    cached = search_cache.answer(query, context)
+    if cached is not None:
+        return cached
+    try:
+        return _search_agent(query, memory_text, context, videos_tried)
+    except upstream_errors():
+        return None
+
+
+def _run_searches(calls):
+    """Run the requested searches in parallel; tool messages in call order."""
+    futures = [_tool_pool.submit(contextvars.copy_context().run, internet_search, c["query"]) for c in calls]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except upstream_errors() as e:
+            results.append(e)
+    return tool_messages(calls, results)
+
+
+def _search_agent(query, memory_text, context, videos_tried=True):
+    with request_budget(AGENT_BUDGET):
+        presearch = internet_search(query) if AGENT_PRESEARCH and videos_tried else None
+        messages = build_agent_messages(query, memory_text, presearch, videos_tried)
+
+        rounds = agent_rounds(presearch)
+        for round_ in range(rounds):
+            request = agent_request(messages, is_final_round(round_, rounds))
+            with span("agent_completion"):
+                response = call(
+                    lambda timeout: get_client().chat.completions.create(timeout=timeout, **request),
+                    COMPLETION_TIMEOUT, breakers["completion"]
+                )
+            record_usage(AGENT_MODEL, response.usage)
+            msg = response.choices[0].message
+
+            if not msg.tool_calls:
+                if presearch is None and round_ == 0:
+                    return None  # declined to search
+                answer = msg.content
+                break
+
+            calls = requested_searches(
+                [{"id": c.id, "arguments": c.function.arguments} for c in msg.tool_calls], query
+            )
+            messages.append(assistant_tool_message(calls))
+            messages.extend(_run_searches(calls))
+        else:
+            return None  # round cap reached while still searching
+
+    search_cache.store_answer(query, answer, context)
+    return answer
 
-    if any(f in query.lower() for f in followups):
-        if conversation_history:
-            last_answer = conversation_history[-1]["answer"]
-            conversation_history.append({"question": query, "answer": last_answer})
-            return last_answer, "MEMORY"
 
+def agent_with_search(query, rag_answer, session_id=DEFAULT_SESSION):
+    """After RAG: keep its answer if it knows, otherwise try internet search."""
     # USE RAG IF RAG KNOWS
-    if rag_answer.strip() != "The video does not explain this clearly.":
+    if is_degraded(rag_answer):
+        return rag_answer, "FALLBACK"
+    if rag_answer.strip() != NO_ANSWER:
         return rag_answer, "RAG"
 
     # OTHERWISE USE INTERNET SEARCH AGENT
-    tools = [{
-        "type": "function",
-        "function": {
-            "name": "internet_search",
-            "description": "Search online.",
-            "parameters": {
-                "type": "object",
-                "properties": {"query": {"type": "string"}},
-                "required": ["query"]
-            }
-        }
-    }]
-
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system",
-             "content": "If RAG does not know answer, call internet_search and rewrite results."},
-            {"role": "assistant", "content": f"MEMORY:\n{memory_text}"},
-            {"role": "user", "content": query}
-        ],
-        tools=tools,
-        tool_choice="auto"
-    )
-
-    msg = response.choices[0].message
+    final = search_agent(query, session_id)
+    if final is not None:
+        return final, "SEARCH"
 
-    if msg.tool_calls:
-        args = json.loads(msg.tool_calls[0].function.arguments)
-        term = args.get("query", query)
+    return rag_answer, "FALLBACK"
 
-        raw = internet_search(term)
 
-        refined = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Rewrite search results into a clean answer."},
-                {"role": "assistant", "content": raw},
-                {"role": "user", "content": query}
-            ]
+# ======================================================
+# WARM-UP (before the first request)
+# ======================================================
+# WARMUP_QUERIES: optional text file, one question per line, embedded
+# in one batch so their first lookup is an embedding-cache hit.
+WARMUP_QUERIES = os.getenv("WARMUP_QUERIES")
+
+
+def _embed_warmup_queries():
+    with open(WARMUP_QUERIES, "r", encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip()]
+    cache = get_embedding_cache()
+    missing = [q for q in queries if cache.get(q, EMBEDDING_MODEL) is None]
+    for start in range(0, len(missing), 100):
+        batch = missing[start:start + 100]
+        response = call(
+            lambda timeout: get_client().embeddings.create(model=EMBEDDING_MODEL, input=batch, timeout=timeout),
+            EMBEDDING_TIMEOUT, breakers["embedding"]
         )
+        for query, item in zip(batch, response.data):
+            cache.put(query, EMBEDDING_MODEL, item.embedding)
+
+
+def warm_up(network=True):
+    """Build clients and indexes, open connections and prime caches
+    so the first user on a new worker is served like any other.
+
+    Returns {step: seconds}; a step that failed upstream is None.
+    """
+    steps = [
+        ("vector_index", get_index),
+        ("embedding_cache", get_embedding_cache),
+        ("lexical_index", get_lexical_index),
+        ("timeline", get_timeline),
+        ("reranker", get_reranker),
+        ("token_counter", lambda: prompt_builder.counter.count("warm up")),
+    ]
+    if network:
+        steps.append(("openai", lambda: get_client().models.list(timeout=EMBEDDING_TIMEOUT)))
+        if RETRIEVER_BACKEND not in LOCAL_BACKENDS:
+            steps.append(("pinecone", lambda: get_index().describe_index_stats()))
+        if WARMUP_QUERIES:
+            steps.append(("warmup_queries", _embed_warmup_queries))
+    return timed_steps(steps, on_error=upstream_errors())
 
-        final = refined.choices[0].message.content
-        return final, "AGENT"
 
-    return rag_answer, "FALLBACK"
\ No newline at end of file
+# ======================================================
+# ONE CHAT TURN
+# ======================================================
+def memory_answer(session_id=DEFAULT_SESSION):
+    return memory.last_answer(session_id)
+
+
+def chat_turn(query, session_id=DEFAULT_SESSION, filters=None):
+    """Route first, then pay only for that route. Returns (answer, source).
+
+    The final answer is written to memory exactly once. filters scopes
+    retrieval (e.g. to the video picked in the UI, see video_scope).
+    """
+    with trace() as t, request_budget(REQUEST_BUDGET):
+        route = router.route(query, memory.turns(session_id))
+
+        if route == MEMORY:
+            final, source = memory_answer(session_id), "MEMORY"
+        elif route == SEARCH:
+            final, source = search_agent(query, session_id, videos_tried=False), "SEARCH"
+            if final is None:
+                # Agent declined (or search is down): answer from the videos after all
+                final = generate_rag_answer(query, session_id, filters)
+                source = "RAG" if final.strip() != NO_ANSWER and not is_degraded(final) else "FALLBACK"
+        else:
+            rag = generate_rag_answer(query, session_id, filters)
+            final, source = agent_with_search(query, rag, session_id)
+
+        memory.append(session_id, query, without_sources(final))
+        t.route = source
+    return final, source
@@ -0,0 +1,602 @@
+# ======================================================
+#                 rag_agent_async.py
+#      ASYNC RAG + MEMORY + AGENT + SEARCH PIPELINE
+# ======================================================
+#
+# Same prompts, caches and memory as rag_agent, but every network
+# call goes through an async client (AsyncOpenAI, Pinecone asyncio,
+# httpx for SerpAPI), so one event loop can serve many chats at once.
+#
+# Independent work overlaps:
+#   - the query is embedded while the Pinecone connection is opened
+#     and the memory block is assembled
+#   - with SPECULATIVE_SEARCH=1 the web search for a RAG-routed question
+#     starts while the RAG answer is generated, and is cancelled if RAG knows
+#   - all searches the agent asks for in one round run concurrently
+#
+# Timeouts, retries, hedging and circuit breakers are the ones
+# configured in rag_agent (see resilience.py).
+
+import os
+import time
+import asyncio
+
+import logging
+
+import httpx
+import numpy as np
+
+import rag_agent
+from rag_agent import (
+    EMBEDDING_MODEL, EMBEDDING_TIMEOUT, HYBRID_CANDIDATES, NO_ANSWER,
+    REQUEST_BUDGET, COMPLETION_TIMEOUT, VECTOR_TIMEOUT, SEARCH_TIMEOUT, HEDGE_AFTER,
+    SERPAPI_URL, breakers, upstream_errors,
+    get_embedding_cache, answer_cache, search_cache, memory, router, fast_path,
+    get_lexical_index, lexical_matches, fuse_matches, candidate_count, rerank_matches,
+    build_memory_text, build_rag_requests, needs_detail, NEED_DETAIL, build_agent_messages,
+    format_search_results, memory_answer,
+    AGENT_BUDGET, AGENT_PRESEARCH, agent_rounds, agent_request, is_final_round,
+    requested_searches, assistant_tool_message, tool_messages,
+    degraded_answer, is_degraded, timeline_matches, with_sources, without_sources,
+    index_filter, vector_top_k, scope_matches,
+)
+from router import MEMORY, SEARCH
+from answer_cache import fingerprint
+from filters import build_filter
+from telemetry import span, trace, observe, record_usage
+from resilience import acall, ahedged, request_budget, http_limits
+from clients import lazy
+from memory import DEFAULT_SESSION
+
+logger = logging.getLogger("chainmind.startup")
+
+SPECULATIVE_SEARCH = os.getenv("SPECULATIVE_SEARCH", "0") == "1"
+
+_async_index = None
+_index_lock = asyncio.Lock()
+_warm = None
+
+
+# ==============================
+# Clients (created on first use, inside the running loop)
+# ==============================
+@lazy
+def get_aclient():
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+    return AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(limits=http_limits()),
+    )
+
+
+async def get_index():
+    """Pinecone asyncio index, or the in-process index for RETRIEVER_BACKEND=local / segment."""
+    global _async_index
+
+    if rag_agent.RETRIEVER_BACKEND in rag_agent.LOCAL_BACKENDS:
+        return rag_agent.get_index()
+
+    async with _index_lock:
+        if _async_index is None:
+            from pinecone import PineconeAsyncio
+
+            pc = PineconeAsyncio(api_key=os.getenv("PINECONE_API_KEY"))
+            description = await pc.describe_index("youtube-chunks")
+            _async_index = pc.IndexAsyncio(host=description.host)
+    return _async_index
+
+
+@lazy
+def get_http():
+    return httpx.AsyncClient(limits=http_limits(), timeout=httpx.Timeout(SEARCH_TIMEOUT))
+
+
+async def _warm_up():
+    timings = {}
+    steps = (
+        ("async_index", get_index),
+        ("async_openai", lambda: get_aclient().models.list(timeout=EMBEDDING_TIMEOUT)),
+    )
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            await step()
+        except upstream_errors():
+            timings[name] = None
+            continue
+        timings[name] = time.perf_counter() - start
+    logger.info("async warm-up: %s", timings)
+
+
+async def warm_up():
+    """Async half of rag_agent.warm_up: opens the clients bound to the
+    serving event loop. Cheap to call on every page load; runs once."""
+    global _warm
+    if _warm is None:
+        _warm = asyncio.ensure_future(_warm_up())
+    await asyncio.shield(_warm)
+
+
+# ======================================================
+# RAG FUNCTIONS
+# ======================================================
+async def _request_embedding(query, timeout):
+    def request():
+        return get_aclient().embeddings.create(model=EMBEDDING_MODEL, input=query, timeout=timeout)
+
+    return await (ahedged(request, HEDGE_AFTER) if HEDGE_AFTER > 0 else request())
+
+
+async def embed_query(query):
+    vector = get_embedding_cache().get(query, EMBEDDING_MODEL)
+    if vector is None:
+        start = time.perf_counter()
+        try:
+            with span("embedding"):
+                response = await acall(
+                    lambda timeout: _request_embedding(query, timeout),
+                    EMBEDDING_TIMEOUT, breakers["embedding"]
+                )
+        except upstream_errors():
+            fast_path.record_embedding(time.perf_counter() - start, ok=False)
+            raise
+        fast_path.record_embedding(time.perf_counter() - start)
+        record_usage(EMBEDDING_MODEL, response.usage)
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        get_embedding_cache().put(query, EMBEDDING_MODEL, vector)
+    return vector
+
+
+async def query_index(query_embedding, k=3, filters=None):
+    index = await get_index()
+    with span("vector_query"):
+        if rag_agent.RETRIEVER_BACKEND in rag_agent.LOCAL_BACKENDS:
+            # Sub-millisecond NumPy search, no need to leave the loop
+            return index.query(
+                vector=query_embedding, top_k=k, include_metadata=True, filter=index_filter(filters)
+            ).matches
+
+        results = await acall(
+            lambda timeout: index.query(
+                vector=query_embedding.tolist(),
+                top_k=vector_top_k(k, filters),
+                include_metadata=True,
+                filter=index_filter(filters),
+                _request_timeout=timeout
+            ),
+            VECTOR_TIMEOUT, breakers["vector"]
+        )
+        return scope_matches(results.matches, filters)
+
+
+async def _rerank(query, query_embedding, matches, k):
+    reranker = rag_agent.get_reranker()
+    if reranker is not None and reranker.cross_encoder is not None:
+        # Cross-encoder inference is CPU-bound: keep it off the event loop
+        # (to_thread copies the context, so its span joins this turn's trace)
+        return await asyncio.to_thread(rerank_matches, query, query_embedding, matches, k)
+    return rerank_matches(query, query_embedding, matches, k)
+
+
+async def retrieve_matches(query, k=3, filters=None):
+    """Query embedding (None on the lexical path) + top-k matches."""
+    matches = timeline_matches(query, k, filters)
+    if matches is not None:
+        return None, matches
+
+    lexical = get_lexical_index()
+    pool = candidate_count(k)
+
+    matches = lexical_matches(query, pool, lexical, filters)
+    if matches is not None:
+        return None, await _rerank(query, None, matches, k)
+
+    embed_task = asyncio.create_task(embed_query(query))
+    index_task = asyncio.create_task(get_index())
+    try:
+        query_embedding, _ = await asyncio.gather(embed_task, index_task)
+        vector_matches = await query_index(
+            query_embedding, pool if lexical is None else max(pool, HYBRID_CANDIDATES), filters
+        )
+    except upstream_errors():
+        # Embedding service or vector index down: degrade to keyword retrieval
+        if lexical is None:
+            raise
+        return None, await _rerank(query, None, lexical.query(query, pool, filter=build_filter(filters)).matches, k)
+
+    candidates = fuse_matches(query, vector_matches, lexical, pool, filters)
+    return query_embedding, await _rerank(query, query_embedding, candidates, k)
+
+
+async def retrieve_from_pinecone(query, k=3, filters=None):
+    _, matches = await retrieve_matches(query, k, filters)
+    return "\n\n".join(m.metadata["text_chunk"] for m in matches)
+
+
+async def prepare_rag(query, session_id=DEFAULT_SESSION, filters=None):
+    """Retrieve and build the RAG request.
+
+    Returns (cached_answer, request_kwargs, cache_key, fallback_answer,
+    detail_request, matches); exactly one of cached_answer /
+    request_kwargs is None. fallback_answer is what to show if the
+    completion call fails, detail_request (summary context only) what to
+    send if the model answers NEED_DETAIL, and matches what the answer's
+    source links point to.
+    """
+    retrieve_task = asyncio.create_task(retrieve_matches(query, filters=filters))
+    memory_text = build_memory_text(session_id)  # assembled while retrieval is in flight
+
+    try:
+        query_embedding, matches = await retrieve_task
+    except upstream_errors():
+        return NO_ANSWER, None, None, None, None, []
+    chunk_ids = [m.id for m in matches]
+    cache_key = (query_embedding, chunk_ids, fingerprint(memory_text))
+
+    answer = answer_cache.lookup(*cache_key)
+    if answer is not None:
+        return with_sources(answer, matches), None, cache_key, None, None, matches
+
+    request, detail_request = build_rag_requests(query, matches, memory_text)
+    return None, request, cache_key, degraded_answer(matches), detail_request, matches
+
+
+def _cache_answer(cache_key, answer):
+    query_embedding, chunk_ids, context = cache_key
+    answer_cache.store(query_embedding, chunk_ids, answer, context)
+
+
+async def _complete(request, stage):
+    with span(stage):
+        response = await acall(
+            lambda timeout: get_aclient().chat.completions.create(timeout=timeout, **request),
+            COMPLETION_TIMEOUT, breakers["completion"]
+        )
+    record_usage(request["model"], response.usage)
+    return response.choices[0].message.content
+
+
+async def generate_rag_answer(query, session_id=DEFAULT_SESSION, filters=None):
+    """RAG answer without touching conversation memory."""
+    answer, request, cache_key, fallback, detail_request, matches = await prepare_rag(query, session_id, filters)
+    if answer is not None:
+        return answer
+
+    try:
+        answer = await _complete(request, "rag_completion")
+        if detail_request is not None and needs_detail(answer):
+            answer = await _complete(detail_request, "rag_detail_completion")
+    except upstream_errors():
+        return fallback
+
+    _cache_answer(cache_key, answer)
+    return with_sources(answer, matches)
+
+
+async def stream_completion(stage="completion", tool_calls=None, **request):
+    """Yield content deltas of a streamed chat completion.
+
+    Records the stage span, its time to first token, and the token
+    usage sent in the stream's final chunk. Tool calls the model makes
+    are collected into `tool_calls` ([{"id", "arguments"}]) if given.
+    """
+    start = time.perf_counter()
+    first = True
+    with span(stage):
+        # Retries cover opening the stream; a failure mid-stream is raised
+        stream = await acall(
+            lambda timeout: get_aclient().chat.completions.create(
+                stream=True, stream_options={"include_usage": True}, timeout=timeout, **request
+            ),
+            COMPLETION_TIMEOUT, breakers["completion"]
+        )
+        async for chunk in stream:
+            if chunk.usage is not None:
+                record_usage(request["model"], chunk.usage)
+            if tool_calls is not None and chunk.choices and chunk.choices[0].delta.tool_calls:
+                for part in chunk.choices[0].delta.tool_calls:
+                    while len(tool_calls) <= part.index:
+                        tool_calls.append({"id": "", "arguments": ""})
+                    if part.id:
+                        tool_calls[part.index]["id"] = part.id
+                    if part.function is not None and part.function.arguments:
+                        tool_calls[part.index]["arguments"] += part.function.arguments
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first:
+                    observe(stage + "_first_token", time.perf_counter() - start)
+                    first = False
+                yield chunk.choices[0].delta.content
+
+
+async def stream_rag_answer(query, session_id=DEFAULT_SESSION, filters=None):
+    """Yield the RAG answer as it grows (full text so far on each step).
+
+    With a summary context, text that may still turn out to be the
+    NEED_DETAIL signal is held back; on that signal the full-text
+    request is streamed instead.
+    """
+    answer, request, cache_key, fallback, detail_request, matches = await prepare_rag(query, session_id, filters)
+    if answer is not None:
+        yield answer
+        return
+
+    answer, shown = "", ""
+    try:
+        async for delta in stream_completion("rag_completion", **request):
+            answer += delta
+            text = answer.strip()
+            if detail_request is not None and (NEED_DETAIL.startswith(text) or text.startswith(NEED_DETAIL)):
+                continue
+            shown = answer
+            yield shown
+
+        if detail_request is not None and needs_detail(answer):
+            answer = ""
+            async for delta in stream_completion("rag_detail_completion", **detail_request):
+                answer += delta
+                shown = answer
+                yield shown
+        elif answer != shown:
+            shown = answer
+            yield shown  # flush a short answer that was held back
+    except upstream_errors():
+        if not shown:
+            yield fallback
+        return  # a cut-off answer is shown but not cached
+    _cache_answer(cache_key, answer)
+    linked = with_sources(answer, matches)
+    if linked != answer:
+        yield linked
+
+
+async def answer_question(query, session_id=DEFAULT_SESSION):
+    answer = await generate_rag_answer(query, session_id)
+
+    # Save memory
+    memory.append(session_id, query, without_sources(answer))
+
+    return answer
+
+
+# ======================================================
+# INTERNET SEARCH TOOL
+# ======================================================
+async def _search_request(query, timeout):
+    response = await get_http().get(
+        SERPAPI_URL,
+        params={"q": query, "engine": "google", "api_key": os.getenv("SERPAPI_KEY")},
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def _fetch_search(query):
+    with span("search"):
+        result = await acall(
+            lambda timeout: _search_request(query, timeout), SEARCH_TIMEOUT, breakers["search"]
+        )
+    return format_search_results(result)
+
+
+async def internet_search(query):
+    return await search_cache.aget_or_fetch(query, _fetch_search)
+
+
+# ======================================================
+# AGENT
+# ======================================================
+async def _run_searches(calls):
+    """Run the requested searches concurrently; tool messages in call order."""
+    results = await asyncio.gather(*(internet_search(c["query"]) for c in calls), return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, upstream_errors()):
+            raise result
+    return tool_messages(calls, results)
+
+
+async def _presearch(query, prefetched_search, videos_tried=True):
+    """Results of searching the question as asked (the speculative search if running)."""
+    if not AGENT_PRESEARCH or not videos_tried:
+        return None
+    if prefetched_search is not None:
+        return await prefetched_search
+    return await internet_search(query)
+
+
+async def run_agent(query, prefetched_search=None, session_id=DEFAULT_SESSION, videos_tried=True):
+    """Yield the agent's answer as it grows; nothing if it declines to search.
+
+    Upstream errors propagate (callers fall back to RAG). videos_tried:
+    see rag_agent.search_agent.
+    """
+    with request_budget(AGENT_BUDGET):
+        presearch = await _presearch(query, prefetched_search, videos_tried)
+        messages = build_agent_messages(query, build_memory_text(session_id), presearch, videos_tried)
+
+        rounds = agent_rounds(presearch)
+        for round_ in range(rounds):
+            tool_calls, answer = [], ""
+            # Without a presearch, a first reply without tool calls means "declined"
+            show = presearch is not None or round_ > 0
+            async for delta in stream_completion(
+                "agent_completion", tool_calls=tool_calls, **agent_request(messages, is_final_round(round_, rounds))
+            ):
+                answer += delta
+                if show and not tool_calls:
+                    yield answer
+
+            if not tool_calls:
+                return
+
+            calls = requested_searches(tool_calls, query)
+            messages.append(assistant_tool_message(calls))
+            messages.extend(await _run_searches(calls))
+
+
+async def search_agent(query, prefetched_search=None, session_id=DEFAULT_SESSION, videos_tried=True):
+    """gpt-4o-mini answers from web search; None if it declines
+    or a service on the way is down."""
+    context = fingerprint(build_memory_text(session_id))
+    cached = search_cache.answer(query, context)
+    if cached is not None:
+        return cached
+
+    answer = None
+    try:
+        async for answer in run_agent(query, prefetched_search, session_id, videos_tried):
+            pass
+    except upstream_errors():
+        return None
+    if answer is None:
+        return None
+
+    search_cache.store_answer(query, answer, context)
+    return answer
+
+
+async def agent_with_search(query, rag_answer, prefetched_search=None, session_id=DEFAULT_SESSION):
+    """After RAG: keep its answer if it knows, otherwise try internet search."""
+    # USE RAG IF RAG KNOWS
+    if is_degraded(rag_answer):
+        return rag_answer, "FALLBACK"
+    if rag_answer.strip() != NO_ANSWER:
+        return rag_answer, "RAG"
+
+    # OTHERWISE USE INTERNET SEARCH AGENT
+    final = await search_agent(query, prefetched_search, session_id)
+    if final is not None:
+        return final, "SEARCH"
+
+    return rag_answer, "FALLBACK"
+
+
+# ======================================================
+# ONE CHAT TURN
+# ======================================================
+def _speculative_search(query):
+    return asyncio.create_task(internet_search(query)) if SPECULATIVE_SEARCH else None
+
+
+def _discard(search_task):
+    if search_task is not None:
+        if not search_task.done():
+            search_task.cancel()
+        elif not search_task.cancelled():
+            search_task.exception()  # unused speculation: swallow its error
+
+
+async def _rag_then_search(query, session_id, filters=None):
+    search_task = _speculative_search(query)
+    try:
+        rag = await generate_rag_answer(query, session_id, filters)
+        return await agent_with_search(query, rag, search_task, session_id)
+    finally:
+        _discard(search_task)
+
+
+async def chat_turn(query, session_id=DEFAULT_SESSION, filters=None):
+    """Route first, then pay only for that route. Returns (answer, source).
+
+    The final answer is written to memory exactly once. filters scopes
+    retrieval (see rag_agent.video_scope).
+    """
+    with trace() as t, request_budget(REQUEST_BUDGET):
+        route = router.route(query, memory.turns(session_id))
+
+        if route == MEMORY:
+            final, source = memory_answer(session_id), "MEMORY"
+        elif route == SEARCH:
+            final, source = await search_agent(query, session_id=session_id, videos_tried=False), "SEARCH"
+            if final is None:
+                # Agent declined (or search is down): answer from the videos after all
+                final = await generate_rag_answer(query, session_id, filters)
+                source = "RAG" if final.strip() != NO_ANSWER and not is_degraded(final) else "FALLBACK"
+        else:
+            final, source = await _rag_then_search(query, session_id, filters)
+
+        memory.append(session_id, query, without_sources(final))
+        t.route = source
+    return final, source
+
+
+# ======================================================
+# STREAMING TURN (for the Gradio UI)
+# ======================================================
+async def _stream_search(query, prefetched_search=None, session_id=DEFAULT_SESSION, videos_tried=True):
+    """Yield the search agent's answer as it grows; nothing if declined
+    or a service on the way is down."""
+    context = fingerprint(build_memory_text(session_id))
+    cached = search_cache.answer(query, context)
+    if cached is not None:
+        yield cached
+        return
+
+    answer = None
+    try:
+        async for answer in run_agent(query, prefetched_search, session_id, videos_tried):
+            yield answer
+    except upstream_errors():
+        return  # a cut-off answer is shown but not cached
+    if answer is not None:
+        search_cache.store_answer(query, answer, context)
+
+
+async def chat_turn_stream(query, session_id=DEFAULT_SESSION, filters=None):
+    """Yield (source, answer_so_far) as tokens arrive.
+
+    The source tag is yielded before any network call once the route is
+    known. A RAG answer is held back while it still reads like the
+    "does not explain" sentence, so a miss never flashes on screen
+    before the search answer replaces it.
+    """
+    with trace() as t, request_budget(REQUEST_BUDGET):
+        route = router.route(query, memory.turns(session_id))
+        final, source = "", route
+
+        if route == MEMORY:
+            final = memory_answer(session_id)
+            yield source, final
+
+        elif route == SEARCH:
+            yield source, ""
+            async for final in _stream_search(query, session_id=session_id, videos_tried=False):
+                yield source, final
+            if not final:
+                # Agent declined to search: answer from the videos after all
+                source = "RAG"
+                async for final in stream_rag_answer(query, session_id, filters):
+                    yield source, final
+                if final.strip() == NO_ANSWER or is_degraded(final):
+                    source = "FALLBACK"
+                    yield source, final
+
+        else:
+            yield source, ""
+            search_task = _speculative_search(query)
+            try:
+                async for final in stream_rag_answer(query, session_id, filters):
+                    if not NO_ANSWER.startswith(final.strip()):
+                        yield source, final
+
+                if is_degraded(final):
+                    source = "FALLBACK"
+                    yield source, final
+                elif final.strip() != NO_ANSWER:
+                    yield source, final  # flush a short answer that was held back
+                else:
+                    rag_answer, source = final, "SEARCH"
+                    yield source, ""
+                    final = ""
+                    async for final in _stream_search(query, search_task, session_id):
+                        yield source, final
+                    if not final:
+                        final, source = rag_answer, "FALLBACK"
+                        yield source, final
+            finally:
+                _discard(search_task)
+
+        memory.append(session_id, query, without_sources(final))
+        t.route = source
@@ -0,0 +1,120 @@
+# ======================================================
+#                      rerank.py
+#      POST-RETRIEVAL RE-RANKING: MMR + CROSS-ENCODER
+# ======================================================
+#
+# Retrieval over-fetches candidates; this stage keeps the few that
+# are relevant AND different from each other, so overlapping chunks
+# of the same video segment don't fill the prompt three times.
+#
+# Maximal marginal relevance works on the chunk vectors already
+# stored in the local index (vector_index.py) - no embedding calls.
+# Relevance is, in order of preference:
+#   1) an optional CPU cross-encoder (sentence-transformers), or
+#   2) cosine to the query embedding, or
+#   3) the retrieval scores (lexical-only path, no query embedding)
+
+import numpy as np
+
+MMR_LAMBDA = 0.7          # 1.0 = pure relevance, 0.0 = pure diversity
+DUPLICATE_SIMILARITY = 0.95  # candidates this close to a kept chunk are dropped
+
+
+def mmr(relevance, vectors, k, lambda_=MMR_LAMBDA, duplicate_similarity=DUPLICATE_SIMILARITY):
+    """Indices picked by maximal marginal relevance, best first.
+
+    relevance: [n] scores, vectors: [n, dim] unit rows. May return fewer
+    than k when the remaining candidates are near-duplicates.
+    """
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return []
+
+    relevance = np.asarray(relevance, dtype=np.float32)
+    sims = vectors @ vectors.T
+
+    selected = [int(np.argmax(relevance))]
+    max_sim = sims[selected[0]].copy()  # similarity to the closest selected chunk
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < k:
+        available &= max_sim < duplicate_similarity
+        if not available.any():
+            break
+        score = lambda_ * relevance - (1 - lambda_) * max_sim
+        score[~available] = -np.inf
+        best = int(np.argmax(score))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_sim, sims[best], out=max_sim)
+
+    return selected
+
+
+def _scaled(scores):
+    """Map arbitrary scores onto [0, 1] so they mix with cosine similarities."""
+    scores = np.asarray(scores, dtype=np.float32)
+    low, high = float(scores.min()), float(scores.max())
+    if high - low < 1e-9:
+        return np.ones_like(scores)
+    return (scores - low) / (high - low)
+
+
+class CrossEncoderReranker:
+    """Scores (query, chunk) pairs with a small CPU cross-encoder."""
+
+    def __init__(self, model_name="cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size=16):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError(
+                "CROSS_ENCODER_MODEL needs the 'sentence-transformers' package "
+                "(pip install sentence-transformers)"
+            ) from e
+
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.batch_size = batch_size
+
+    def score(self, query, texts):
+        pairs = [(query, t) for t in texts]
+        return np.asarray(self.model.predict(pairs, batch_size=self.batch_size), dtype=np.float32)
+
+
+class Reranker:
+    def __init__(self, vector_store=None, cross_encoder=None,
+                 lambda_=MMR_LAMBDA, duplicate_similarity=DUPLICATE_SIMILARITY):
+        self.vector_store = vector_store    # anything with get_vectors(ids)
+        self.cross_encoder = cross_encoder
+        self.lambda_ = lambda_
+        self.duplicate_similarity = duplicate_similarity
+
+    def rerank(self, query, query_embedding, matches, k=3):
+        if len(matches) <= 1:
+            return matches[:k]
+
+        if self.cross_encoder is not None:
+            relevance = _scaled(self.cross_encoder.score(
+                query, [m.metadata["text_chunk"] for m in matches]
+            ))
+        else:
+            relevance = None
+
+        rows = self.vector_store.get_vectors([m.id for m in matches]) if self.vector_store else None
+        if rows is None or any(r is None for r in rows):
+            # No stored vectors for these chunks: relevance order only
+            if relevance is None:
+                return matches[:k]
+            order = np.argsort(-relevance)[:k]
+            return [matches[i] for i in order.tolist()]
+
+        vectors = np.asarray(rows, dtype=np.float32)
+        if relevance is None:
+            if query_embedding is not None:
+                q = np.asarray(query_embedding, dtype=np.float32)
+                relevance = vectors @ (q / (np.linalg.norm(q) or 1.0))
+            else:
+                relevance = _scaled([m.score for m in matches])
+
+        picked = mmr(relevance, vectors, k, self.lambda_, self.duplicate_similarity)
+        return [matches[i] for i in picked]
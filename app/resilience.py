@@ -0,0 +1,306 @@
+# ======================================================
+#                    resilience.py
+#   DEADLINES, RETRIES, HEDGING AND CIRCUIT BREAKERS
+# ======================================================
+#
+# Every outbound call (OpenAI, Pinecone, SerpAPI) goes through
+# call() / acall():
+#   - its timeout is the stage cap, shortened to what is left of the
+#     chat turn's budget (request_budget), so one hung request can
+#     never pin a worker for longer than the turn is allowed to take
+#   - transient failures (timeouts, connection errors, 429, 5xx) are
+#     retried with full-jitter exponential backoff while budget remains
+#   - a per-service circuit breaker stops calling a failing service for
+#     `reset_timeout` seconds; callers catch CircuitOpenError and fall
+#     back to cached / lexical / degraded answers. A timeout only counts
+#     as a failure when the service had its full stage cap: when the
+#     turn's remaining budget was shorter, the turn ran out of time, not
+#     the service
+#
+# ahedged() / hedged() send a second identical request when the first
+# is slower than `hedge_after` and keep whichever answers first.
+
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import httpx
+import urllib3
+
+RETRY_ATTEMPTS = 3
+BASE_DELAY = 0.2
+MAX_DELAY = 2.0
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+# ======================================================
+# REQUEST BUDGET
+# ======================================================
+_deadline = contextvars.ContextVar("chainmind_deadline", default=None)
+
+
+@contextmanager
+def request_budget(seconds):
+    """Deadline for everything called inside (nested budgets only shrink it)."""
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        try:
+            _deadline.reset(token)
+        except ValueError:
+            _deadline.set(None)  # finished from another context (streaming consumer)
+
+
+def remaining():
+    deadline = _deadline.get()
+    return float("inf") if deadline is None else deadline - time.monotonic()
+
+
+def call_timeout(cap):
+    """Timeout for the next call: the stage cap, or less if the turn is nearly out of time."""
+    left = remaining()
+    if left <= 0:
+        raise DeadlineExceeded("request budget exhausted")
+    return min(cap, left)
+
+
+# ======================================================
+# RETRY POLICY
+# ======================================================
+def is_retryable(exc):
+    if isinstance(exc, (CircuitOpenError, DeadlineExceeded)):
+        return False
+    if isinstance(exc, (TimeoutError, ConnectionError, httpx.TransportError,
+                        urllib3.exceptions.TimeoutError, urllib3.exceptions.ProtocolError,
+                        urllib3.exceptions.MaxRetryError)):
+        return True
+
+    status = getattr(exc, "status_code", None) or getattr(exc, "status", None)
+    response = getattr(exc, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+
+    # openai.APIConnectionError / APITimeoutError carry no status
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def is_timeout(exc):
+    if isinstance(exc, (TimeoutError, httpx.TimeoutException, urllib3.exceptions.TimeoutError)):
+        return True
+    return type(exc).__name__ == "APITimeoutError"
+
+
+def backoff(attempt, base=BASE_DELAY, cap=MAX_DELAY):
+    """Full jitter: uniform in [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+# ======================================================
+# CIRCUIT BREAKER
+# ======================================================
+class CircuitBreaker:
+    """closed -> open after `failure_threshold` consecutive failures;
+    open -> half-open after `reset_timeout`; one trial call decides."""
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+    def release(self):
+        """End a half-open trial that said nothing about the service's
+        health (a 4xx, a cancelled call): the next call is the trial."""
+        with self._lock:
+            self._trial = False
+
+    def settle(self, error=None):
+        """Record how one call ended (error None = success)."""
+        if error is None:
+            self.record_success()
+        elif isinstance(error, Exception) and is_retryable(error):
+            self.record_failure()
+        else:
+            self.release()
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+
+# ======================================================
+# CALL WRAPPERS
+# ======================================================
+def _settle(breaker, error, budget_bound):
+    """breaker.settle(error), except that a timeout shortened by the
+    request budget says nothing about the service's health."""
+    if breaker is None:
+        return
+    if budget_bound and is_timeout(error):
+        breaker.release()
+    else:
+        breaker.settle(error)
+
+
+def call(fn, timeout_cap, breaker=None, attempts=RETRY_ATTEMPTS):
+    """Run fn(timeout) with deadline, retries and breaker (sync)."""
+    for attempt in range(attempts):
+        timeout = call_timeout(timeout_cap)
+        if breaker is not None:
+            breaker.check()
+        try:
+            result = fn(timeout)
+        except BaseException as e:
+            # Settle every outcome, or a half-open breaker whose trial
+            # call raised a 4xx or was interrupted would stay open
+            _settle(breaker, e, timeout < timeout_cap)
+            if not isinstance(e, Exception) or not is_retryable(e) or attempt == attempts - 1:
+                raise
+            delay = backoff(attempt)
+            if delay >= remaining():
+                raise
+            time.sleep(delay)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+
+async def acall(fn, timeout_cap, breaker=None, attempts=RETRY_ATTEMPTS):
+    """Await fn(timeout) with deadline, retries and breaker."""
+    for attempt in range(attempts):
+        timeout = call_timeout(timeout_cap)
+        if breaker is not None:
+            breaker.check()
+        try:
+            result = await asyncio.wait_for(fn(timeout), timeout)
+        except asyncio.TimeoutError as e:
+            budget_bound = timeout < timeout_cap
+            _settle(breaker, e, budget_bound)
+            if budget_bound or remaining() <= 0:
+                raise DeadlineExceeded(f"call exceeded {timeout:.2f}s") from e
+            if attempt == attempts - 1:
+                raise TimeoutError(str(e)) from e
+            await asyncio.sleep(min(backoff(attempt), max(0.0, remaining())))
+        except BaseException as e:
+            # Including CancelledError (client gone): see call()
+            _settle(breaker, e, timeout < timeout_cap)
+            if not isinstance(e, Exception) or not is_retryable(e) or attempt == attempts - 1:
+                raise
+            delay = backoff(attempt)
+            if delay >= remaining():
+                raise
+            await asyncio.sleep(delay)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+
+# ======================================================
+# HEDGED REQUESTS
+# ======================================================
+async def ahedged(fn, hedge_after):
+    """Await fn(); if it takes longer than hedge_after, race a second fn()."""
+    first = asyncio.ensure_future(fn())
+    done, _ = await asyncio.wait({first}, timeout=hedge_after)
+    if done:
+        return first.result()
+
+    pending = {first, asyncio.ensure_future(fn())}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+
+def hedged(fn, hedge_after):
+    """Sync ahedged(): the slower call finishes in the background."""
+    ctx = contextvars.copy_context()
+    first = _hedge_pool.submit(ctx.run, fn)
+    done, _ = wait({first}, timeout=hedge_after)
+    if done:
+        return first.result()
+
+    pending = {first, _hedge_pool.submit(contextvars.copy_context().run, fn)}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+# ======================================================
+# POOLED HTTP
+# ======================================================
+def http_limits(max_connections=100, max_keepalive=20, keepalive_expiry=30.0):
+    """Connection pool shared by every request of one client."""
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive,
+        keepalive_expiry=keepalive_expiry,
+    )
@@ -0,0 +1,131 @@
+# ======================================================
+#                      router.py
+#        PRE-RAG ROUTING: MEMORY / RAG / SEARCH
+# ======================================================
+#
+# Runs before any network call so each turn only pays for the
+# calls its route needs:
+#   MEMORY -> no calls (repeat / expand on the last answer)
+#   RAG    -> embedding + vector query + completion (search on a miss)
+#   SEARCH -> agent + web search, skipping the RAG completion
+#
+# Follow-up phrases decide first. An optional local classifier
+# (any callable: query -> (route, confidence)) decides next when it is
+# confident; time-sensitive keywords (whole words only, so "todays" or
+# "newsletter" don't count) are the fallback rule for SEARCH.
+
+import re
+import json
+import math
+from collections import Counter, defaultdict
+
+MEMORY = "MEMORY"
+RAG = "RAG"
+SEARCH = "SEARCH"
+
+# FOLLOW-UP DETECTION phrases
+FOLLOWUPS = [
+    "give me an example", "another example",
+    "previous", "what was the previous",
+    "again", "repeat", "continue",
+    "elaborate", "what did you say before"
+]
+
+# Time-sensitive questions the video transcripts can't answer
+SEARCH_KEYWORDS = [
+    "latest", "today", "right now", "this week", "this month",
+    "news", "current price", "price of", "released yesterday",
+]
+
+WORD_RE = re.compile(r"[a-z0-9][a-z0-9\-']*")
+
+
+def tokenize(text):
+    return WORD_RE.findall(text.lower())
+
+
+def phrase_pattern(phrases):
+    """One regex matching any phrase as whole words."""
+    return re.compile(r"\b(?:" + "|".join(re.escape(p) for p in phrases) + r")\b")
+
+
+class Router:
+    def __init__(self, followups=None, search_keywords=None, classifier=None, min_confidence=0.7):
+        self.followups = FOLLOWUPS if followups is None else followups
+        self.search_keywords = SEARCH_KEYWORDS if search_keywords is None else search_keywords
+        self._search_re = phrase_pattern(self.search_keywords) if self.search_keywords else None
+        self.classifier = classifier
+        self.min_confidence = min_confidence
+
+    def is_followup(self, query):
+        return any(f in query.lower() for f in self.followups)
+
+    def route(self, query, history=()):
+        q = query.lower()
+
+        if self.is_followup(query):
+            # Nothing to follow up on yet: treat it as a normal question
+            return MEMORY if history else RAG
+
+        if self.classifier is not None:
+            label, confidence = self.classifier(query)
+            if confidence >= self.min_confidence and (label != MEMORY or history):
+                return label
+
+        if self._search_re is not None and self._search_re.search(q):
+            return SEARCH
+
+        return RAG
+
+
+# ======================================================
+# CHEAP LOCAL CLASSIFIER
+# ======================================================
+class NaiveBayesClassifier:
+    """Multinomial naive Bayes over word counts, trained on labelled examples.
+
+    Example file (JSONL): {"text": "what's the latest ETH price", "route": "SEARCH"}
+    """
+
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+        self.word_counts = defaultdict(Counter)
+        self.label_counts = Counter()
+        self.vocab = set()
+
+    def fit(self, examples):
+        for text, label in examples:
+            words = tokenize(text)
+            self.word_counts[label].update(words)
+            self.label_counts[label] += 1
+            self.vocab.update(words)
+        return self
+
+    @classmethod
+    def from_jsonl(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            examples = [json.loads(line) for line in f if line.strip()]
+        return cls().fit((e["text"], e["route"]) for e in examples)
+
+    def __call__(self, query):
+        if not self.label_counts:
+            return RAG, 0.0
+
+        words = tokenize(query)
+        total = sum(self.label_counts.values())
+        vocab_size = len(self.vocab) or 1
+
+        log_probs = {}
+        for label, count in self.label_counts.items():
+            counts = self.word_counts[label]
+            denom = sum(counts.values()) + self.alpha * vocab_size
+            lp = math.log(count / total)
+            for w in words:
+                lp += math.log((counts[w] + self.alpha) / denom)
+            log_probs[label] = lp
+
+        # Softmax over labels for a confidence in [0, 1]
+        top = max(log_probs.values())
+        exp = {label: math.exp(lp - top) for label, lp in log_probs.items()}
+        label = max(exp, key=exp.get)
+        return label, exp[label] / sum(exp.values())
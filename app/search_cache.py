@@ -0,0 +1,161 @@
+# ======================================================
+#                   search_cache.py
+#      TTL + LRU CACHE AND SINGLE-FLIGHT FOR WEB SEARCH
+# ======================================================
+#
+# Keyed on the normalized query ("What is  Base?" == "what is base"),
+# one entry holds:
+#   - "snippets": the formatted SerpAPI snippets for that search term
+#   - "answer":   the gpt-4o-mini refined answer for that question
+#
+# The agent also sees the session's memory, so answers take a `context`
+# (answer_cache.fingerprint of the memory block): an answer written with
+# memory lives under (query, context) and is only reused by a session
+# with the same memory. Snippets do not depend on memory.
+#
+# Entries expire after `ttl` seconds (search results go stale, so this
+# is much shorter than the answer cache) and the least recently used
+# are evicted past `max_entries`.
+#
+# get_or_fetch / aget_or_fetch coalesce concurrent misses on the same
+# key: one caller runs fetch(), the others wait for its result. Failed
+# fetches are not cached.
+
+import re
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+
+SEARCH_CACHE_TTL = 900
+SEARCH_CACHE_SIZE = 1000
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+
+
+def normalize_query(query):
+    return " ".join(_PUNCT_RE.sub(" ", query.lower()).split())
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SearchCache:
+    def __init__(self, ttl=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()  # key -> {"snippets", "answer", "created_at"}
+        self._flights = {}             # key -> _Flight (threads)
+        self._tasks = {}               # key -> asyncio.Task (event loop)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    # ------------------------------
+    # Entries
+    # ------------------------------
+    def _get(self, key, field):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry["created_at"] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None or entry.get(field) is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[field]
+
+    def _put(self, key, field, value):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry["created_at"] > self.ttl:
+                entry = self._entries[key] = {"snippets": None, "answer": None, "created_at": time.time()}
+            entry[field] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def snippets(self, query):
+        return self._get(normalize_query(query), "snippets")
+
+    def _answer_key(self, query, context):
+        key = normalize_query(query)
+        return (key, context) if context else key
+
+    def answer(self, query, context=""):
+        return self._get(self._answer_key(query, context), "answer")
+
+    def store_answer(self, query, answer, context=""):
+        self._put(self._answer_key(query, context), "answer", answer)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # ------------------------------
+    # Single-flight snippet lookups
+    # ------------------------------
+    def get_or_fetch(self, query, fetch):
+        """Cached snippets, or fetch(query) run once for all concurrent callers."""
+        key = normalize_query(query)
+        cached = self._get(key, "snippets")
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fetch(query)
+            self._put(key, "snippets", flight.result)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def aget_or_fetch(self, query, fetch):
+        """Async get_or_fetch; fetch(query) is a coroutine function.
+
+        The shared fetch runs in its own task, so a caller that is
+        cancelled (e.g. a discarded speculative search) does not cancel
+        it for the others.
+        """
+        key = normalize_query(query)
+        cached = self._get(key, "snippets")
+        if cached is not None:
+            return cached
+
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.create_task(self._afetch(key, query, fetch))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())  # no waiters left
+        return await asyncio.shield(task)
+
+    async def _afetch(self, key, query, fetch):
+        try:
+            result = await fetch(query)
+            self._put(key, "snippets", result)
+            return result
+        finally:
+            self._tasks.pop(key, None)
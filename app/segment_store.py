@@ -0,0 +1,371 @@
+# ======================================================
+#                   segment_store.py
+#    COMPACT BINARY CORPUS SEGMENT (QUANTIZED, MMAPPED)
+# ======================================================
+#
+# One file holds the whole corpus (chunk text, metadata and embeddings)
+# as flat columns, so opening it is a memory map plus a small JSON
+# header: no per-chunk parsing and no Python dicts until a chunk is
+# actually returned by a query.
+#
+# Layout:
+#   MAGIC, uint32 header length, JSON header, then 64-byte aligned
+#   columns described in the header (dtype, shape, offset):
+#     ids_offsets / ids_blob          chunk ids (UTF-8, offsets int64)
+#     strings_offsets / strings_blob  interned video titles and urls
+#     title_ref, url_ref              int32 rows into the string table
+#     start_ms, end_ms                int32 milliseconds
+#     text_offsets / text_blob        text_chunk
+#     summary_offsets / summary_blob  summary ("" when missing)
+#     extra_offsets / extra_blob      other metadata keys as JSON ("" if none)
+#     codes                           int8 or float16 [n, dim] embeddings
+#     scales                          float32 [n] (int8 only)
+#     full                            float32 [n, dim] (optional, for re-scoring)
+#
+# int8 rows are L2-normalised, then scaled by their largest component,
+# so 1536 dims take 1.5 KB instead of 6 KB. With a "full" column, the
+# best RESCORE_FACTOR * top_k candidates of the quantized scan are
+# re-scored in float32, touching only those rows of the file.
+#
+# SegmentIndex.query() mirrors LocalVectorIndex.query() (and Pinecone's),
+# so rag_agent can use it with RETRIEVER_BACKEND=segment. A filter on
+# video_title / url scans only the rows with that string reference.
+#
+# Usage:
+#   python app/segment_store.py                        # output/vector_index -> output/corpus.seg
+#   python app/segment_store.py --quantize float16 --full
+
+import os
+import json
+import struct
+import argparse
+
+import numpy as np
+
+from vector_index import Match, QueryResult, normalize_rows, _top_k
+from chunking import timestamp_seconds
+from filters import Partitions
+
+MAGIC = b"CMSEG\x00\x01\x00"
+FORMAT_VERSION = 1
+ALIGN = 64
+QUANTIZATIONS = ("int8", "float16")
+RESCORE_FACTOR = 4
+SCAN_BLOCK = 4096  # rows converted to float32 at a time during a scan
+
+KNOWN_KEYS = ("video_title", "url", "text_chunk", "start_time", "end_time", "summary")
+
+
+def format_timestamp(ms):
+    """1234567 -> '00:20:34.567' (the layout of the .vtt derived data)."""
+    seconds, ms = divmod(int(ms), 1000)
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
+
+
+def quantize(vectors, quantization="int8"):
+    """Normalised rows -> (codes, scales or None)."""
+    vectors = normalize_rows(vectors)
+    if quantization == "float16":
+        return vectors.astype(np.float16), None
+    if quantization != "int8":
+        raise ValueError(f"Unknown quantization: {quantization}")
+    peak = np.abs(vectors).max(axis=1)
+    peak[peak == 0] = 1.0
+    codes = np.rint(vectors / peak[:, None] * 127).astype(np.int8)
+    return codes, (peak / 127).astype(np.float32)
+
+
+def _pack_strings(values):
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+# ======================================================
+# WRITE
+# ======================================================
+def write_segment(path, ids, vectors, metadata, quantization="int8", keep_full=False):
+    """Write ids / float32 vectors / metadata dicts as one segment file."""
+    n = len(ids)
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(n, -1) if n else np.zeros((0, 1), np.float32)
+
+    strings, interned = [], {}
+    def intern(value):
+        if value not in interned:
+            interned[value] = len(strings)
+            strings.append(value)
+        return interned[value]
+
+    columns = {}
+    columns["ids_offsets"], columns["ids_blob"] = _pack_strings([str(i) for i in ids])
+    columns["title_ref"] = np.array([intern(m.get("video_title", "")) for m in metadata], dtype=np.int32)
+    columns["url_ref"] = np.array([intern(m.get("url", "")) for m in metadata], dtype=np.int32)
+    columns["strings_offsets"], columns["strings_blob"] = _pack_strings(strings)
+    columns["start_ms"] = np.array(
+        [round(timestamp_seconds(m.get("start_time")) * 1000) for m in metadata], dtype=np.int32)
+    columns["end_ms"] = np.array(
+        [round(timestamp_seconds(m.get("end_time")) * 1000) for m in metadata], dtype=np.int32)
+    columns["text_offsets"], columns["text_blob"] = _pack_strings([m.get("text_chunk", "") for m in metadata])
+    columns["summary_offsets"], columns["summary_blob"] = _pack_strings([m.get("summary") or "" for m in metadata])
+    columns["extra_offsets"], columns["extra_blob"] = _pack_strings([
+        json.dumps(extra, ensure_ascii=False) if extra else ""
+        for extra in ({k: v for k, v in m.items() if k not in KNOWN_KEYS} for m in metadata)
+    ])
+    columns["codes"], scales = quantize(vectors, quantization)
+    if scales is not None:
+        columns["scales"] = scales
+    if keep_full:
+        columns["full"] = normalize_rows(vectors)
+
+    layout, offset = {}, 0
+    for name, array in columns.items():
+        offset = -(-offset // ALIGN) * ALIGN
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+
+    header = json.dumps({
+        "version": FORMAT_VERSION,
+        "count": n,
+        "dim": int(vectors.shape[1]) if n else 0,
+        "quantization": quantization,
+        "columns": layout,
+    }).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 4 + len(header)) // ALIGN) * ALIGN
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        for name, array in columns.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+
+# ======================================================
+# READ
+# ======================================================
+class Segment:
+    """Zero-copy views over a segment file."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a corpus segment")
+            (header_len,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_len))
+        if header["version"] != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported segment version {header['version']}")
+
+        self.path = path
+        self.count = header["count"]
+        self.dim = header["dim"]
+        self.quantization = header["quantization"]
+
+        data_start = -(-(len(MAGIC) + 4 + header_len) // ALIGN) * ALIGN
+        self._buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        self.columns = {}
+        for name, col in header["columns"].items():
+            dtype = np.dtype(col["dtype"])
+            start = data_start + col["offset"]
+            size = int(np.prod(col["shape"], dtype=np.int64)) * dtype.itemsize
+            self.columns[name] = self._buffer[start:start + size].view(dtype).reshape(col["shape"])
+
+        self.codes = self.columns["codes"]
+        self.scales = self.columns.get("scales")
+        self.full = self.columns.get("full")
+
+    def __len__(self):
+        return self.count
+
+    def _string(self, column, i):
+        offsets = self.columns[column + "_offsets"]
+        return self.columns[column + "_blob"][offsets[i]:offsets[i + 1]].tobytes().decode("utf-8")
+
+    def id(self, i):
+        return self._string("ids", i)
+
+    def metadata(self, i):
+        meta = {
+            "video_title": self._string("strings", self.columns["title_ref"][i]),
+            "url": self._string("strings", self.columns["url_ref"][i]),
+            "text_chunk": self._string("text", i),
+            "start_time": format_timestamp(self.columns["start_ms"][i]),
+            "end_time": format_timestamp(self.columns["end_ms"][i]),
+        }
+        summary = self._string("summary", i)
+        if summary:
+            meta["summary"] = summary
+        extra = self._string("extra", i)
+        if extra:
+            meta.update(json.loads(extra))
+        return meta
+
+    def records(self):
+        """(id, metadata) for every chunk, decoded one at a time."""
+        for i in range(self.count):
+            yield self.id(i), self.metadata(i)
+
+    def vectors(self, rows):
+        """float32 rows (full precision when stored, else dequantized)."""
+        if self.full is not None:
+            return np.asarray(self.full[rows], dtype=np.float32)
+        rows_codes = self.codes[rows].astype(np.float32)
+        if self.scales is not None:
+            rows_codes *= self.scales[rows][..., None]
+        return rows_codes
+
+    def scores(self, q, rows=None):
+        """Approximate cosine of every row (or of `rows`) with the normalised query q."""
+        if rows is not None:
+            scores = self.codes[rows].astype(np.float32) @ q
+            if self.scales is not None:
+                scores *= self.scales[rows]
+            return scores
+
+        scores = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, SCAN_BLOCK):
+            stop = min(start + SCAN_BLOCK, self.count)
+            block = self.codes[start:stop].astype(np.float32) @ q
+            if self.scales is not None:
+                block *= self.scales[start:stop]
+            scores[start:stop] = block
+        return scores
+
+    def nbytes(self):
+        return self._buffer.nbytes
+
+
+class SegmentPartitions(Partitions):
+    """Partitions straight from the interned title / url references
+    and the millisecond columns (no metadata dicts)."""
+
+    def __init__(self, segment):
+        self.segment = segment
+        self.count = len(segment)
+        self._partitions = {}
+        self._numeric = {}
+        self._refs = None
+
+    def partition(self, field, value):
+        key = (field, value)
+        if key not in self._partitions:
+            if self._refs is None:
+                strings = len(self.segment.columns["strings_offsets"]) - 1
+                self._refs = {self.segment._string("strings", i): i for i in range(strings)}
+            ref = self._refs.get(value)
+            column = self.segment.columns["title_ref" if field == "video_title" else "url_ref"]
+            self._partitions[key] = (
+                np.flatnonzero(column == ref) if ref is not None else np.empty(0, dtype=np.int64)
+            )
+        return self._partitions[key]
+
+    def numeric(self, field):
+        if field not in self._numeric:
+            column = self.segment.columns["start_ms" if field == "start_seconds" else "end_ms"]
+            self._numeric[field] = column / 1000.0
+        return self._numeric[field]
+
+
+class SegmentIndex:
+    """Pinecone-shaped query() over a Segment (exact scan of quantized rows)."""
+
+    def __init__(self, segment, rescore=True, rescore_factor=RESCORE_FACTOR):
+        self.segment = segment
+        self.rescore = rescore and segment.full is not None
+        self.rescore_factor = rescore_factor
+        self._rows = None  # id -> row, built on first get_vectors()
+        self.partitions = SegmentPartitions(segment)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        return cls(Segment(path), **kwargs)
+
+    @property
+    def ids(self):
+        return [self.segment.id(i) for i in range(len(self.segment))]
+
+    def query(self, vector, top_k=3, include_metadata=True, filter=None, **kwargs):
+        q = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm:
+            q = q / norm
+
+        rows = self.partitions.rows(filter)
+        scores = self.segment.scores(q, rows)  # one per row of `rows` when filtered
+        if self.rescore:
+            top = _top_k(scores, top_k * self.rescore_factor)
+            candidates = np.sort(top if rows is None else rows[top])
+            exact = self.segment.full[candidates] @ q
+            order = _top_k(exact, top_k)
+            idx, best = candidates[order], exact[order]
+        else:
+            top = _top_k(scores, top_k)
+            idx, best = (top if rows is None else rows[top]), scores[top]
+
+        matches = [
+            Match(
+                self.segment.id(i),
+                float(s),
+                self.segment.metadata(i) if include_metadata else {},
+            )
+            for i, s in zip(idx.tolist(), best.tolist())
+        ]
+        return QueryResult(matches)
+
+    def get_vectors(self, ids):
+        """Stored rows for these IDs; None where an ID is unknown."""
+        if self._rows is None:
+            self._rows = {self.segment.id(i): i for i in range(len(self.segment))}
+        return [
+            self.segment.vectors(self._rows[vid]) if vid in self._rows else None
+            for vid in ids
+        ]
+
+    def __len__(self):
+        return len(self.segment)
+
+
+# ======================================================
+# CONVERT A LOCAL VECTOR INDEX
+# ======================================================
+def index_bytes(directory):
+    from vector_index import VECTORS_FILE, CHUNKS_FILE
+
+    return sum(os.path.getsize(os.path.join(directory, f)) for f in (VECTORS_FILE, CHUNKS_FILE))
+
+
+def convert_index(directory, path, quantization="int8", keep_full=False):
+    """vectors.npy + chunks.json of a LocalVectorIndex -> one segment file."""
+    from vector_index import LocalVectorIndex
+
+    index = LocalVectorIndex.load(directory, mode="brute")
+    return write_segment(path, index.ids, np.asarray(index.vectors), index.metadata, quantization, keep_full)
+
+
+if __name__ == "__main__":
+    import time
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser(description="Convert the local vector index to a compact segment file.")
+    parser.add_argument("--index", default=os.path.join(base_dir, "output", "vector_index"))
+    parser.add_argument("--out", default=os.path.join(base_dir, "output", "corpus.seg"))
+    parser.add_argument("--quantize", choices=QUANTIZATIONS, default="int8")
+    parser.add_argument("--full", action="store_true", help="also keep float32 rows for re-scoring")
+    args = parser.parse_args()
+
+    size = convert_index(args.index, args.out, args.quantize, args.full)
+    start = time.perf_counter()
+    segment = Segment(args.out)
+    opened = time.perf_counter() - start
+
+    n = max(len(segment), 1)
+    print(f"✅ {len(segment)} chunks -> {args.out} ({args.quantize}{' + float32' if args.full else ''})")
+    print(f"   {size / n:.0f} bytes/chunk vs {index_bytes(args.index) / n:.0f} for vectors.npy + chunks.json, "
+          f"opened in {opened * 1000:.1f} ms")
@@ -0,0 +1,230 @@
+# ======================================================
+#                     telemetry.py
+#   STAGE SPANS + TOKEN ACCOUNTING + PROMETHEUS METRICS
+# ======================================================
+#
+# with span("embedding"):     times one stage of the current chat turn
+# observe(stage, seconds)     records a stage timed by the caller
+# record_usage(model, usage)  adds response.usage token counts
+# with trace() as t: ...      one chat turn; t.route = "RAG" / "MEMORY" /
+#                             "SEARCH" / "FALLBACK" tags it when it ends
+#
+# The current turn lives in a contextvar, so spans opened inside
+# asyncio tasks and async generators land in the right trace.
+#
+# Exposed in Prometheus text format on http://<host>:METRICS_PORT/metrics
+# (no server unless METRICS_PORT is set):
+#   chainmind_stage_seconds{stage}             histogram
+#   chainmind_request_seconds{route}           histogram
+#   chainmind_requests_total{route}            counter
+#   chainmind_stage_errors_total{stage}        counter
+#   chainmind_tokens_total{model,kind}         counter (prompt / completion)
+#
+# TRACE_LOG=1 also logs every finished turn as one JSON line.
+
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("chainmind.trace")
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# ======================================================
+# METRIC TYPES
+# ======================================================
+class Histogram:
+    def __init__(self, name, help_text, label, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}  # label value -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for value, series in sorted(self._series.items()):
+                labels = f'{self.label}="{value}"'
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {series[-2]}')
+                lines.append(f"{self.name}_count{{{labels}}} {series[-2]}")
+                lines.append(f"{self.name}_sum{{{labels}}} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}  # tuple of label values -> count
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, count in sorted(self._values.items()):
+                labels = ",".join(f'{k}="{v}"' for k, v in zip(self.labels, values))
+                lines.append(f"{self.name}{{{labels}}} {count}")
+        return lines
+
+
+stage_seconds = Histogram("chainmind_stage_seconds", "Duration of one pipeline stage.", "stage")
+request_seconds = Histogram("chainmind_request_seconds", "Duration of one chat turn.", "route")
+requests_total = Counter("chainmind_requests_total", "Chat turns by final route.", ("route",))
+stage_errors = Counter("chainmind_stage_errors_total", "Stages that raised.", ("stage",))
+tokens_total = Counter("chainmind_tokens_total", "Tokens reported by response.usage.", ("model", "kind"))
+
+METRICS = (stage_seconds, request_seconds, requests_total, stage_errors, tokens_total)
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ======================================================
+# TRACES AND SPANS
+# ======================================================
+class Trace:
+    def __init__(self):
+        self.route = None
+        self.started = time.perf_counter()
+        self.spans = []    # (stage, seconds, ok)
+        self.tokens = {}   # model -> {"prompt": n, "completion": n}
+
+
+_current = contextvars.ContextVar("chainmind_trace", default=None)
+
+
+@contextmanager
+def trace():
+    """One chat turn. Set .route before it ends to tag the request."""
+    t = Trace()
+    token = _current.set(t)
+    try:
+        yield t
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            _current.set(None)  # finished from another context (e.g. a streaming consumer task)
+        seconds = time.perf_counter() - t.started
+        route = t.route or "ERROR"
+        request_seconds.observe(seconds, route)
+        requests_total.inc(route)
+        if os.getenv("TRACE_LOG") == "1":
+            logger.info(json.dumps({
+                "route": route,
+                "seconds": round(seconds, 4),
+                "spans": [{"stage": s, "seconds": round(d, 4), "ok": ok} for s, d, ok in t.spans],
+                "tokens": t.tokens,
+            }))
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except Exception:
+        ok = False
+        stage_errors.inc(stage)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        stage_seconds.observe(seconds, stage)
+        t = _current.get()
+        if t is not None:
+            t.spans.append((stage, seconds, ok))
+
+
+def observe(stage, seconds, ok=True):
+    """Record a stage timed by the caller (e.g. time to first streamed token)."""
+    stage_seconds.observe(seconds, stage)
+    t = _current.get()
+    if t is not None:
+        t.spans.append((stage, seconds, ok))
+
+
+def record_usage(model, usage):
+    """Count prompt/completion tokens of one response (usage may be None)."""
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    tokens_total.inc(model, "prompt", amount=prompt)
+    if completion:
+        tokens_total.inc(model, "completion", amount=completion)
+
+    t = _current.get()
+    if t is not None:
+        counts = t.tokens.setdefault(model, {"prompt": 0, "completion": 0})
+        counts["prompt"] += prompt
+        counts["completion"] += completion
+
+
+# ======================================================
+# /metrics ENDPOINT
+# ======================================================
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+
+
+def start_metrics_server(port=None, host=None):
+    """Serve /metrics in a daemon thread. No-op without a port / METRICS_PORT."""
+    global _server
+
+    port = port or os.getenv("METRICS_PORT")
+    if not port or _server is not None:
+        return _server
+
+    _server = ThreadingHTTPServer((host or os.getenv("METRICS_HOST", "127.0.0.1"), int(port)), _MetricsHandler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
@@ -0,0 +1,283 @@
+# ======================================================
+#                     timeline.py
+#     PER-VIDEO TIMESTAMP INDEX, SPAN MERGING, DEEP LINKS
+# ======================================================
+#
+# TimelineIndex keeps, per video, its chunks sorted by start time as
+# numeric arrays (seconds), so "what does the Base video say around
+# minute 12" is two bisects instead of an embedding + vector query.
+# Only explicit minute / clock expressions count as a time scope:
+# "intro" or "in the end" are ordinary words in most questions.
+#   starts[i]   chunk start, ascending
+#   max_ends[i] max(end of chunks 0..i), non-decreasing, so the first
+#               chunk that can still overlap a range is a bisect too
+#
+# merge_adjacent() joins retrieved chunks of the same video that touch
+# or overlap into one span (repeated overlap words removed), and
+# deep_link() / citations() turn spans into YouTube links at their
+# start second.
+
+import re
+import json
+import math
+from bisect import bisect_left, bisect_right
+
+from router import tokenize
+from vector_index import Match
+from lexical_index import STOPWORDS
+from chunking import timestamp_seconds
+from filters import in_scope
+
+AROUND_SECONDS = 60      # "around minute 12" = 11:00 .. 13:00
+MERGE_GAP_SECONDS = 2.0  # chunks closer than this are one span
+
+_NUM = r"(\d+(?:\.\d+)?)"
+_CLOCK = r"(\d{1,2}:\d{2}(?::\d{2})?)"
+_MINUTE_RANGE_RE = re.compile(rf"\b(?:between\s+|from\s+)?minutes?\s+{_NUM}\s*(?:-|to|and)\s*(?:minute\s+)?{_NUM}\b")
+_CLOCK_RANGE_RE = re.compile(rf"\b(?:between\s+|from\s+)?{_CLOCK}\s*(?:-|to|and)\s*{_CLOCK}\b")
+_MINUTE_RE = re.compile(rf"\bminute\s+{_NUM}\b|\b{_NUM}\s*(?:min|mins|minutes?)\s+(?:in|into|mark)\b")
+_CLOCK_RE = re.compile(rf"\b(?:at|around|near|about)\s+{_CLOCK}\b")
+_FIRST_RE = re.compile(rf"\bfirst\s+{_NUM}\s+minutes?\b")
+_LAST_RE = re.compile(rf"\blast\s+{_NUM}\s+minutes?\b")
+
+
+def clock_seconds(text):
+    """'12:30' -> 750.0, '1:02:03' -> 3723.0"""
+    seconds = 0.0
+    for part in text.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def format_clock(seconds):
+    seconds = int(seconds)
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m}:{s:02d}"
+
+
+def parse_time_scope(query):
+    """(start, end) seconds a question is about, or None.
+
+    Negative values count from the end of the video ("last 5 minutes"
+    -> (-300, None)); None as end means "until the end".
+    """
+    q = query.lower()
+
+    m = _MINUTE_RANGE_RE.search(q)
+    if m:
+        a, b = sorted((float(m.group(1)) * 60, float(m.group(2)) * 60))
+        return a, b
+    m = _CLOCK_RANGE_RE.search(q)
+    if m:
+        a, b = sorted((clock_seconds(m.group(1)), clock_seconds(m.group(2))))
+        return a, b
+    m = _FIRST_RE.search(q)
+    if m:
+        return 0.0, float(m.group(1)) * 60
+    m = _LAST_RE.search(q)
+    if m:
+        return -float(m.group(1)) * 60, None
+    m = _MINUTE_RE.search(q)
+    if m:
+        center = float(m.group(1) or m.group(2)) * 60
+        return max(0.0, center - AROUND_SECONDS), center + AROUND_SECONDS
+    m = _CLOCK_RE.search(q)
+    if m:
+        center = clock_seconds(m.group(1))
+        return max(0.0, center - AROUND_SECONDS), center + AROUND_SECONDS
+    return None
+
+
+# ======================================================
+# INDEX
+# ======================================================
+class VideoTimeline:
+    def __init__(self, items):
+        """items: (id, metadata) of one video's chunks."""
+        rows = sorted(
+            (timestamp_seconds(meta["start_time"]), timestamp_seconds(meta["end_time"]), id_, meta)
+            for id_, meta in items
+        )
+        self.starts = [r[0] for r in rows]
+        self.ends = [r[1] for r in rows]
+        self.ids = [r[2] for r in rows]
+        self.metadata = [r[3] for r in rows]
+
+        self.max_ends, running = [], -math.inf
+        for end in self.ends:
+            running = max(running, end)
+            self.max_ends.append(running)
+
+    @property
+    def duration(self):
+        return self.max_ends[-1] if self.max_ends else 0.0
+
+    def overlapping(self, start, end):
+        """Row numbers of chunks overlapping [start, end], in time order."""
+        lo = bisect_left(self.max_ends, start)   # earlier chunks all end before `start`
+        hi = bisect_right(self.starts, end)      # later chunks all start after `end`
+        return [i for i in range(lo, hi) if self.ends[i] >= start]
+
+
+class TimelineIndex:
+    def __init__(self, items):
+        """items: (id, metadata) with video_title / start_time / end_time."""
+        by_video = {}
+        self._by_url = {}
+        for id_, meta in items:
+            if meta.get("video_title") and meta.get("start_time"):
+                by_video.setdefault(meta["video_title"], []).append((id_, meta))
+                if meta.get("url"):
+                    self._by_url[meta["url"]] = meta["video_title"]
+        self.videos = {title: VideoTimeline(rows) for title, rows in by_video.items()}
+
+        # IDF of title words, so "the Base video" picks the one title saying "base"
+        counts = {}
+        self._title_terms = {}
+        for title in self.videos:
+            terms = set(tokenize(title)) - STOPWORDS - {"video"}
+            self._title_terms[title] = terms
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+        self._idf = {t: math.log((1 + len(self.videos)) / c) for t, c in counts.items()}
+
+    @classmethod
+    def from_dataset(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            dataset = json.load(f)
+        return cls((item.get("id", str(i)), item) for i, item in enumerate(dataset))
+
+    def __len__(self):
+        return len(self.videos)
+
+    def find_video(self, query):
+        """Title the question names, or None (the only video if there is one)."""
+        if len(self.videos) == 1:
+            return next(iter(self.videos))
+        words = set(tokenize(query))
+        scored = sorted(
+            ((sum(self._idf[t] for t in terms & words), title) for title, terms in self._title_terms.items()),
+            reverse=True,
+        )
+        if not scored or scored[0][0] <= 0 or (len(scored) > 1 and scored[0][0] == scored[1][0]):
+            return None
+        return scored[0][1]
+
+    def scoped_video(self, filters):
+        """The one video a retrieval scope (filters.py) selects, or None."""
+        titles = set()
+        for field, known in (("video_title", self.videos), ("url", self._by_url)):
+            value = (filters or {}).get(field)
+            for v in (value if isinstance(value, (list, tuple, set)) else [value] if value else []):
+                if v in known:
+                    titles.add(v if field == "video_title" else known[v])
+        return titles.pop() if len(titles) == 1 else None
+
+    def range(self, video_title, start, end=None, limit=None, filters=None):
+        """Matches of one video overlapping [start, end] seconds, in time order.
+
+        Negative start counts from the end of the video. `filters` (a
+        scope dict) drops chunks outside it. With `limit`, keeps the
+        chunks closest to the middle of the range.
+        """
+        timeline = self.videos.get(video_title)
+        if timeline is None:
+            return []
+        if start < 0:
+            start = max(0.0, timeline.duration + start)
+        if end is None:
+            end = timeline.duration
+
+        rows = [i for i in timeline.overlapping(start, end) if in_scope(timeline.metadata[i], filters)]
+        if limit is not None and len(rows) > limit:
+            middle = (start + end) / 2
+            rows = sorted(rows, key=lambda i: abs((timeline.starts[i] + timeline.ends[i]) / 2 - middle))[:limit]
+            rows.sort()
+        return [Match(timeline.ids[i], 1.0, timeline.metadata[i]) for i in rows]
+
+    def lookup(self, query, limit=None, filters=None):
+        """Matches for a time-scoped question about one video, else None.
+
+        filters: the chat's retrieval scope; its video_title / url picks
+        the video, and its start / end narrow the range.
+        """
+        scope = parse_time_scope(query)
+        if scope is None:
+            return None
+        title = self.scoped_video(filters) or self.find_video(query)
+        if title is None:
+            return None
+        return self.range(title, scope[0], scope[1], limit, filters) or None
+
+
+# ======================================================
+# SPANS AND LINKS
+# ======================================================
+def _join_overlapping(previous, text, max_words=200):
+    """previous + text without the words text repeats from previous's end."""
+    a, b = previous.split(), text.split()
+    for k in range(min(len(a), len(b), max_words), 0, -1):
+        if a[-k:] == b[:k]:
+            return " ".join(a + b[k:])
+    return " ".join(a + b)
+
+
+def merge_adjacent(matches, gap=MERGE_GAP_SECONDS):
+    """Join matches of the same video that overlap or touch into one span.
+
+    Keeps the rank order of each span's best match; a merged span's id
+    is its chunk ids joined with "+".
+    """
+    spans = []  # [rank, video, start, end, [matches]]
+    for rank, m in enumerate(matches):
+        meta = m.metadata
+        if not meta.get("start_time"):
+            spans.append([rank, None, 0.0, 0.0, [m]])
+            continue
+        start, end = timestamp_seconds(meta["start_time"]), timestamp_seconds(meta["end_time"])
+        for span in spans:
+            if span[1] == meta.get("video_title") and start <= span[3] + gap and end >= span[2] - gap:
+                span[2], span[3] = min(span[2], start), max(span[3], end)
+                span[4].append(m)
+                break
+        else:
+            spans.append([rank, meta.get("video_title"), start, end, [m]])
+
+    merged = []
+    for _, _, _, _, group in sorted(spans, key=lambda s: s[0]):
+        if len(group) == 1:
+            merged.append(group[0])
+            continue
+        group.sort(key=lambda m: timestamp_seconds(m.metadata["start_time"]))
+        text = group[0].metadata["text_chunk"]
+        for m in group[1:]:
+            text = _join_overlapping(text, m.metadata["text_chunk"])
+        first = group[0].metadata
+        last = max(group, key=lambda m: timestamp_seconds(m.metadata["end_time"])).metadata
+        meta = {k: v for k, v in first.items() if k != "summary"}  # described the first chunk only
+        meta.update(text_chunk=text, end_time=last["end_time"])
+        merged.append(Match("+".join(m.id for m in group), max(m.score for m in group), meta))
+    return merged
+
+
+def deep_link(url, start_time):
+    """YouTube link that starts playing at start_time."""
+    if not url:
+        return ""
+    seconds = int(timestamp_seconds(start_time)) if start_time else 0
+    return f"{url}{'&' if '?' in url else '?'}t={seconds}s"
+
+
+def citations(matches):
+    """'Sources:' line with one deep link per span, or ''."""
+    links, seen = [], set()
+    for m in matches:
+        meta = m.metadata
+        link = deep_link(meta.get("url"), meta.get("start_time"))
+        if not link or link in seen:
+            continue
+        seen.add(link)
+        stamp = format_clock(timestamp_seconds(meta["start_time"])) if meta.get("start_time") else ""
+        links.append(f"[{meta.get('video_title', 'video')} @ {stamp}]({link})")
+    return "Sources: " + " · ".join(links) if links else ""
@@ -0,0 +1,240 @@
+# ======================================================
+#                   transcripts.py
+#      VTT CLEANING + CHUNKING (from phase 1 notebook)
+# ======================================================
+
+import os
+import re
+import json
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+MAX_TOKENS = 300  # number of words per chunk
+
+# Bump when parsing/chunking output changes, so ingestion re-parses
+# every file (unchanged chunks keep their content-hash IDs).
+PARSER_VERSION = 3
+
+TIMESTAMP_RE = re.compile(r'(\d{2}:\d{2}:\d{2}\.\d{3}) --> (\d{2}:\d{2}:\d{2}\.\d{3})')
+TAG_RE = re.compile(r'<[^>]*>')
+WORD_TIMING_RE = re.compile(r'<\d{2}:\d{2}:\d{2}\.\d{3}>')
+
+# Rolling auto-captions repeat the previous caption line before the new one.
+# We remember this many recently emitted words to strip those repeats.
+DEDUP_TAIL_WORDS = 64
+# Shortest partial overlap treated as a repeat (a whole-line repeat always is)
+MIN_OVERLAP_WORDS = 3
+
+
+# ======================================================
+# STEP 2: CLEAN VTT -> SUBTITLE ENTRIES (streaming)
+# ======================================================
+def iter_vtt_cues(file_path):
+    """Yield (start_time, end_time, [raw text lines]) one cue at a time."""
+    start_time = end_time = None
+    text_lines = []
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        for raw in f:
+            line = raw.rstrip("\r\n")
+
+            if "-->" in line:
+                if start_time is not None:
+                    yield start_time, end_time, text_lines
+                match = TIMESTAMP_RE.match(line.strip())
+                start_time, end_time = match.groups() if match else (None, None)
+                text_lines = []
+                continue
+
+            if start_time is None:
+                continue  # headers (WEBVTT / Kind: / Language:) and stray lines
+
+            if line == "":
+                # Blank line ends the cue. YouTube pads cues with " " lines,
+                # which are not blank and must not end the cue early.
+                yield start_time, end_time, text_lines
+                start_time = end_time = None
+                text_lines = []
+            else:
+                text_lines.append(line)
+
+    if start_time is not None:
+        yield start_time, end_time, text_lines
+
+
+def _overlap(tail, words):
+    """Length of the longest prefix of `words` that the tail ends with."""
+    limit = min(len(tail), len(words))
+    tail = list(tail)[-limit:] if limit else []
+    for k in range(limit, 0, -1):
+        if tail[-k:] == words[:k]:
+            if k == len(words) or k >= MIN_OVERLAP_WORDS:
+                return k
+            break
+    return 0
+
+
+def iter_subtitles(file_path):
+    """Yield {"start_time", "end_time", "text"} with rolling repeats removed."""
+    tail = deque(maxlen=DEDUP_TAIL_WORDS)
+
+    for start_time, end_time, lines in iter_vtt_cues(file_path):
+        fresh = []
+        for line in lines:
+            # Remove HTML-like tags (word-level <c> timing)
+            words = TAG_RE.sub("", line).split()
+            if not words:
+                continue
+            # A line with word-level timing is what is spoken in this cue, never
+            # a repeat (even when the speaker says the same words twice)
+            new_words = words if WORD_TIMING_RE.search(line) else words[_overlap(tail, words):]
+            tail.extend(new_words)
+            fresh.extend(new_words)
+
+        if fresh:
+            yield {
+                "start_time": start_time,
+                "end_time": end_time,
+                "text": " ".join(fresh)
+            }
+
+
+def clean_vtt(file_path):
+    return list(iter_subtitles(file_path))
+
+
+def write_subtitles_json(subtitles, output_path):
+    """Stream entries to a JSON array (same layout as json.dump(indent=2))."""
+    with open(output_path, "w", encoding="utf-8") as f:
+        first = True
+        for entry in subtitles:
+            body = json.dumps(entry, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+            f.write(("[\n  " if first else ",\n  ") + body)
+            first = False
+            yield entry
+        f.write("[]" if first else "\n]")
+
+
+def clean_vtt_to_json(file_path, output_path):
+    """Parse one .vtt file to processed JSON; returns the entry count."""
+    return sum(1 for _ in write_subtitles_json(iter_subtitles(file_path), output_path))
+
+
+def process_transcript(file_path, output_path, video_title, url, max_tokens=MAX_TOKENS,
+                       granularities=None):
+    """Parse, write processed JSON and chunk in one streaming pass.
+
+    granularities: None for fixed max_tokens-word chunks, or a list of
+    chunking.GRANULARITIES names / "WINDOW:OVERLAP" specs for
+    sentence-aware overlapping windows.
+    """
+    entries = write_subtitles_json(iter_subtitles(file_path), output_path)
+    if granularities:
+        from chunking import chunk_transcript
+        return chunk_transcript(entries, video_title, url, granularities)
+    return chunk_subtitles(entries, video_title, url, max_tokens)
+
+
+def process_transcripts(jobs, workers=None):
+    """Run process_transcript(*job) for each job across a process pool.
+
+    Returns chunk lists in job order.
+    """
+    jobs = list(jobs)
+    if len(jobs) <= 1 or workers == 1:
+        return [process_transcript(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(process_transcript, *zip(*jobs)))
+
+
+def clean_vtt_folder(raw_dir, processed_dir, workers=None):
+    """Clean every .vtt in raw_dir to processed_dir/<name>.json in parallel."""
+    os.makedirs(processed_dir, exist_ok=True)
+    names = sorted(n for n in os.listdir(raw_dir) if n.endswith(".vtt"))
+    inputs = [os.path.join(raw_dir, n) for n in names]
+    outputs = [os.path.join(processed_dir, n[:-len(".vtt")] + ".json") for n in names]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(names, pool.map(clean_vtt_to_json, inputs, outputs)))
+
+
+# ======================================================
+# STEP 3: CHUNK SUBTITLES
+# ======================================================
+def load_url_map(metadata_file):
+    """Map video title (subtitle file base name) -> URL."""
+    if not os.path.exists(metadata_file):
+        return {}
+    with open(metadata_file, "r", encoding="utf-8") as f:
+        metadata_list = json.load(f)
+
+    file_to_url = {}
+    for meta in metadata_list:
+        if not meta.get("subtitle_file"):
+            continue
+        base_name = os.path.splitext(os.path.basename(meta["subtitle_file"]))[0]
+        file_to_url[base_name] = meta["url"]
+    return file_to_url
+
+
+def chunk_subtitles(subtitles, video_title, url, max_tokens=MAX_TOKENS):
+    chunks = []
+    current_chunk = []
+    current_start = None
+    current_end = None
+    word_count = 0
+
+    def flush():
+        chunk = {
+            "video_title": video_title,
+            "url": url,
+            "text_chunk": " ".join(current_chunk),
+            "start_time": current_start,
+            "end_time": current_end
+        }
+        chunk["id"] = chunk_id(chunk)
+        chunks.append(chunk)
+
+    for entry in subtitles:
+        words = entry["text"].split()
+        if current_start is None:
+            current_start = entry["start_time"]
+        current_end = entry["end_time"]
+
+        current_chunk.extend(words)
+        word_count += len(words)
+
+        if word_count >= max_tokens:
+            flush()
+            current_chunk = []
+            current_start = None
+            current_end = None
+            word_count = 0
+
+    # Save remaining chunk
+    if current_chunk:
+        flush()
+
+    return chunks
+
+
+# ======================================================
+# CONTENT HASHES
+# ======================================================
+def chunk_id(chunk):
+    """Deterministic ID: same video, span and text -> same vector ID."""
+    key = "\x1f".join([
+        chunk["video_title"],
+        chunk["start_time"] or "",
+        chunk["end_time"] or "",
+        chunk["text_chunk"],
+    ])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
@@ -0,0 +1,460 @@
+# ======================================================
+#                  vector_index.py
+#     IN-PROCESS VECTOR INDEX (LOCAL PINECONE BACKEND)
+# ======================================================
+#
+# Keeps the chunk embeddings in one contiguous, L2-normalised
+# float32 matrix that is memory-mapped from disk, so cosine
+# similarity is a single matrix-vector product.
+#
+# The query() signature and result shape mirror Pinecone's
+# Index.query, so rag_agent can swap one for the other. A filter
+# (Pinecone syntax, see filters.py) scans only the matching video's rows.
+#
+# Layout of an index directory:
+#   vectors.npy   float32 [n, dim], rows normalised
+#   chunks.json   [{"id": ..., "metadata": {...}}, ...]
+#   graph.npy     int32 [n, 2 * degree] neighbour lists, -1 padded (ANN mode only)
+#   graph.json    entry points of the coarse layer + measured recall@10
+#
+# The graph is built offline (ingest --local-index, or
+# `python app/vector_index.py --build-graph`), never while serving:
+#   1. k-means over a sample gives ~sqrt(n) coarse clusters, and the
+#      row closest to each centroid becomes an entry point
+#   2. each row's k nearest neighbours are searched in its own and the
+#      nearest few clusters only (not the whole corpus), then refined
+#      with its neighbours' neighbours
+#   3. entry points also include a random sample of rows
+#   4. each row also keeps its strongest incoming edges, so no row is
+#      unreachable
+# A search scores the query against the entry points first and starts
+# from the best few, so it begins in the right cluster instead of at
+# fixed rows that may sit in another cluster's island. A build widens
+# the search beam until recall@10 against brute force reaches
+# MIN_GRAPH_RECALL, and "auto" mode only uses a graph that got there.
+
+import os
+import json
+import argparse
+import heapq
+
+import numpy as np
+
+from filters import Partitions
+
+VECTORS_FILE = "vectors.npy"
+CHUNKS_FILE = "chunks.json"
+GRAPH_FILE = "graph.npy"
+GRAPH_META_FILE = "graph.json"
+
+# Below this many vectors an exact scan is faster than walking a graph
+BRUTE_FORCE_LIMIT = 20000
+GRAPH_DEGREE = 16
+EF_SEARCH = 64
+MAX_EF_SEARCH = 512    # a build widens the beam up to this to reach MIN_GRAPH_RECALL
+ENTRY_POINTS = 8       # best coarse entry points a search starts from
+CLUSTER_PROBES = 3     # clusters searched for each row's neighbours
+MIN_GRAPH_RECALL = 0.95
+
+
+# ==============================
+# Result objects (Pinecone-shaped)
+# ==============================
+class Match:
+    __slots__ = ("id", "score", "metadata")
+
+    def __init__(self, id, score, metadata):
+        self.id = id
+        self.score = score
+        self.metadata = metadata
+
+
+class QueryResult:
+    __slots__ = ("matches",)
+
+    def __init__(self, matches):
+        self.matches = matches
+
+
+# ==============================
+# Helpers
+# ==============================
+def normalize_rows(vectors):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores, k):
+    """Indices of the k highest scores, best first."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx])]
+
+
+def coarse_clusters(vectors, count, sample=20000, iterations=10, seed=0):
+    """Spherical k-means trained on a sample -> (centroids, row assignments)."""
+    n = vectors.shape[0]
+    rng = np.random.default_rng(seed)
+    train = vectors[np.sort(rng.choice(n, min(n, max(sample, count)), replace=False))]
+    centroids = np.array(train[rng.choice(train.shape[0], count, replace=False)])
+
+    for _ in range(iterations):
+        assign = np.argmax(train @ centroids.T, axis=1)
+        for c in range(count):
+            members = train[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids = normalize_rows(centroids)
+
+    assign = np.concatenate([
+        np.argmax(vectors[start:start + 8192] @ centroids.T, axis=1)
+        for start in range(0, n, 8192)
+    ])
+    return centroids, assign
+
+
+def _best_columns(sims, k):
+    """Per row, the columns of the k highest scores, best first."""
+    nearest = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(sims, nearest, axis=1), axis=1)
+    return np.take_along_axis(nearest, order, axis=1)
+
+
+def build_knn_graph(vectors, degree=GRAPH_DEGREE, probes=CLUSTER_PROBES, block=256):
+    """Approximate k-NN graph with reverse edges, plus entry points.
+
+    Returns (graph int32 [n, 2 * degree] padded with -1, entry rows).
+    """
+    n = vectors.shape[0]
+    degree = min(degree, n - 1)
+    count = max(1, int(np.sqrt(n)))
+    centroids, assign = coarse_clusters(vectors, count)
+
+    order = np.argsort(assign, kind="stable")
+    bounds = np.searchsorted(assign[order], np.arange(count + 1))
+    members = [order[bounds[c]:bounds[c + 1]] for c in range(count)]
+    nearest_clusters = np.argsort(-(centroids @ centroids.T), axis=1)
+
+    entries = []
+    forward = np.empty((n, degree), dtype=np.int32)
+    for c in range(count):
+        rows = members[c]
+        if not len(rows):
+            continue
+        entries.append(int(rows[np.argmax(vectors[rows] @ centroids[c])]))
+
+        # This cluster first, then neighbours until there are enough candidates
+        pool, size = [rows], len(rows)
+        for other in nearest_clusters[c]:
+            if other == c or (len(pool) >= probes and size > degree):
+                continue
+            pool.append(members[other])
+            size += len(members[other])
+        candidates = np.concatenate(pool)
+
+        sims = vectors[rows] @ vectors[candidates].T
+        sims[np.arange(len(rows)), np.arange(len(rows))] = -np.inf
+        forward[rows] = candidates[_best_columns(sims, degree)]
+
+    # One refinement pass: neighbours of neighbours often beat the
+    # cluster-restricted guess (rows near a cluster border)
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        own = forward[start:stop]
+        candidates = np.concatenate([own, forward[own].reshape(stop - start, -1)], axis=1)
+        sims = np.einsum("bd,bcd->bc", vectors[start:stop], vectors[candidates])
+        sims[candidates == np.arange(start, stop)[:, None]] = -np.inf
+        # keep the first copy of each candidate only
+        order = np.argsort(candidates, axis=1, kind="stable")
+        sorted_c = np.take_along_axis(candidates, order, axis=1)
+        duplicate = np.zeros_like(sorted_c, dtype=bool)
+        duplicate[:, 1:] = sorted_c[:, 1:] == sorted_c[:, :-1]
+        np.put_along_axis(sims, order, np.where(duplicate, -np.inf, np.take_along_axis(sims, order, axis=1)), axis=1)
+        forward[start:stop] = np.take_along_axis(candidates, _best_columns(sims, degree), axis=1)
+
+    # Extra entry points sampled from the whole corpus, so small groups
+    # that k-means folded into a bigger cluster still have one
+    rng = np.random.default_rng(0)
+    entries.extend(rng.choice(n, min(n, 3 * count), replace=False).tolist())
+
+    # Strongest incoming edges (by the rank they have at their source)
+    # that a row does not already have as forward edges
+    graph = np.full((n, 2 * degree), -1, dtype=np.int32)
+    graph[:, :degree] = forward
+    sources = np.repeat(np.arange(n, dtype=np.int32), degree)
+    ranks = np.tile(np.arange(degree), n)
+    targets = forward.ravel()
+    by_target = np.lexsort((ranks, targets))
+    sources, targets = sources[by_target], targets[by_target]
+    starts = np.searchsorted(targets, np.arange(n + 1))
+    for node in range(n):
+        incoming = sources[starts[node]:starts[node + 1]]
+        if not len(incoming):
+            continue
+        extra = incoming[~np.isin(incoming, forward[node])][:degree]
+        graph[node, degree:degree + len(extra)] = extra
+
+    return graph, np.array(sorted(set(entries)), dtype=np.int64)
+
+
+def graph_recall(index, k=10, sample=200, noise=1.0, seed=0):
+    """Recall@k of graph search against brute force.
+
+    Queries are stored rows plus Gaussian noise (cosine ~0.7 to their
+    row), like a question next to the chunk that answers it.
+    """
+    n, dim = index.vectors.shape
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(n, min(sample, n), replace=False)
+    queries = normalize_rows(
+        index.vectors[np.sort(rows)] + rng.normal(scale=noise / np.sqrt(dim), size=(len(rows), dim))
+    )
+
+    hits = 0
+    for q in queries:
+        exact = set(_top_k(index.vectors @ q, k).tolist())
+        found, _ = index._search_graph(q, k)
+        hits += len(exact & set(found.tolist()))
+    return hits / (len(queries) * min(k, n))
+
+
+def build_graph_files(directory, **kwargs):
+    """Build graph.npy / graph.json for an index directory; returns recall@10."""
+    index = LocalVectorIndex.load(directory, mode="graph", **kwargs)
+    return index.graph_recall
+
+
+# ======================================================
+# LOCAL INDEX
+# ======================================================
+class LocalVectorIndex:
+    def __init__(self, vectors, chunks, mode="auto", graph=None, entries=None, recall=None,
+                 brute_force_limit=BRUTE_FORCE_LIMIT, ef_search=EF_SEARCH):
+        if vectors.shape[0] != len(chunks):
+            raise ValueError(
+                f"{vectors.shape[0]} vectors but {len(chunks)} chunk records"
+            )
+
+        self.vectors = vectors
+        self.ids = [c["id"] for c in chunks]
+        self.metadata = [c.get("metadata", {}) for c in chunks]
+        self.ef_search = ef_search
+        self._rows = None  # id -> row, built on first get_vectors()
+        self.partitions = Partitions(self.metadata)
+
+        # auto: the graph only pays off on a large corpus, and only
+        # counts once a build has measured that it finds what brute
+        # force finds; it is never built here, on the serving path
+        if mode == "auto":
+            usable = graph is not None and recall is not None and recall >= MIN_GRAPH_RECALL
+            mode = "graph" if usable and len(chunks) > brute_force_limit else "brute"
+        if mode not in ("brute", "graph"):
+            raise ValueError(f"Unknown index mode: {mode}")
+        self.mode = mode
+
+        self.graph, self.entries, self.graph_recall = graph, entries, recall
+        if self.mode == "graph" and self.graph is None:
+            self.graph, self.entries = build_knn_graph(self.vectors)
+            self.graph_recall = self._tune_ef()
+
+    # ------------------------------
+    # Persistence
+    # ------------------------------
+    @classmethod
+    def load(cls, directory, mode="auto", **kwargs):
+        vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode="r")
+
+        with open(os.path.join(directory, CHUNKS_FILE), "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+
+        graph = entries = recall = None
+        graph_path = os.path.join(directory, GRAPH_FILE)
+        meta_path = os.path.join(directory, GRAPH_META_FILE)
+        if mode != "brute" and os.path.exists(graph_path) and os.path.exists(meta_path):
+            graph = np.load(graph_path, mmap_mode="r")
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if graph.shape[0] != vectors.shape[0] or meta.get("count") != vectors.shape[0]:
+                graph = None  # stale graph from an older build
+            else:
+                entries, recall = np.array(meta["entries"], dtype=np.int64), meta.get("recall")
+                kwargs.setdefault("ef_search", meta.get("ef_search", EF_SEARCH))
+
+        index = cls(vectors, chunks, mode=mode, graph=graph, entries=entries, recall=recall, **kwargs)
+
+        if index.mode == "graph" and graph is None:
+            np.save(graph_path, index.graph)
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"count": len(index), "recall": index.graph_recall,
+                           "ef_search": index.ef_search, "entries": index.entries.tolist()}, f)
+        elif mode == "auto" and graph is None and len(index) > BRUTE_FORCE_LIMIT:
+            print(f"[INFO] {len(index)} vectors, exact search; "
+                  f"`python app/vector_index.py --build-graph` builds the ANN graph")
+
+        return index
+
+    @staticmethod
+    def save(directory, ids, vectors, metadata):
+        os.makedirs(directory, exist_ok=True)
+
+        np.save(os.path.join(directory, VECTORS_FILE), normalize_rows(vectors))
+
+        chunks = [{"id": str(i), "metadata": m} for i, m in zip(ids, metadata)]
+        with open(os.path.join(directory, CHUNKS_FILE), "w", encoding="utf-8") as f:
+            json.dump(chunks, f, ensure_ascii=False)
+
+        # Any previous graph no longer matches the vectors
+        for name in (GRAPH_FILE, GRAPH_META_FILE):
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    # ------------------------------
+    # Search
+    # ------------------------------
+    def query(self, vector, top_k=3, include_metadata=True, filter=None, **kwargs):
+        q = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm:
+            q = q / norm
+
+        rows = self.partitions.rows(filter)
+        if rows is not None:
+            # One video's partition is small: exact scan, even in graph mode
+            scores = self.vectors[rows] @ q
+            top = _top_k(scores, top_k)
+            idx, scores = rows[top], scores[top]
+        elif self.mode == "graph":
+            idx, scores = self._search_graph(q, top_k)
+        else:
+            scores = self.vectors @ q
+            idx = _top_k(scores, top_k)
+            scores = scores[idx]
+
+        matches = [
+            Match(
+                self.ids[i],
+                float(s),
+                self.metadata[i] if include_metadata else {},
+            )
+            for i, s in zip(idx.tolist(), scores.tolist())
+        ]
+        return QueryResult(matches)
+
+    def _tune_ef(self):
+        """Smallest beam width reaching MIN_GRAPH_RECALL (up to MAX_EF_SEARCH); returns its recall."""
+        while True:
+            recall = graph_recall(self)
+            if recall >= MIN_GRAPH_RECALL or self.ef_search >= MAX_EF_SEARCH:
+                return recall
+            self.ef_search *= 2
+
+    def _search_graph(self, q, top_k):
+        """Best-first beam search over the k-NN graph."""
+        ef = max(self.ef_search, top_k)
+
+        # Coarse pass: start from the entry points closest to the query
+        entry_scores = self.vectors[self.entries] @ q
+        best_entries = _top_k(entry_scores, ENTRY_POINTS)
+        entries, entry_scores = self.entries[best_entries], entry_scores[best_entries]
+
+        visited = set(entries.tolist())
+        candidates = [(-s, i) for i, s in zip(entries.tolist(), entry_scores.tolist())]
+        heapq.heapify(candidates)
+        best = [(s, i) for i, s in zip(entries.tolist(), entry_scores.tolist())]
+        heapq.heapify(best)
+        while len(best) > ef:
+            heapq.heappop(best)
+
+        while candidates:
+            neg, node = heapq.heappop(candidates)
+            if len(best) >= ef and -neg < best[0][0]:
+                break
+
+            neighbours = [nb for nb in self.graph[node].tolist() if nb >= 0 and nb not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+
+            nb_scores = self.vectors[neighbours] @ q
+            for nb, s in zip(neighbours, nb_scores.tolist()):
+                if len(best) < ef or s > best[0][0]:
+                    heapq.heappush(candidates, (-s, nb))
+                    heapq.heappush(best, (s, nb))
+                    if len(best) > ef:
+                        heapq.heappop(best)
+
+        best.sort(reverse=True)
+        best = best[:top_k]
+        idx = np.array([i for _, i in best], dtype=np.int64)
+        scores = np.array([s for s, _ in best], dtype=np.float32)
+        return idx, scores
+
+    def get_vectors(self, ids):
+        """Stored (normalised) rows for these IDs; None where an ID is unknown."""
+        if self._rows is None:
+            self._rows = {vid: i for i, vid in enumerate(self.ids)}
+        return [
+            self.vectors[self._rows[vid]] if vid in self._rows else None
+            for vid in ids
+        ]
+
+    def __len__(self):
+        return len(self.ids)
+
+
+# ======================================================
+# EXPORT FROM PINECONE
+# ======================================================
+def export_from_pinecone(pinecone_index, ids, directory, batch_size=100):
+    """Copy stored vectors + metadata out of Pinecone (no re-embedding)."""
+    all_ids, vectors, metadata = [], [], []
+
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        fetched = pinecone_index.fetch(ids=batch).vectors
+        for vid in batch:
+            if vid not in fetched:
+                print(f"[WARNING] Vector {vid} missing from Pinecone, skipped")
+                continue
+            all_ids.append(vid)
+            vectors.append(fetched[vid].values)
+            metadata.append(dict(fetched[vid].metadata or {}))
+
+    LocalVectorIndex.save(directory, all_ids, np.array(vectors, dtype=np.float32), metadata)
+    return len(all_ids)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from pinecone import Pinecone
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser(description="Export the Pinecone index to a local vector index.")
+    parser.add_argument("--dataset", default=os.path.join(base_dir, "output", "rag_dataset.json"))
+    parser.add_argument("--out", default=os.path.join(base_dir, "output", "vector_index"))
+    parser.add_argument("--index-name", default="youtube-chunks")
+    parser.add_argument("--build-graph", action="store_true",
+                        help="build the ANN graph of the existing index in --out instead of exporting")
+    args = parser.parse_args()
+
+    if args.build_graph:
+        recall = build_graph_files(args.out)
+        mode = "graph" if recall >= MIN_GRAPH_RECALL else f"brute (below {MIN_GRAPH_RECALL})"
+        print(f"✅ Graph built in {args.out}: recall@10 {recall:.3f} vs brute force, auto mode uses {mode}")
+        raise SystemExit(0)
+
+    load_dotenv()
+    with open(args.dataset, "r", encoding="utf-8") as f:
+        dataset = json.load(f)
+
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    # Content-hash IDs from ingest.py; older datasets used the position
+    ids = [item.get("id", str(i)) for i, item in enumerate(dataset)]
+    count = export_from_pinecone(pc.Index(args.index_name), ids, args.out)
+    print(f"✅ Exported {count} vectors to {args.out}")
@@ -0,0 +1,273 @@
+# ======================================================
+#               chunking_benchmark.py
+#     CHUNK SIZE vs PROMPT SIZE vs RETRIEVAL HIT RATE
+# ======================================================
+#
+# For each chunking setting, reports:
+#   chunks        number of vectors the index would hold
+#   words/chunk   mean chunk length
+#   indexed words total words stored (overlap makes this > transcript size)
+#   prompt tokens mean tokens of the top-k context sent to the LLM
+#   hit@k         share of probe questions whose source sentence falls
+#                 inside one of the top-k retrieved chunks
+#
+# Probes are questions held out from the transcripts' wording: a
+# --questions JSONL file ({"question", "video_title", "start_time"}),
+# or questions gpt-4o-mini paraphrases from sampled sentences (cached in
+# output/cache/chunking_probes.json). Verbatim sentences score hit@k
+# near 1.0 whatever the chunking, so they can't rank settings.
+#
+# Retrieval is dense by default (text-embedding-3-small, like the app):
+# probe embeddings are requested once for all settings, everything in
+# batches of 100, and cached on disk so reruns only embed new chunks.
+# --bm25 with --masked-probes (sentences with ~40% of their words
+# dropped) runs offline, as a smoke test only.
+#
+# Usage:
+#   python benchmarks/chunking_benchmark.py
+#   python benchmarks/chunking_benchmark.py --settings words:300 standard 200:40 --top-k 3
+#   python benchmarks/chunking_benchmark.py --bm25 --masked-probes
+
+import os
+import sys
+import json
+import random
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "app"))
+
+from transcripts import chunk_subtitles  # noqa: E402
+from chunking import chunk_transcript, iter_sentences, timestamp_seconds  # noqa: E402
+from lexical_index import BM25Index  # noqa: E402
+from prompt_builder import TokenCounter  # noqa: E402
+
+PROCESSED_DIR = os.path.join(BASE_DIR, "data", "processed")
+CACHE_DIR = os.path.join(BASE_DIR, "output", "cache")
+PROBES_PATH = os.path.join(CACHE_DIR, "chunking_probes.json")
+EMBEDDINGS_PATH = os.path.join(CACHE_DIR, "benchmark_embeddings.sqlite")
+DEFAULT_SETTINGS = ["words:300", "fine", "standard", "coarse"]
+EMBEDDING_MODEL = "text-embedding-3-small"
+PARAPHRASE_MODEL = "gpt-4o-mini"
+PARAPHRASE_BATCH = 20
+
+
+def load_transcripts(processed_dir):
+    transcripts = {}
+    for name in sorted(os.listdir(processed_dir)):
+        if name.endswith(".json"):
+            with open(os.path.join(processed_dir, name), "r", encoding="utf-8") as f:
+                transcripts[name[:-len(".json")]] = json.load(f)
+    return transcripts
+
+
+def build_chunks(transcripts, setting):
+    chunks = []
+    for title, subtitles in transcripts.items():
+        if setting.startswith("words:"):
+            chunks.extend(chunk_subtitles(subtitles, title, "", int(setting.split(":")[1])))
+        else:
+            chunks.extend(chunk_transcript(subtitles, title, "", [setting]))
+    return chunks
+
+
+def sample_sentences(transcripts, count, seed, min_words=8):
+    rng = random.Random(seed)
+    sentences = [
+        (title, s)
+        for title, subtitles in transcripts.items()
+        for s in iter_sentences(subtitles)
+        if s["words"] >= min_words
+    ]
+    return rng, rng.sample(sentences, min(count, len(sentences)))
+
+
+def _probe(query, title, sentence):
+    middle = (timestamp_seconds(sentence["start_time"]) + timestamp_seconds(sentence["end_time"])) / 2
+    return {"query": query, "video_title": title, "second": middle}
+
+
+def masked_probes(transcripts, count, seed, drop=0.4):
+    """Sentences with ~40% of their words dropped (offline, but lexical)."""
+    rng, sampled = sample_sentences(transcripts, count, seed)
+    probes = []
+    for title, s in sampled:
+        words = s["text"].split()
+        kept = [w for w in words if rng.random() > drop] or words
+        probes.append(_probe(" ".join(kept), title, s))
+    return probes
+
+
+def paraphrased_probes(transcripts, count, seed, client, path=PROBES_PATH):
+    """Questions a viewer would ask, in their own words, about sampled sentences."""
+    _, sampled = sample_sentences(transcripts, count, seed)
+    key = {"seed": seed, "count": count, "sentences": [s["text"] for _, s in sampled]}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("key") == key:
+            return cached["probes"]
+
+    probes = []
+    for start in range(0, len(sampled), PARAPHRASE_BATCH):
+        batch = sampled[start:start + PARAPHRASE_BATCH]
+        numbered = "\n".join(f"{i}. {s['text']}" for i, (_, s) in enumerate(batch))
+        response = client.chat.completions.create(
+            model=PARAPHRASE_MODEL,
+            temperature=0.7,
+            response_format={"type": "json_object"},
+            messages=[{"role": "user", "content":
+                       "For each numbered transcript sentence, write one question a viewer might ask "
+                       "that the sentence answers. Use your own words: no phrase of three or more "
+                       "words from the sentence. Reply as JSON: {\"questions\": [one string per sentence, in order]}"
+                       f"\n\n{numbered}"}],
+        )
+        questions = json.loads(response.choices[0].message.content).get("questions", [])
+        for (title, s), question in zip(batch, questions):
+            if isinstance(question, str) and question.strip():
+                probes.append(_probe(question.strip(), title, s))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"key": key, "probes": probes}, f, ensure_ascii=False, indent=2)
+    return probes
+
+
+def load_questions(path):
+    """Held-out questions: {"question", "video_title", "start_time"[, "end_time"]} per line."""
+    probes = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            q = json.loads(line)
+            start = timestamp_seconds(q["start_time"])
+            end = timestamp_seconds(q["end_time"]) if q.get("end_time") else start
+            probes.append({"query": q["question"], "video_title": q["video_title"], "second": (start + end) / 2})
+    return probes
+
+
+def _contains(chunk, probe):
+    return (chunk["video_title"] == probe["video_title"]
+            and timestamp_seconds(chunk["start_time"]) <= probe["second"] <= timestamp_seconds(chunk["end_time"]))
+
+
+class Embedder:
+    """Batched text-embedding-3-small calls behind an on-disk cache."""
+
+    def __init__(self, client, cache_path=EMBEDDINGS_PATH, batch_size=100):
+        import numpy as np
+        from embedding_cache import EmbeddingCache
+
+        self.np = np
+        self.client = client
+        self.cache = EmbeddingCache(cache_path)
+        self.batch_size = batch_size
+        self.calls = 0
+
+    def embed(self, texts):
+        vectors = [self.cache.get(t, EMBEDDING_MODEL) for t in texts]
+        missing = sorted({t for t, v in zip(texts, vectors) if v is None})
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            response = self.client.embeddings.create(model=EMBEDDING_MODEL, input=batch)
+            self.calls += 1
+            for item in response.data:
+                self.cache.put(batch[item.index], EMBEDDING_MODEL, item.embedding)
+        vectors = [v if v is not None else self.cache.get(t, EMBEDDING_MODEL) for t, v in zip(texts, vectors)]
+        return self.np.asarray(vectors, dtype=self.np.float32)
+
+
+def dense_matches(chunks, embedder, probe_vectors, top_k):
+    from vector_index import LocalVectorIndex, normalize_rows
+
+    index = LocalVectorIndex(
+        normalize_rows(embedder.embed([c["text_chunk"] for c in chunks])),
+        [{"id": str(i), "metadata": c} for i, c in enumerate(chunks)],
+        mode="brute",
+    )
+    return [index.query(vector=v, top_k=top_k).matches for v in probe_vectors]
+
+
+def run_setting(transcripts, setting, probes, top_k, counter, embedder=None, probe_vectors=None):
+    chunks = build_chunks(transcripts, setting)
+    if embedder is not None:
+        results = dense_matches(chunks, embedder, probe_vectors, top_k)
+    else:
+        bm25 = BM25Index([c["text_chunk"] for c in chunks], [str(i) for i in range(len(chunks))], chunks)
+        results = [bm25.query(p["query"], top_k).matches for p in probes]
+
+    hits, prompt_tokens = 0, 0
+    for probe, matches in zip(probes, results):
+        hits += any(_contains(m.metadata, probe) for m in matches)
+        prompt_tokens += counter.count("\n\n".join(m.metadata["text_chunk"] for m in matches))
+
+    words = [len(c["text_chunk"].split()) for c in chunks]
+    return {
+        "setting": setting,
+        "chunks": len(chunks),
+        "words_per_chunk": sum(words) / len(words) if words else 0.0,
+        "indexed_words": sum(words),
+        "prompt_tokens": prompt_tokens / len(probes) if probes else 0.0,
+        "hit_rate": hits / len(probes) if probes else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare chunking settings on the processed transcripts.")
+    parser.add_argument("--processed-dir", default=PROCESSED_DIR)
+    parser.add_argument("--settings", nargs="+", default=DEFAULT_SETTINGS,
+                        help="words:N (fixed chunker) or a chunking.py granularity / WINDOW:OVERLAP")
+    parser.add_argument("--probes", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--questions", help="held-out questions JSONL instead of paraphrased probes")
+    parser.add_argument("--masked-probes", action="store_true",
+                        help="transcript sentences with words dropped (offline; too easy to rank settings)")
+    parser.add_argument("--bm25", action="store_true", help="BM25 retrieval instead of embeddings (offline)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    client = None
+    if not (args.bm25 and (args.masked_probes or args.questions)):
+        from dotenv import load_dotenv
+        from openai import OpenAI
+
+        load_dotenv()
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    transcripts = load_transcripts(args.processed_dir)
+    if args.questions:
+        probes, kind = load_questions(args.questions), "held-out"
+    elif args.masked_probes:
+        probes, kind = masked_probes(transcripts, args.probes, args.seed), "masked"
+    else:
+        probes, kind = paraphrased_probes(transcripts, args.probes, args.seed, client), "paraphrased"
+    counter = TokenCounter()
+
+    embedder = probe_vectors = None
+    if not args.bm25:
+        embedder = Embedder(client)
+        probe_vectors = embedder.embed([p["query"] for p in probes])  # once, shared by every setting
+
+    results = [
+        run_setting(transcripts, s, probes, args.top_k, counter, embedder, probe_vectors)
+        for s in args.settings
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{len(transcripts)} transcripts, {len(probes)} {kind} probes, top-{args.top_k}, "
+          f"{'BM25' if args.bm25 else 'embeddings'}"
+          f"{f', {embedder.calls} embedding calls' if embedder else ''}\n")
+    print(f"{'setting':<12}{'chunks':>8}{'words/chunk':>13}{'indexed words':>15}"
+          f"{'prompt tokens':>15}{'hit@k':>8}")
+    for r in results:
+        print(f"{r['setting']:<12}{r['chunks']:>8}{r['words_per_chunk']:>13.1f}{r['indexed_words']:>15}"
+              f"{r['prompt_tokens']:>15.1f}{r['hit_rate']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
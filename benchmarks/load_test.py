@@ -0,0 +1,476 @@
+# ======================================================
+#                    load_test.py
+#    OFFLINE LOAD TEST OF THE ASYNC CHAT PIPELINE
+# ======================================================
+#
+# Drives rag_agent_async.chat_turn_stream (what the Gradio chat_fn
+# runs) with many concurrent simulated users, against local
+# stand-ins instead of the paid services:
+#   - an OpenAI-compatible HTTP stub (/v1/embeddings, /v1/chat/completions
+#     incl. streaming and tool calls) with injected latency and errors,
+#     running in its own process
+#   - a SerpAPI-shaped search stub on the same server
+#   - the in-memory vector index (RETRIEVER_BACKEND=local) built from
+#     output/rag_dataset.json with deterministic hashed embeddings
+#
+# Reports p50/p95/p99 per stage (embedding, retrieval, agent + search,
+# search, first token, completion) and end to end, plus turns/sec.
+#
+# Usage:
+#   python benchmarks/load_test.py --users 50 --turns 4
+#   python benchmarks/load_test.py --latency 0.3 --token-delay 0.01 --error-rate 0.02 --json
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import hashlib
+import multiprocessing
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import urlopen
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(BASE_DIR, "app")
+sys.path.insert(0, APP_DIR)
+
+DATASET_PATH = os.path.join(BASE_DIR, "output", "rag_dataset.json")
+EMBEDDING_DIM = 1536
+WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+# ======================================================
+# DETERMINISTIC EMBEDDINGS
+# ======================================================
+def fake_embedding(text, dim=EMBEDDING_DIM):
+    """Feature-hashed bag of words: texts sharing words get similar vectors."""
+    v = np.zeros(dim, dtype=np.float32)
+    for word in WORD_RE.findall(text.lower()):
+        h = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+        v[h % dim] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+
+# ======================================================
+# OPENAI + SERPAPI STUB SERVER
+# ======================================================
+class StubConfig:
+    def __init__(self, latency=0.05, jitter=0.5, token_delay=0.005, answer_tokens=60,
+                 search_latency=0.2, error_rate=0.0, miss_rate=0.1, seed=0):
+        self.latency = latency            # seconds before any response byte
+        self.jitter = jitter              # +/- share of latency, uniform
+        self.token_delay = token_delay    # seconds between streamed tokens
+        self.answer_tokens = answer_tokens
+        self.search_latency = search_latency
+        self.error_rate = error_rate      # share of requests answered with HTTP 500
+        self.miss_rate = miss_rate        # share of RAG answers that say "does not explain"
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+
+    def sleep(self, base):
+        with self.lock:
+            factor = 1 + self.rng.uniform(-self.jitter, self.jitter)
+        time.sleep(max(0.0, base * factor))
+
+    def roll(self, rate):
+        with self.lock:
+            return self.rng.random() < rate
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+    config = None                  # set on the subclass by serve_stub
+    no_answer = ""
+
+    def log_message(self, *args):
+        pass
+
+    # ------------------------------
+    # Helpers
+    # ------------------------------
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _maybe_fail(self, name):
+        self.config.requests[name] += 1
+        if self.config.roll(self.config.error_rate):
+            self._send_json(500, {"error": {"message": "injected failure", "type": "server_error"}})
+            return True
+        return False
+
+    # ------------------------------
+    # Routes
+    # ------------------------------
+    def do_GET(self):
+        if self.path == "/_stats":
+            return self._send_json(200, dict(self.config.requests))
+        if self.path.endswith("/models"):
+            return self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        if not self.path.startswith("/search.json"):
+            return self._send_json(404, {"error": "not found"})
+        self.config.sleep(self.config.search_latency)
+        if self._maybe_fail("search"):
+            return
+        self._send_json(200, {"organic_results": [
+            {"snippet": f"Stub search result {i} for this question."} for i in range(3)
+        ]})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path.endswith("/embeddings"):
+            return self._embeddings(body)
+        if self.path.endswith("/chat/completions"):
+            return self._chat(body)
+        self._send_json(404, {"error": {"message": "not found"}})
+
+    def _embeddings(self, body):
+        self.config.sleep(self.config.latency)
+        if self._maybe_fail("embeddings"):
+            return
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        self._send_json(200, {
+            "object": "list",
+            "model": body.get("model"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(t).tolist()}
+                for i, t in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": 8 * len(inputs), "total_tokens": 8 * len(inputs)},
+        })
+
+    def _chat(self, body):
+        self.config.sleep(self.config.latency)
+        if self._maybe_fail("chat"):
+            return
+
+        created = int(time.time())
+        question = body["messages"][-1]["content"]
+        usage = {"prompt_tokens": len(json.dumps(body["messages"])) // 4,
+                 "completion_tokens": self.config.answer_tokens,
+                 "total_tokens": len(json.dumps(body["messages"])) // 4 + self.config.answer_tokens}
+
+        if body.get("tools") and body.get("tool_choice") != "none" and body["messages"][-1]["role"] != "tool":
+            # Agent without search results yet: search for the question as asked
+            call = {"id": "call_stub", "type": "function", "function": {
+                "name": "internet_search", "arguments": json.dumps({"query": question})}}
+            if not body.get("stream"):
+                message = {"role": "assistant", "content": None, "tool_calls": [call]}
+                return self._send_json(200, {
+                    "id": "chatcmpl-stub", "object": "chat.completion", "created": created,
+                    "model": body["model"], "usage": usage,
+                    "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls"}],
+                })
+            return self._stream(body, created, usage, [{"tool_calls": [{"index": 0, **call}]}])
+
+        if "Video Context" in question and self.config.roll(self.config.miss_rate):
+            tokens = self.no_answer.split(" ")
+        else:
+            tokens = [f"word{i}" for i in range(self.config.answer_tokens)]
+
+        if not body.get("stream"):
+            message = {"role": "assistant", "content": " ".join(tokens)}
+            return self._send_json(200, {
+                "id": "chatcmpl-stub", "object": "chat.completion", "created": created,
+                "model": body["model"], "usage": usage,
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            })
+
+        self._stream(body, created, usage, [{"content": t if i == 0 else " " + t} for i, t in enumerate(tokens)])
+
+    def _stream(self, body, created, usage, deltas):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for delta in deltas:
+            event = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created,
+                     "model": body["model"],
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            self._chunk(f"data: {json.dumps(event)}\n\n".encode())
+            if self.config.token_delay:
+                time.sleep(self.config.token_delay)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            event = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created,
+                     "model": body["model"], "choices": [], "usage": usage}
+            self._chunk(f"data: {json.dumps(event)}\n\n".encode())
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+
+def serve_stub(config_kwargs, no_answer, port_queue):
+    """Child process: the stub gets its own interpreter, so its work does
+    not compete with the pipeline under test for the GIL."""
+    config = StubConfig(**config_kwargs)
+    handler = type("Handler", (StubHandler,), {"config": config, "no_answer": no_answer})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_stub_server(config_kwargs, no_answer):
+    """Returns (process, port)."""
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=serve_stub, args=(config_kwargs, no_answer, port_queue), daemon=True
+    )
+    process.start()
+    return process, port_queue.get(timeout=30)
+
+
+def stub_stats(port):
+    with urlopen(f"http://127.0.0.1:{port}/_stats") as response:
+        return json.loads(response.read())
+
+
+# ======================================================
+# ENVIRONMENT (before the app modules are imported)
+# ======================================================
+def prepare_environment(port, workdir, answer_cache=True):
+    from vector_index import LocalVectorIndex
+
+    with open(DATASET_PATH, "r", encoding="utf-8") as f:
+        dataset = json.load(f)
+    index_dir = os.path.join(workdir, "vector_index")
+    LocalVectorIndex.save(
+        index_dir,
+        [item.get("id", str(i)) for i, item in enumerate(dataset)],
+        np.stack([fake_embedding(item["text_chunk"]) for item in dataset]),
+        dataset,
+    )
+
+    os.environ.update({
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{port}/v1",
+        "SERPAPI_KEY": "stub",
+        "SERPAPI_URL": f"http://127.0.0.1:{port}/search.json",
+        "RETRIEVER_BACKEND": "local",
+        "LOCAL_INDEX_DIR": index_dir,
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embeddings.sqlite"),
+        "MEMORY_BACKEND": "memory",
+    })
+    if not answer_cache:
+        os.environ["ANSWER_CACHE_THRESHOLD"] = "2"  # cosine never reaches it
+    return dataset
+
+
+# ======================================================
+# STAGE TIMERS
+# ======================================================
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def add(self, stage, seconds):
+        self.samples[stage].append(seconds)
+
+
+def instrument(rag_async, recorder):
+    """Wrap the pipeline's stage functions with timers (this process only)."""
+
+    def timed(name, fn):
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                recorder.add(name, time.perf_counter() - start)
+        return wrapper
+
+    def timed_stream(fn):
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            first = True
+            async for delta in fn(*args, **kwargs):
+                if first:
+                    recorder.add("first_token", time.perf_counter() - start)
+                    first = False
+                yield delta
+            recorder.add("completion", time.perf_counter() - start)
+        return wrapper
+
+    def timed_agent(fn):
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                async for answer in fn(*args, **kwargs):
+                    yield answer
+            finally:
+                recorder.add("agent+search", time.perf_counter() - start)
+        return wrapper
+
+    original_embed = rag_async.embed_query
+
+    async def embed_query(query):
+        # Only count calls that reach the stub, not embedding-cache hits
+        if rag_async.get_embedding_cache().get(query, rag_async.EMBEDDING_MODEL) is not None:
+            return await original_embed(query)
+        return await timed("embedding", original_embed)(query)
+
+    rag_async.embed_query = embed_query
+    rag_async.retrieve_matches = timed("retrieval", rag_async.retrieve_matches)
+    rag_async.run_agent = timed_agent(rag_async.run_agent)
+    rag_async.internet_search = timed("search", rag_async.internet_search)
+    rag_async.stream_completion = timed_stream(rag_async.stream_completion)
+
+
+# ======================================================
+# SIMULATED USERS
+# ======================================================
+def make_workload(dataset, seed):
+    rng = random.Random(seed)
+    topics = []
+    for item in dataset:
+        words = item["text_chunk"].split()
+        for _ in range(5):
+            start = rng.randrange(max(1, len(words) - 8))
+            topics.append(" ".join(words[start:start + 8]))
+
+    def next_query():
+        r = rng.random()
+        if r < 0.7:
+            return f"what does the video say about {rng.choice(topics)}"
+        if r < 0.8:
+            return "give me an example"
+        if r < 0.9:
+            return "what is the latest news about ethereum today"
+        return rng.choice(["solidity", "base", "nft", "smart contract"])
+
+    return next_query
+
+
+async def simulated_user(rag_async, user_id, turns, next_query, think_time, recorder, outcomes):
+    session = f"load-user-{user_id}"
+    for _ in range(turns):
+        query = next_query()
+        start = time.perf_counter()
+        first = None
+        source = None
+        try:
+            async for source, text in rag_async.chat_turn_stream(query, session):
+                if first is None and text:
+                    first = time.perf_counter() - start
+            recorder.add("end_to_end", time.perf_counter() - start)
+            if first is not None:
+                recorder.add("time_to_first_text", first)
+            outcomes[source] += 1
+        except Exception as e:  # a failed turn is a data point, not a crash
+            recorder.add("failed_turn", time.perf_counter() - start)
+            outcomes[f"error:{type(e).__name__}"] += 1
+        if think_time:
+            await asyncio.sleep(think_time)
+
+
+async def run_load(rag_async, users, turns, next_query, think_time, recorder):
+    outcomes = defaultdict(int)
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        simulated_user(rag_async, i, turns, next_query, think_time, recorder, outcomes)
+        for i in range(users)
+    ))
+    return time.perf_counter() - start, outcomes
+
+
+def summarize(recorder):
+    rows = {}
+    for stage, values in recorder.samples.items():
+        ms = np.asarray(values) * 1000
+        rows[stage] = {
+            "count": len(values),
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)),
+        }
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the async chat pipeline.")
+    parser.add_argument("--users", type=int, default=20, help="concurrent simulated users")
+    parser.add_argument("--turns", type=int, default=5, help="chat turns per user")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds between a user's turns")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub OpenAI latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.5, help="+/- share of latency")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="seconds between streamed tokens")
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--search-latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of stub requests failing with 500")
+    parser.add_argument("--miss-rate", type=float, default=0.1, help="share of RAG answers that miss")
+    parser.add_argument("--no-answer-cache", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    config = {
+        "latency": args.latency, "jitter": args.jitter, "token_delay": args.token_delay,
+        "answer_tokens": args.answer_tokens, "search_latency": args.search_latency,
+        "error_rate": args.error_rate, "miss_rate": args.miss_rate, "seed": args.seed,
+    }
+    workdir = tempfile.mkdtemp(prefix="chainmind-load-")
+
+    # The stub needs the "does not explain" sentence before rag_agent is
+    # importable, so read it from the source rather than importing early.
+    with open(os.path.join(APP_DIR, "rag_agent.py"), "r", encoding="utf-8") as f:
+        no_answer = re.search(r'^NO_ANSWER = "(.*)"$', f.read(), re.M).group(1)
+
+    server, port = start_stub_server(config, no_answer)
+    dataset = prepare_environment(port, workdir, not args.no_answer_cache)
+
+    import rag_agent_async
+    recorder = Recorder()
+    instrument(rag_agent_async, recorder)
+
+    next_query = make_workload(dataset, args.seed)
+    elapsed, outcomes = asyncio.run(
+        run_load(rag_agent_async, args.users, args.turns, next_query, args.think_time, recorder)
+    )
+    requests = stub_stats(port)
+    server.terminate()
+
+    total = sum(outcomes.values())
+    report = {
+        "users": args.users,
+        "turns": total,
+        "seconds": elapsed,
+        "turns_per_sec": total / elapsed if elapsed else 0.0,
+        "outcomes": dict(outcomes),
+        "stub_requests": requests,
+        "stages": summarize(recorder),
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{args.users} users x {args.turns} turns: {total} turns in {elapsed:.2f}s "
+          f"= {report['turns_per_sec']:.1f} turns/s")
+    print("outcomes:", ", ".join(f"{k}={v}" for k, v in sorted(outcomes.items())))
+    print("stub requests:", ", ".join(f"{k}={v}" for k, v in sorted(requests.items())))
+    print(f"\n{'stage':<20}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, row in sorted(report["stages"].items()):
+        print(f"{stage:<20}{row['count']:>7}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
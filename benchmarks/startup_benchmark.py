@@ -0,0 +1,156 @@
+# ======================================================
+#                startup_benchmark.py
+#       IMPORT TIME, WARM-UP AND FIRST-REQUEST LATENCY
+# ======================================================
+#
+# Each sample is a fresh interpreter (what a newly scaled-out worker
+# sees), measuring:
+#   import     import rag_agent_async (and everything it pulls in)
+#   warm-up    rag_agent.warm_up() + rag_agent_async.warm_up()
+#   first      first chat turn on that worker
+#   second     the next chat turn (steady state, for comparison)
+#
+# "cold" samples skip the warm-up, so their first turn pays for client
+# construction, index loading and connection setup; "warm" samples run
+# it first. A worker is ready when first ~= second.
+#
+# Offline by default: the OpenAI / SerpAPI stub and local vector index
+# from load_test.py. --live uses the real services from .env (quota).
+#
+# Usage:
+#   python benchmarks/startup_benchmark.py
+#   python benchmarks/startup_benchmark.py --samples 5 --latency 0.3 --json
+
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(BASE_DIR, "app")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+QUERIES = ("What is a blockchain wallet?", "How does proof of stake work?")
+COLUMNS = ("import", "warm_up", "first", "second")
+
+
+# ======================================================
+# ONE SAMPLE (child process)
+# ======================================================
+def run_sample(warm):
+    result = {}
+
+    start = time.perf_counter()
+    import rag_agent
+    import rag_agent_async
+    result["import"] = time.perf_counter() - start
+
+    async def turns():
+        if warm:
+            start = time.perf_counter()
+            result["steps"] = rag_agent.warm_up()
+            await rag_agent_async.warm_up()
+            result["warm_up"] = time.perf_counter() - start
+
+        for name, query in zip(("first", "second"), QUERIES):
+            start = time.perf_counter()
+            _, result[name + "_route"] = await rag_agent_async.chat_turn(query, "startup-benchmark")
+            result[name] = time.perf_counter() - start
+
+    asyncio.run(turns())
+    return result
+
+
+def sample(warm, workdir, n):
+    env = dict(os.environ)
+    # Own embedding cache per sample: every worker starts empty
+    env["EMBEDDING_CACHE_PATH"] = os.path.join(workdir, f"embeddings-{'warm' if warm else 'cold'}-{n}.sqlite")
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", "warm" if warm else "cold"],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+# ======================================================
+# REPORT
+# ======================================================
+def summarize(samples):
+    row = {}
+    for column in COLUMNS:
+        values = [s[column] for s in samples if s.get(column) is not None]
+        row[column + "_ms"] = statistics.median(values) * 1000 if values else None
+    steps = {}
+    for s in samples:
+        for step, seconds in (s.get("steps") or {}).items():
+            steps.setdefault(step, []).append(seconds)
+    row["warm_up_steps_ms"] = {
+        step: (statistics.median([v for v in values if v is not None]) * 1000
+               if any(v is not None for v in values) else None)
+        for step, values in steps.items()
+    }
+    return row
+
+
+def _ms(value):
+    return f"{value:>12.1f}" if value is not None else f"{'-':>12}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start vs warmed-up worker latency.")
+    parser.add_argument("--samples", type=int, default=3, help="fresh processes per mode")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub OpenAI latency (s)")
+    parser.add_argument("--live", action="store_true", help="use the real services from .env (uses quota)")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--child", choices=("cold", "warm"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_sample(args.child == "warm")))
+        return
+
+    workdir = tempfile.mkdtemp(prefix="chainmind-startup-")
+    server = None
+    if not args.live:
+        from load_test import start_stub_server, prepare_environment
+
+        with open(os.path.join(APP_DIR, "rag_agent.py"), "r", encoding="utf-8") as f:
+            no_answer = re.search(r'^NO_ANSWER = "(.*)"$', f.read(), re.M).group(1)
+        server, port = start_stub_server({"latency": args.latency, "miss_rate": 0.0}, no_answer)
+        prepare_environment(port, workdir)  # children inherit the environment
+
+    try:
+        report = {
+            mode: summarize([sample(mode == "warm", workdir, n) for n in range(args.samples)])
+            for mode in ("cold", "warm")
+        }
+    finally:
+        if server is not None:
+            server.terminate()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{args.samples} fresh processes per mode, {'live services' if args.live else 'local stubs'}, "
+          f"median ms\n")
+    print(f"{'mode':<8}" + "".join(f"{c:>12}" for c in COLUMNS))
+    for mode, row in report.items():
+        print(f"{mode:<8}" + "".join(_ms(row[c + "_ms"]) for c in COLUMNS))
+
+    steps = report["warm"]["warm_up_steps_ms"]
+    if steps:
+        print("\nwarm-up steps: " + ", ".join(
+            f"{step}={'failed' if ms is None else f'{ms:.1f}ms'}" for step, ms in steps.items()
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# ======================================================
+#                   test_ingest.py
+#        TOKEN BUCKET: REFILL, DEBT, LONG-RUN RATE
+# ======================================================
+
+import pytest
+
+import ingest
+from ingest import TokenBucket
+
+
+class FakeClock:
+    """time.monotonic / time.sleep that only move when someone sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ingest.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(ingest.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_starts_full_and_refills_at_rate(clock):
+    bucket = TokenBucket(rate=10, capacity=10)
+    bucket.acquire(10)
+    assert clock.now == 0.0
+
+    bucket.acquire(5)
+    assert clock.now == pytest.approx(0.5)
+
+
+def test_refill_is_capped_at_capacity(clock):
+    bucket = TokenBucket(rate=10, capacity=10)
+    bucket.acquire(10)
+    clock.now += 100.0  # idle: the bucket holds 10, not 1000
+
+    bucket.acquire(10)
+    start = clock.now
+    bucket.acquire(10)
+    assert clock.now - start == pytest.approx(1.0)
+
+
+def test_request_larger_than_capacity_leaves_debt(clock):
+    bucket = TokenBucket(rate=10, capacity=10)
+
+    bucket.acquire(30)             # waits for a full bucket only...
+    assert clock.now == 0.0
+    bucket.acquire(1)              # ...but the next one pays the 20 of debt back
+    assert clock.now == pytest.approx(2.1)
+
+
+def test_long_run_rate_holds_with_oversized_requests(clock):
+    bucket = TokenBucket(rate=100, capacity=50)
+    for _ in range(10):
+        bucket.acquire(200)
+    # Every request after the first waits for its full 200 tokens: 100/s holds
+    assert clock.now == pytest.approx(9 * 200 / 100)
+
+
+def test_drain_empties_the_bucket(clock):
+    bucket = TokenBucket(rate=10, capacity=10)
+    bucket.drain()
+    bucket.acquire(1)
+    assert clock.now == pytest.approx(0.1)
@@ -0,0 +1,85 @@
+# ======================================================
+#                test_lexical_index.py
+#           BM25 RANKING + RECIPROCAL RANK FUSION
+# ======================================================
+
+import json
+
+import pytest
+
+from lexical_index import BM25Index, reciprocal_rank_fusion, terms, RRF_K
+from vector_index import Match
+
+DATASET = [
+    {"video_title": "Base", "text_chunk": "deploy the ERC-721 contract on Base with Foundry"},
+    {"video_title": "Base", "text_chunk": "the game loop and the game state live off chain"},
+    {"video_title": "Roadmap", "text_chunk": "learn Solidity first then Foundry then build a game"},
+    {"video_title": "Roadmap", "text_chunk": "networking and a portfolio matter more than a degree"},
+]
+
+
+@pytest.fixture
+def index():
+    return BM25Index(
+        [d["text_chunk"] for d in DATASET],
+        [str(i) for i in range(len(DATASET))],
+        DATASET,
+    )
+
+
+def ids(result):
+    return [m.id for m in result.matches]
+
+
+def test_hyphenated_terms_match_their_parts():
+    assert {"erc-721", "erc", "721"} <= set(terms("ERC-721"))
+
+
+def test_exact_term_ranks_its_chunk_first(index):
+    assert ids(index.query("solidity", top_k=1)) == ["2"]
+    assert ids(index.query("erc 721", top_k=1)) == ["0"]
+
+
+def test_repeated_term_outranks_single_mention(index):
+    assert ids(index.query("game", top_k=2)) == ["1", "2"]
+
+
+def test_stopwords_and_unknown_terms_give_no_matches(index):
+    assert ids(index.query("what is the")) == []
+    assert ids(index.query("zkrollup")) == []
+
+
+def test_top_k_never_returns_zero_scores(index):
+    assert ids(index.query("portfolio", top_k=3)) == ["3"]
+
+
+def test_filter_keeps_only_scoped_rows(index):
+    assert ids(index.query("foundry", top_k=3, filter={"video_title": "Roadmap"})) == ["2"]
+
+
+def test_from_dataset_uses_ids_or_positions(tmp_path):
+    path = tmp_path / "rag_dataset.json"
+    path.write_text(json.dumps([dict(DATASET[0], id="abc"), DATASET[1]]), encoding="utf-8")
+    index = BM25Index.from_dataset(str(path))
+
+    assert index.ids == ["abc", "1"]
+    assert "foundry" in index
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    vector = [Match("a", 0.9, {}), Match("b", 0.8, {}), Match("c", 0.7, {})]
+    lexical = [Match("b", 12.0, {}), Match("c", 9.0, {})]
+
+    fused = reciprocal_rank_fusion([vector, lexical], top_k=3)
+
+    assert [m.id for m in fused] == ["b", "c", "a"]
+    assert fused[0].score == pytest.approx(1 / (RRF_K + 2) + 1 / (RRF_K + 1))
+    assert fused[2].score == pytest.approx(1 / (RRF_K + 1))  # top of one list only
+
+
+def test_rrf_keeps_metadata_of_first_ranking_and_truncates():
+    fused = reciprocal_rank_fusion([[Match("a", 1.0, {"from": "vector"})], [Match("a", 5.0, {"from": "bm25"})]], top_k=1)
+
+    assert len(fused) == 1
+    assert fused[0].metadata == {"from": "vector"}
+    assert reciprocal_rank_fusion([[], []]) == []
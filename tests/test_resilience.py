@@ -0,0 +1,150 @@
+# ======================================================
+#                 test_resilience.py
+#        CIRCUIT BREAKER: SETTLE, RELEASE, HALF-OPEN
+# ======================================================
+
+import asyncio
+
+import pytest
+
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, call, acall, request_budget
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code):
+        super().__init__(status_code)
+        self.status_code = status_code
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def open_breaker(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30.0)
+    breaker.settle(TimeoutError())
+    breaker.settle(HTTPError(503))
+    assert breaker.state == "open"
+    clock[0] += 30.0
+    assert breaker.state == "half-open"
+    return breaker
+
+
+def test_retryable_errors_open_the_breaker(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    breaker.settle(ConnectionError())
+    assert breaker.state == "closed"
+    breaker.settle(HTTPError(429))
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    breaker.settle(TimeoutError())
+    breaker.settle()
+    breaker.settle(TimeoutError())
+    assert breaker.state == "closed"
+
+
+@pytest.mark.parametrize("error", [
+    HTTPError(400),           # the request was wrong, not the service
+    DeadlineExceeded(),       # the turn ran out of time
+    KeyboardInterrupt(),      # not an Exception at all
+])
+def test_non_retryable_errors_do_not_count(clock, error):
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    breaker.settle(error)
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_half_open_allows_a_single_trial(clock):
+    breaker = open_breaker(clock)
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_successful_trial_closes(clock):
+    breaker = open_breaker(clock)
+    assert breaker.allow()
+    breaker.settle()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_failed_trial_reopens(clock):
+    breaker = open_breaker(clock)
+    assert breaker.allow()
+    breaker.settle(TimeoutError())
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+@pytest.mark.parametrize("error", [HTTPError(404), DeadlineExceeded(), KeyboardInterrupt()])
+def test_inconclusive_trial_is_released(clock, error):
+    breaker = open_breaker(clock)
+    assert breaker.allow()
+    breaker.settle(error)  # says nothing about the service's health
+
+    assert breaker.state == "half-open"
+    assert breaker.allow()       # the next call is the trial
+    assert not breaker.allow()
+
+
+def test_release_without_trial_is_harmless(clock):
+    breaker = CircuitBreaker("test")
+    breaker.release()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+# ------------------------------
+# Timeouts in call() / acall()
+# ------------------------------
+def timing_out(timeout):
+    raise TimeoutError(f"no answer in {timeout:.2f}s")
+
+
+async def hanging(timeout):
+    await asyncio.sleep(10)
+
+
+def test_service_timeout_counts_as_failure():
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    with pytest.raises(TimeoutError):
+        call(timing_out, 5.0, breaker, attempts=1)
+    assert breaker.state == "open"
+
+
+def test_budget_bound_timeout_is_not_a_failure():
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    with request_budget(1.0), pytest.raises(TimeoutError):
+        call(timing_out, 5.0, breaker, attempts=1)  # timeout was the 1s left, not the 5s cap
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_async_service_timeout_counts_as_failure():
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    with pytest.raises(TimeoutError):
+        asyncio.run(acall(hanging, 0.05, breaker, attempts=1))
+    assert breaker.state == "open"
+
+
+def test_async_budget_bound_timeout_is_not_a_failure():
+    breaker = CircuitBreaker("test", failure_threshold=1)
+
+    async def run():
+        with request_budget(0.05):
+            await acall(hanging, 5.0, breaker)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(run())
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
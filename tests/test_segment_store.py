@@ -0,0 +1,111 @@
+# ======================================================
+#                test_segment_store.py
+#       SEGMENT FILE: WRITE / READ ROUND TRIP, QUERIES
+# ======================================================
+
+import numpy as np
+import pytest
+
+from segment_store import write_segment, Segment, SegmentIndex, MAGIC
+
+DIM = 16
+
+
+def corpus(n=6, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, DIM)).astype(np.float32)
+    ids = [f"chunk-{i}" for i in range(n)]
+    metadata = [
+        {
+            "video_title": "Base game" if i % 2 else "Roadmap ✓",
+            "url": f"https://www.youtube.com/watch?v={'b' if i % 2 else 'r'}",
+            "text_chunk": f"chunk number {i} — with ünïcode",
+            "start_time": f"00:0{i}:00.250",
+            "end_time": f"00:0{i}:59.750",
+        }
+        for i in range(n)
+    ]
+    metadata[1]["summary"] = "a short summary"
+    metadata[2]["level"] = "fine"
+    return ids, vectors, metadata
+
+
+@pytest.mark.parametrize("quantization", ["int8", "float16"])
+@pytest.mark.parametrize("keep_full", [False, True])
+def test_round_trip(tmp_path, quantization, keep_full):
+    ids, vectors, metadata = corpus()
+    path = str(tmp_path / "corpus.seg")
+    write_segment(path, ids, vectors, metadata, quantization=quantization, keep_full=keep_full)
+
+    segment = Segment(path)
+    assert len(segment) == len(ids)
+    assert segment.dim == DIM
+    assert segment.quantization == quantization
+    assert (segment.full is not None) == keep_full
+    assert [(i, m) for i, m in segment.records()] == list(zip(ids, metadata))
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    restored = segment.vectors(np.arange(len(ids)))
+    restored /= np.linalg.norm(restored, axis=1, keepdims=True)
+    np.testing.assert_allclose(restored, normalized, atol=1e-6 if keep_full else 0.02)
+
+
+def test_query_finds_each_row_itself(tmp_path):
+    ids, vectors, metadata = corpus()
+    path = str(tmp_path / "corpus.seg")
+    write_segment(path, ids, vectors, metadata)
+    index = SegmentIndex.load(path)
+
+    for i, vector in enumerate(vectors):
+        match = index.query(vector, top_k=1).matches[0]
+        assert match.id == ids[i]
+        assert match.metadata == metadata[i]
+        assert match.score == pytest.approx(1.0, abs=0.02)
+
+
+def test_filter_scans_only_that_video(tmp_path):
+    ids, vectors, metadata = corpus()
+    path = str(tmp_path / "corpus.seg")
+    write_segment(path, ids, vectors, metadata)
+    index = SegmentIndex.load(path)
+
+    result = index.query(vectors[0], top_k=6, filter={"video_title": "Base game"})
+    assert sorted(m.id for m in result.matches) == ["chunk-1", "chunk-3", "chunk-5"]
+    assert index.query(vectors[0], top_k=3, filter={"video_title": "missing"}).matches == []
+
+
+def test_rescore_needs_the_full_column(tmp_path):
+    ids, vectors, metadata = corpus()
+    quantized, full = str(tmp_path / "q.seg"), str(tmp_path / "f.seg")
+    write_segment(quantized, ids, vectors, metadata)
+    write_segment(full, ids, vectors, metadata, keep_full=True)
+
+    assert not SegmentIndex.load(quantized, rescore=True).rescore
+    assert SegmentIndex.load(full, rescore=True).rescore
+    assert not SegmentIndex.load(full, rescore=False).rescore
+
+    exact = SegmentIndex.load(full).query(vectors[3], top_k=1).matches[0]
+    assert exact.score == pytest.approx(1.0, abs=1e-5)
+
+
+def test_get_vectors_by_id(tmp_path):
+    ids, vectors, metadata = corpus()
+    path = str(tmp_path / "corpus.seg")
+    write_segment(path, ids, vectors, metadata, keep_full=True)
+
+    found, missing = SegmentIndex.load(path).get_vectors(["chunk-2", "nope"])
+    np.testing.assert_allclose(found, vectors[2] / np.linalg.norm(vectors[2]), atol=1e-6)
+    assert missing is None
+
+
+def test_empty_segment(tmp_path):
+    path = str(tmp_path / "corpus.seg")
+    write_segment(path, [], [], [])
+    assert len(Segment(path)) == 0
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "not.seg"
+    path.write_bytes(b"x" * (len(MAGIC) + 8))
+    with pytest.raises(ValueError):
+        Segment(str(path))
@@ -0,0 +1,41 @@
+# ======================================================
+#                  test_timeline.py
+#        TIME SCOPES IN QUESTIONS ("around minute 12")
+# ======================================================
+
+import pytest
+
+from timeline import parse_time_scope, clock_seconds, format_clock, AROUND_SECONDS
+
+
+@pytest.mark.parametrize("query, scope", [
+    ("what does the Base video say around minute 12", (12 * 60 - AROUND_SECONDS, 12 * 60 + AROUND_SECONDS)),
+    ("what happens 5 minutes in", (5 * 60 - AROUND_SECONDS, 5 * 60 + AROUND_SECONDS)),
+    ("is it 16:9 at 4:30", (270 - AROUND_SECONDS, 270 + AROUND_SECONDS)),
+    ("what is said around 1:02:03", (3723 - AROUND_SECONDS, 3723 + AROUND_SECONDS)),
+    ("between minute 3 and 5", (180, 300)),
+    ("from 10:00 to 8:30", (510, 600)),
+    ("summarise the first 2 minutes", (0, 120)),
+    ("what happens in the last 5 minutes", (-300, None)),
+    ("at minute 0.5", (0, 30 + AROUND_SECONDS)),
+])
+def test_explicit_time_expressions(query, scope):
+    assert parse_time_scope(query) == scope
+
+
+@pytest.mark.parametrize("query", [
+    "should my game render in 16:9",
+    "what is in the intro",
+    "how does it end",
+    "what are the 3 steps to mint",
+    "explain erc-1155 in 5 minutes or less",
+])
+def test_questions_without_a_time_scope(query):
+    assert parse_time_scope(query) is None
+
+
+def test_clock_round_trip():
+    assert clock_seconds("12:30") == 750
+    assert clock_seconds("1:02:03") == 3723
+    assert format_clock(750) == "12:30"
+    assert format_clock(3723) == "1:02:03"
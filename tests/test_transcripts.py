@@ -0,0 +1,89 @@
+# ======================================================
+#                 test_transcripts.py
+#        VTT CLEANING: ROLLING-CAPTION TAIL OVERLAP
+# ======================================================
+
+import json
+
+from transcripts import clean_vtt, clean_vtt_to_json, _overlap
+
+HEADER = "WEBVTT\nKind: captions\nLanguage: en\n\n"
+
+
+def write_vtt(tmp_path, cues):
+    """cues: (start, end, [lines]) -> path of a .vtt file."""
+    body = "".join(f"{start} --> {end} align:start position:0%\n" + "\n".join(lines) + "\n\n"
+                   for start, end, lines in cues)
+    path = tmp_path / "video.vtt"
+    path.write_text(HEADER + body, encoding="utf-8")
+    return str(path)
+
+
+def texts(path):
+    return [e["text"] for e in clean_vtt(path)]
+
+
+def test_youtube_rolling_captions_keep_each_word_once(tmp_path):
+    path = write_vtt(tmp_path, [
+        ("00:00:00.160", "00:00:03.270", [" ", "welcome<00:00:00.400><c> everybody</c><00:00:01.000><c> today</c>"]),
+        ("00:00:03.270", "00:00:03.280", ["welcome everybody today", " "]),
+        ("00:00:03.280", "00:00:05.590", ["welcome everybody today", "i<00:00:03.500><c> wanna</c><00:00:04.000><c> build</c>"]),
+        ("00:00:05.590", "00:00:05.600", ["i wanna build", " "]),
+    ])
+    entries = clean_vtt(path)
+
+    assert [e["text"] for e in entries] == ["welcome everybody today", "i wanna build"]
+    # Words carry the timing of the cue they are spoken in, not of the 10 ms repeat
+    assert entries[0]["start_time"] == "00:00:00.160"
+    assert entries[1]["start_time"] == "00:00:03.280"
+
+
+def test_partial_overlap_with_the_tail_is_stripped(tmp_path):
+    path = write_vtt(tmp_path, [
+        ("00:00:01.000", "00:00:02.000", ["we deploy the contract to base"]),
+        ("00:00:02.000", "00:00:03.000", ["the contract to base and then verify it"]),
+    ])
+    assert texts(path) == ["we deploy the contract to base", "and then verify it"]
+
+
+def test_short_partial_overlap_is_not_a_repeat(tmp_path):
+    path = write_vtt(tmp_path, [
+        ("00:00:01.000", "00:00:02.000", ["now we mint"]),
+        ("00:00:02.000", "00:00:03.000", ["mint the first token"]),
+    ])
+    assert texts(path) == ["now we mint", "mint the first token"]
+
+
+def test_word_timed_line_is_kept_when_the_speaker_repeats(tmp_path):
+    path = write_vtt(tmp_path, [
+        ("00:03:47.319", "00:03:50.869", ["1155<00:03:48.400><c> plus</c><00:03:48.720><c> lazy</c><00:03:49.120><c> mint</c>"]),
+        ("00:03:50.869", "00:03:50.879", ["1155 plus lazy mint", " "]),
+        ("00:03:50.879", "00:03:52.149", ["1155 plus lazy mint", "lazy<00:03:51.280><c> mint</c>"]),
+        ("00:03:52.149", "00:03:52.159", ["lazy mint", " "]),
+    ])
+    assert texts(path) == ["1155 plus lazy mint", "lazy mint"]
+
+
+def test_overlap_prefers_the_longest_match():
+    assert _overlap(["a", "b", "a", "b", "c"], ["a", "b", "c", "d"]) == 3
+    assert _overlap([], ["a"]) == 0
+    assert _overlap(["x", "y"], ["x", "y"]) == 2
+
+
+def test_clean_vtt_to_json_matches_json_dump(tmp_path):
+    path = write_vtt(tmp_path, [
+        ("00:00:01.000", "00:00:02.000", ["café \"quoted\""]),
+        ("00:00:02.000", "00:00:03.000", ["second line"]),
+    ])
+    out = tmp_path / "video.json"
+
+    assert clean_vtt_to_json(path, str(out)) == 2
+    assert out.read_text(encoding="utf-8") == json.dumps(clean_vtt(path), ensure_ascii=False, indent=2)
+
+
+def test_empty_vtt_writes_an_empty_array(tmp_path):
+    path = write_vtt(tmp_path, [])
+    out = tmp_path / "video.json"
+
+    assert clean_vtt_to_json(path, str(out)) == 0
+    assert json.loads(out.read_text(encoding="utf-8")) == []